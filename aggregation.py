@@ -0,0 +1,202 @@
+"""Out-of-core aggregation for datasets that do not fit in memory.
+
+The source is read in fixed-size chunks (Parquet row groups when an
+up-to-date Parquet copy exists, otherwise blocks of the CSV parsed by
+:func:`sales_schema.open_csv`).
+Each chunk is filtered and reduced to a :class:`PartialAggregate` of counts
+and sums, and the partials are merged, so peak memory is one chunk plus the
+per-group sums no matter how large the file is. Partials answer the same
+``count``/``sum``/``mean``/``rollup`` calls as a :class:`data_cube.CubeView`.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from sales_schema import open_csv, source_columns, to_layout
+from sales_storage import date_bounds, date_row_groups, is_stale, parquet_path_for
+
+DEFAULT_CHUNK_ROWS = int(os.environ.get('LULU_CHUNK_ROWS', 1_000_000))
+
+# Files larger than this are aggregated by streaming instead of being loaded
+STREAMING_THRESHOLD_BYTES = int(os.environ.get('LULU_STREAMING_THRESHOLD_BYTES', 2 << 30))
+
+
+def should_stream(path, threshold=STREAMING_THRESHOLD_BYTES):
+    return os.path.getsize(path) > threshold
+
+
+def _group_key(by):
+    return by if isinstance(by, str) else tuple(by)
+
+
+def _plain_index(index):
+    # Categorical group labels from different chunks have different categories;
+    # plain labels align cleanly when partials are added together
+    if isinstance(index, pd.MultiIndex):
+        return index.set_levels([level.astype(object) if isinstance(level, pd.CategoricalIndex) else level
+                                 for level in index.levels])
+    if isinstance(index, pd.CategoricalIndex):
+        return index.astype(object)
+    return index
+
+
+class PartialAggregate:
+    """Row count, measure sums and per-group counts/sums over some set of rows."""
+
+    def __init__(self, measures, group_by=()):
+        self.measures = list(measures)
+        self.group_by = [_group_key(by) for by in group_by]
+        self.rows = 0
+        self.sums = {m: 0.0 for m in self.measures}
+        self.groups = {}
+
+    @classmethod
+    def from_frame(cls, df, measures, group_by=()):
+        partial = cls(measures, group_by)
+        values = pd.DataFrame({m: df[m].astype('float64') for m in partial.measures}, index=df.index)
+        partial.rows = len(df)
+        partial.sums = {m: float(values[m].sum()) for m in partial.measures}
+        for key in partial.group_by:
+            keys = [df[c] for c in key] if isinstance(key, tuple) else df[key]
+            grouped = values.groupby(keys, observed=True)
+            frame = grouped.sum()
+            frame.insert(0, 'count', grouped.size())
+            frame.index = _plain_index(frame.index)
+            partial.groups[key] = frame
+        return partial
+
+    def merge(self, other):
+        merged = PartialAggregate(self.measures, self.group_by)
+        merged.rows = self.rows + other.rows
+        merged.sums = {m: self.sums[m] + other.sums[m] for m in self.measures}
+        for key in self.group_by:
+            a, b = self.groups.get(key), other.groups.get(key)
+            merged.groups[key] = b if a is None else a if b is None else a.add(b, fill_value=0)
+        return merged
+
+    def count(self):
+        return self.rows
+
+    def sum(self, measure):
+        return self.sums[measure]
+
+    def mean(self, measure):
+        return self.sums[measure] / self.rows if self.rows else 0.0
+
+    def rollup(self, by, measure=None, stat='sum'):
+        """Per-group ``'sum'``, ``'count'`` or ``'mean'`` for one of the ``group_by`` keys."""
+        frame = self.groups.get(_group_key(by))
+        if frame is None:
+            frame = pd.DataFrame(columns=['count'] + self.measures, dtype='float64')
+        frame = frame.sort_index()
+        if stat == 'count':
+            return frame['count'].astype('int64').rename('count')
+        if stat == 'sum':
+            return frame[measure].rename(measure)
+        if stat == 'mean':
+            return (frame[measure] / frame['count']).rename(measure)
+        raise ValueError(f"unknown stat {stat!r}")
+
+
+def iter_chunks(path, columns=None, chunk_rows=DEFAULT_CHUNK_ROWS, date_column=None, date_range=None, layout=None):
+    """Yield ``path`` as DataFrames of at most ``chunk_rows`` rows.
+
+    Reads the Parquet copy of a CSV when it exists and is up to date, skipping
+    the row groups whose dates all fall outside ``date_range`` (the chunks
+    still have to be filtered by it). The CSV itself is read whole. With
+    ``layout``, ``columns`` and ``date_column`` are named as in that layout
+    whichever layout the file has.
+    """
+    parquet_path = path if path.endswith('.parquet') else parquet_path_for(path)
+    if os.path.exists(parquet_path) and (parquet_path == path or not is_stale(path, parquet_path)):
+        header = pq.read_schema(parquet_path).names
+        source, names = source_columns(header, columns, layout)
+        row_groups = date_row_groups(parquet_path, date_range, file_column(header, date_column, layout))
+        if not row_groups:
+            return
+        parquet = pq.ParquetFile(parquet_path)
+        for batch in parquet.iter_batches(batch_size=chunk_rows, row_groups=row_groups, columns=names):
+            yield to_layout(batch, source, layout).to_pandas(date_as_object=False)
+        return
+
+    # CSV blocks come in whatever row counts fit the block size; cut them to chunk_rows
+    pending, rows = [], 0
+    for batch in open_csv(path, columns, layout):
+        pending.append(batch)
+        rows += batch.num_rows
+        while rows >= chunk_rows:
+            table = pa.Table.from_batches(pending)
+            yield table.slice(0, chunk_rows).to_pandas(date_as_object=False)
+            rest = table.slice(chunk_rows)
+            pending, rows = rest.to_batches(), rest.num_rows
+    if rows:
+        yield pa.Table.from_batches(pending).to_pandas(date_as_object=False)
+
+
+def file_column(header, column, layout=None):
+    """The file's name (its columns are ``header``) for ``column`` named as in ``layout``."""
+    return None if column is None else source_columns(header, [column], layout)[1][0]
+
+
+def filter_frame(df, selections=None, date_column=None, date_range=None):
+    """Rows of ``df`` matching ``{column: values}`` selections and an inclusive date range."""
+    if date_range is not None and df[date_column].is_monotonic_increasing:
+        # Rows in date order (as the Parquet copy stores them): the range is
+        # one slice, found by binary search, and only it is filtered further
+        start, stop = date_bounds(df[date_column].to_numpy(), date_range)
+        df, date_range = df.iloc[start:stop], None
+
+    mask = np.ones(len(df), dtype=bool)
+    for column, values in (selections or {}).items():
+        mask &= df[column].isin(list(values)).to_numpy()
+    if date_range is not None:
+        start, end = (pd.Timestamp(d) for d in date_range)
+        dates = df[date_column]
+        mask &= ((dates >= start) & (dates <= end)).to_numpy()
+    return df if mask.all() else df[mask]
+
+
+def required_columns(measures, group_by=(), selections=None, date_column=None):
+    columns = list(measures)
+    for by in group_by:
+        columns += [by] if isinstance(by, str) else list(by)
+    columns += list(selections or {})
+    if date_column:
+        columns.append(date_column)
+    return list(dict.fromkeys(columns))
+
+
+def stream_aggregate(path, measures, group_by=(), selections=None, date_column=None, date_range=None,
+                     chunk_rows=DEFAULT_CHUNK_ROWS, layout=None):
+    """Aggregate ``path`` chunk by chunk into a single :class:`PartialAggregate`."""
+    columns = required_columns(measures, group_by, selections, date_column)
+    result = PartialAggregate(measures, group_by)
+    for chunk in iter_chunks(path, columns, chunk_rows, date_column, date_range, layout):
+        chunk = filter_frame(chunk, selections, date_column, date_range)
+        result = result.merge(PartialAggregate.from_frame(chunk, measures, group_by))
+    return result
+
+
+def distinct_values(path, columns, chunk_rows=DEFAULT_CHUNK_ROWS, layout=None):
+    """Distinct values of each of ``columns`` in order of first appearance, in one pass."""
+    seen = {column: {} for column in columns}
+    for chunk in iter_chunks(path, list(columns), chunk_rows, layout=layout):
+        for column in columns:
+            for value in pd.unique(chunk[column].dropna()):
+                seen[column].setdefault(value, None)
+    return {column: list(values) for column, values in seen.items()}
+
+
+def head_rows(path, selections=None, limit=1000, columns=None, chunk_rows=DEFAULT_CHUNK_ROWS, layout=None):
+    """The first ``limit`` rows matching ``selections``, reading only as far as needed."""
+    parts, remaining = [], limit
+    for chunk in iter_chunks(path, columns, chunk_rows, layout=layout):
+        chunk = filter_frame(chunk, selections).head(remaining)
+        parts.append(chunk)
+        remaining -= len(chunk)
+        if remaining <= 0:
+            break
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=columns)
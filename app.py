@@ -1,44 +1,104 @@
+import os
 
 import streamlit as st
-import pandas as pd
 
-# Load dataset
-df = pd.read_csv("lulu_sales_data.csv")
+from dataset_cache import datasets
+from instrumentation import debug_panel, metrics, start_rerun
+from result_cache import results
+from sales_query import COLUMNS, DATA_PATH, TABLE_ROWS, cached_summary, chart_series, open_sales
+from table_view import PAGE_SIZES, iter_rows, page_positions, take_rows, write_export
+
+# Opt-in per-rerun timings (LULU_INSTRUMENT=1), shown in the sidebar and exported as metrics
+rerun = start_rerun("app")
+metrics.watch_cache("datasets", datasets)
+metrics.watch_cache("results", results)
+
+# Loaded once per process and shared by all sessions (streamed per rerun when
+# too large to load); the same queries back the HTTP API in query_api.py
+with rerun.stage("load") as stage:
+    sales = open_sales(DATA_PATH)
+    options = sales.options
+    stage["rows_out"] = None if sales.streaming else len(sales.df)
 
 st.set_page_config(layout="wide")
 st.title("📊 Lulu UAE Sales Dashboard")
 
 # Sidebar filters
 st.sidebar.header("Filter Data")
-store_filter = st.sidebar.multiselect("Select Store:", df["Store"].unique(), default=df["Store"].unique())
-category_filter = st.sidebar.multiselect("Select Category:", df["Category"].unique(), default=df["Category"].unique())
-age_filter = st.sidebar.multiselect("Select Age Group:", df["AgeGroup"].unique(), default=df["AgeGroup"].unique())
-gender_filter = st.sidebar.multiselect("Select Gender:", df["Gender"].unique(), default=df["Gender"].unique())
-loyalty_filter = st.sidebar.multiselect("Loyalty Member:", df["LoyaltyMember"].unique(), default=df["LoyaltyMember"].unique())
-
-# Apply filters
-filtered_df = df[
-    (df["Store"].isin(store_filter)) &
-    (df["Category"].isin(category_filter)) &
-    (df["AgeGroup"].isin(age_filter)) &
-    (df["Gender"].isin(gender_filter)) &
-    (df["LoyaltyMember"].isin(loyalty_filter))
-]
-
-st.metric("Total Sales", f"AED {filtered_df['SalesAmount'].sum():,.2f}")
-st.metric("Avg Sales per Transaction", f"AED {filtered_df['SalesAmount'].mean():,.2f}")
-st.metric("Ad Spend (Total)", f"AED {filtered_df['AdvertisementSpend'].sum():,.2f}")
-
-# Show dataset
+store_filter = st.sidebar.multiselect("Select Store:", options["Store"], default=options["Store"])
+category_filter = st.sidebar.multiselect("Select Category:", options["Category"], default=options["Category"])
+age_filter = st.sidebar.multiselect("Select Age Group:", options["AgeGroup"], default=options["AgeGroup"])
+gender_filter = st.sidebar.multiselect("Select Gender:", options["Gender"], default=options["Gender"])
+loyalty_filter = st.sidebar.multiselect("Loyalty Member:", options["LoyaltyMember"], default=options["LoyaltyMember"])
+
+# Apply filters: the metrics and chart series come from the cube (or the
+# streamed partial aggregate) and are memoized across sessions per canonical
+# selection and dataset version; the index gives the table rows
+selections = {
+    "Store": store_filter,
+    "Category": category_filter,
+    "AgeGroup": age_filter,
+    "Gender": gender_filter,
+    "LoyaltyMember": loyalty_filter,
+}
+with rerun.stage("filter", rows_in=None if sales.streaming else len(sales.df)) as stage:
+    summary = cached_summary(sales, selections)
+    table, rows = sales.matching_rows(selections)
+    stage["rows_out"] = summary["transactions"]
+
+with rerun.stage("metrics"):
+    st.metric("Total Sales", f"AED {summary['total_sales']:,.2f}")
+    st.metric("Avg Sales per Transaction", f"AED {summary['avg_sales']:,.2f}")
+    st.metric("Ad Spend (Total)", f"AED {summary['ad_spend']:,.2f}")
+
+# Show dataset: one page at a time, sorted and sliced on the server
 st.subheader("Filtered Sales Data")
-st.dataframe(filtered_df)
+if sales.shards is not None:
+    st.caption(f"First {TABLE_ROWS:,} matching rows, taken store by store from the selected stores' shards")
+elif sales.streaming:
+    st.caption(f"First {TABLE_ROWS:,} matching rows of a dataset too large to load")
+
+table_columns = st.multiselect("Columns:", COLUMNS, default=COLUMNS)
+sort_col, order_col, size_col, page_col = st.columns(4)
+sort_by = sort_col.selectbox("Sort by:", ["(none)"] + COLUMNS)
+ascending = order_col.radio("Order:", ["Ascending", "Descending"], horizontal=True) == "Ascending"
+page_size = size_col.selectbox("Rows per page:", PAGE_SIZES, index=1)
+page_count = max(1, -(-len(rows) // page_size))
+page = page_col.number_input(f"Page (of {page_count:,}):", min_value=1, max_value=page_count, value=1)
+
+with rerun.stage("table", rows_in=len(rows)) as stage:
+    shown = page_positions(table, rows, page - 1, page_size, None if sort_by == "(none)" else sort_by, ascending)
+    st.dataframe(rerun.widget("table", take_rows(table, shown, table_columns)), hide_index=True)
+    stage["rows_out"] = len(shown)
+first_row = (page - 1) * page_size
+st.caption(f"Rows {min(first_row + 1, len(rows)):,}–{first_row + len(shown):,} of {len(rows):,}")
+
+# Export every matching row, written to a file chunk by chunk
+export_col, button_col = st.columns([1, 3])
+export_format = export_col.radio("Export as:", ["csv", "parquet"], horizontal=True)
+if button_col.button("Prepare export"):
+    chunks = sales.iter_matching(selections, table_columns) if sales.streaming else iter_rows(table, rows, table_columns)
+    previous = st.session_state.pop("export_path", None)
+    if previous and os.path.exists(previous):
+        os.remove(previous)
+    st.session_state["export_path"] = write_export(chunks, export_format)
+if st.session_state.get("export_path"):
+    path = st.session_state["export_path"]
+    with open(path, "rb") as f:
+        st.download_button("Download filtered rows", f, file_name=f"lulu_sales_filtered{os.path.splitext(path)[1]}")
 
 # Charts
 st.subheader("Sales by Category")
-st.bar_chart(filtered_df.groupby("Category")["SalesAmount"].sum())
+with rerun.stage("chart_category"):
+    st.bar_chart(rerun.widget("chart_category", chart_series(summary, "Category")))
 
 st.subheader("Sales by Age Group")
-st.bar_chart(filtered_df.groupby("AgeGroup")["SalesAmount"].sum())
+with rerun.stage("chart_age_group"):
+    st.bar_chart(rerun.widget("chart_age_group", chart_series(summary, "AgeGroup")))
 
 st.subheader("Sales by Nationality")
-st.bar_chart(filtered_df.groupby("Nationality")["SalesAmount"].sum())
+with rerun.stage("chart_nationality"):
+    st.bar_chart(rerun.widget("chart_nationality", chart_series(summary, "Nationality")))
+
+rerun.finish()
+debug_panel(st.sidebar, rerun)
@@ -0,0 +1,368 @@
+"""Approximate answers with error bars from stratified samples and sketches.
+
+Exact group-bys over hundreds of millions of rows take seconds; exploring
+them does not need every last dirham. A :class:`SalesSketch` is built in one
+pass over the rows and keeps, per stratum (a Store/City and product
+category):
+
+* a uniform sample of at most ``SAMPLE_PER_STRATUM`` rows. Every row draws a
+  random key and the smallest keys are kept, so the samples of two sketches
+  merge into a uniform sample of both;
+* a :class:`HyperLogLog` of the customer ids, for distinct customers;
+* a :class:`TDigest` of the amounts, for quantiles and the mean.
+
+Totals, counts and means of any filter selection are estimated from the
+samples with the stratified estimator. Each comes as an :class:`Estimate`
+with the half-width of its 95% confidence interval; strata small enough to
+be sampled whole contribute no error. A selection that picks whole strata
+is answered from the merged sketches instead, exactly apart from the
+distinct-customer count. For other selections the quantiles come from the
+weighted sample, and the distinct customers are left to the exact answer.
+"""
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from aggregation import filter_frame
+from sales_storage import concat_frames
+
+SAMPLE_PER_STRATUM = int(os.environ.get('LULU_SAMPLE_PER_STRATUM', 2000))
+HLL_PRECISION = 12
+TDIGEST_COMPRESSION = 200
+
+# Two-sided 95% normal quantile
+Z = 1.96
+
+_refiner = None
+_refiner_lock = threading.Lock()
+
+
+class Estimate(namedtuple('Estimate', ['value', 'error'])):
+    """A value and the half-width of its 95% confidence interval (0 when exact)."""
+    __slots__ = ()
+
+
+def hash_values(values):
+    """64-bit hashes of ``values``; a categorical hashes the same as its plain values."""
+    return pd.util.hash_pandas_object(pd.Series(values), index=False).to_numpy()
+
+
+class HyperLogLog:
+    """Distinct count in ``2 ** precision`` one-byte registers, within about ``1.04 / sqrt(2 ** precision)``."""
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        bits = 64 - self.precision
+        buckets = (hashes >> np.uint64(bits)).astype(np.intp)
+        rest = hashes & np.uint64((1 << bits) - 1)
+        # Position of the leftmost 1 in the remaining bits (bits + 1 when they are all 0);
+        # they have at most 52 bits, so float64 holds them exactly
+        lengths = np.zeros(len(rest), dtype=np.int64)
+        nonzero = rest > 0
+        lengths[nonzero] = np.frexp(rest[nonzero].astype(np.float64))[1]
+        np.maximum.at(self.registers, buckets, (bits + 1 - lengths).astype(np.uint8))
+
+    def add(self, values):
+        self.add_hashes(hash_values(values))
+
+    def merge(self, other):
+        merged = HyperLogLog(self.precision)
+        merged.registers = np.maximum(self.registers, other.registers)
+        return merged
+
+    @property
+    def nbytes(self):
+        return self.registers.nbytes
+
+    @property
+    def relative_error(self):
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def estimate(self):
+        m = len(self.registers)
+        raw = 0.7213 / (1 + 1.079 / m) * m * m / np.ldexp(1.0, -self.registers.astype(np.int64)).sum()
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            return float(m * np.log(m / zeros))
+        return float(raw)
+
+
+class TDigest:
+    """Mergeable quantile sketch of weighted centroids, small at the tails and larger in the middle.
+
+    Uses the ``k1`` scale function: no centroid spans more than one unit of
+    ``compression / (2 pi) * asin(2q - 1)``, so there are at most about
+    ``compression / 2`` of them.
+    """
+
+    def __init__(self, compression=TDIGEST_COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min, self.max = np.inf, -np.inf
+
+    def update(self, values, weights=None):
+        values = np.asarray(values, dtype='float64')
+        weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype='float64')
+        keep = ~np.isnan(values)
+        values, weights = values[keep], weights[keep]
+        if len(values):
+            self.min, self.max = min(self.min, values.min()), max(self.max, values.max())
+            self._compress(np.r_[self.means, values], np.r_[self.weights, weights])
+
+    def merge(self, other):
+        merged = TDigest(self.compression)
+        merged.min, merged.max = min(self.min, other.min), max(self.max, other.max)
+        merged._compress(np.r_[self.means, other.means], np.r_[self.weights, other.weights])
+        return merged
+
+    def _compress(self, means, weights):
+        if not len(means):
+            self.means, self.weights = means, weights
+            return
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        q = (np.cumsum(weights) - weights / 2) / weights.sum()
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q - 1)
+        starts = np.flatnonzero(np.r_[True, np.diff(np.floor(k)) > 0])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    @property
+    def count(self):
+        return float(self.weights.sum())
+
+    @property
+    def nbytes(self):
+        return self.means.nbytes + self.weights.nbytes
+
+    def sum(self):
+        return float(np.dot(self.means, self.weights))
+
+    def mean(self):
+        return self.sum() / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        if not self.count:
+            return float('nan')
+        centers = np.cumsum(self.weights) - self.weights / 2
+        return float(np.interp(q * self.count, np.r_[0.0, centers, self.count],
+                               np.r_[self.min, self.means, self.max]))
+
+    def quantile_estimate(self, q, sample_rows):
+        """``quantile(q)`` with the interval of the ranks ``sample_rows`` draws would give."""
+        spread = Z * np.sqrt(q * (1 - q) / max(sample_rows, 1))
+        low, high = self.quantile(max(q - spread, 0.0)), self.quantile(min(q + spread, 1.0))
+        return Estimate(self.quantile(q), (high - low) / 2)
+
+
+def _stratified_totals(strata, sample_sizes, populations, y, groups=None, size=1):
+    """Stratified estimates and standard errors of the population totals of ``y`` (one per group)."""
+    flat = strata if groups is None else strata * size + groups
+    cells = len(sample_sizes) * size
+    s1 = np.bincount(flat, y, cells).reshape(-1, size)
+    s2 = np.bincount(flat, y * y, cells).reshape(-1, size)
+    n, N = sample_sizes[:, None].astype('float64'), populations[:, None].astype('float64')
+    variance = np.where(n > 1, (s2 - s1 * s1 / n) / np.maximum(n - 1, 1), 0.0)
+    totals = (N * s1 / n).sum(axis=0)
+    # With the finite population correction: a stratum sampled whole adds no error
+    errors = np.sqrt(np.maximum((N * N * (1 - n / N) * variance / n).sum(axis=0), 0.0))
+    return totals, errors
+
+
+class SalesSketch:
+    """Stratified samples plus per-stratum distinct-id and amount sketches of a set of rows.
+
+    ``columns`` are the further columns the samples keep for filtering and
+    breakdowns. Sketches of disjoint row sets combine with :meth:`merge`.
+    """
+
+    def __init__(self, df, strata, measure, id_column, columns=(), date_column=None,
+                 sample_size=SAMPLE_PER_STRATUM, seed=None):
+        self.strata = list(strata)
+        self.measure = measure
+        self.id_column = id_column
+        self.date_column = date_column
+        self.sample_size = sample_size
+        self.columns = list(dict.fromkeys(self.strata + list(columns) + [measure]
+                                          + ([date_column] if date_column else [])))
+        self.options = {column: set(pd.unique(df[column].dropna()))
+                        for column in self.columns if column not in (measure, date_column)}
+        dates = df[date_column].dropna() if date_column else pd.Series(dtype='datetime64[ns]')
+        self.dates = (dates.min(), dates.max()) if len(dates) else (pd.NaT, pd.NaT)
+
+        keys = np.random.default_rng(seed).random(len(df))
+        hashes = hash_values(df[id_column])
+        amounts = df[measure].to_numpy(dtype='float64')
+        self.populations, self.customers, self.amounts = {}, {}, {}
+        chosen = []
+        for label, positions in df.groupby(self.strata, observed=True, sort=False).indices.items():
+            label = label if isinstance(label, tuple) else (label,)
+            self.populations[label] = len(positions)
+            self.customers[label] = HyperLogLog()
+            self.customers[label].add_hashes(hashes[positions])
+            self.amounts[label] = TDigest()
+            self.amounts[label].update(amounts[positions])
+            if len(positions) > sample_size:
+                positions = positions[np.argpartition(keys[positions], sample_size)[:sample_size]]
+            chosen.append(positions)
+
+        chosen = np.sort(np.concatenate(chosen)) if chosen else np.empty(0, dtype=np.intp)
+        self.sample = df[self.columns].iloc[chosen].reset_index(drop=True)
+        self.sample['_key'] = keys[chosen]
+
+    @property
+    def nbytes(self):
+        """Bytes held by the sample and the per-stratum sketches."""
+        sketches = [*self.customers.values(), *self.amounts.values()]
+        return int(self.sample.memory_usage(index=True, deep=True).sum()) + sum(s.nbytes for s in sketches)
+
+    def merge(self, other):
+        """A new sketch of the rows of both sketches."""
+        merged = SalesSketch.__new__(SalesSketch)
+        merged.__dict__.update(self.__dict__)
+        merged.options = {column: values | other.options[column] for column, values in self.options.items()}
+        dates = [d for d in self.dates + other.dates if pd.notna(d)]
+        merged.dates = (min(dates), max(dates)) if dates else self.dates
+        merged.populations, merged.customers, merged.amounts = dict(self.populations), dict(self.customers), dict(self.amounts)
+        for label, rows in other.populations.items():
+            if label in merged.populations:
+                merged.populations[label] += rows
+                merged.customers[label] = merged.customers[label].merge(other.customers[label])
+                merged.amounts[label] = merged.amounts[label].merge(other.amounts[label])
+            else:
+                merged.populations[label] = rows
+                merged.customers[label], merged.amounts[label] = other.customers[label], other.amounts[label]
+
+        # The smallest keys of the union are a uniform sample of the union
+        sample = concat_frames([self.sample, other.sample]).sort_values('_key', kind='stable')
+        merged.sample = sample.groupby(self.strata, observed=True, sort=False).head(self.sample_size)
+        merged.sample = merged.sample.reset_index(drop=True)
+        return merged
+
+    def add(self, df):
+        """A new sketch that also covers the rows of ``df``."""
+        return self.merge(SalesSketch(df, self.strata, self.measure, self.id_column,
+                                      [c for c in self.columns if c not in self.strata],
+                                      self.date_column, self.sample_size))
+
+    def _whole_strata(self, selections, date_range):
+        # The strata a selection picks entirely, or None when it cuts through them
+        for column, values in selections.items():
+            if column not in self.strata and not set(values) >= self.options.get(column, set()):
+                return None
+        if date_range is not None and pd.notna(self.dates[0]):
+            start, end = (pd.Timestamp(d) for d in date_range)
+            if start > self.dates[0] or end < self.dates[1].normalize():
+                return None
+        return [label for label in self.populations
+                if all(column not in selections or value in set(selections[column])
+                       for column, value in zip(self.strata, label))]
+
+    def _matching(self, selections, date_range):
+        sample = filter_frame(self.sample.assign(_row=np.arange(len(self.sample))), selections,
+                              self.date_column, date_range)
+        mask = np.zeros(len(self.sample), dtype=bool)
+        mask[sample['_row'].to_numpy()] = True
+        return mask
+
+    def _strata_of_sample(self):
+        codes, labels = pd.factorize(pd.MultiIndex.from_frame(self.sample[self.strata]))
+        sample_sizes = np.bincount(codes, minlength=len(labels))
+        populations = np.array([self.populations[tuple(label)] for label in labels])
+        return codes, sample_sizes, populations
+
+    def summary(self, selections=None, date_range=None):
+        """Estimates of the transactions, total, average, distinct customers and median amount.
+
+        Distinct customers are ``None`` when the selection cuts through the strata.
+        """
+        selections = selections or {}
+        whole = self._whole_strata(selections, date_range)
+        if whole is not None:
+            digest, customers = TDigest(), HyperLogLog()
+            for label in whole:
+                digest, customers = digest.merge(self.amounts[label]), customers.merge(self.customers[label])
+            distinct = customers.estimate()
+            return {
+                'transactions': Estimate(int(digest.count), 0.0),
+                'total': Estimate(digest.sum(), 0.0),
+                'average': Estimate(digest.mean(), 0.0),
+                'customers': Estimate(distinct, float(Z * customers.relative_error * distinct)),
+                'median': digest.quantile_estimate(0.5, digest.count),
+            }
+
+        codes, sample_sizes, populations = self._strata_of_sample()
+        matching = self._matching(selections, date_range)
+        amounts = self.sample[self.measure].to_numpy(dtype='float64')
+        (count,), (count_error,) = _stratified_totals(codes, sample_sizes, populations, matching.astype('float64'))
+        (total,), (total_error,) = _stratified_totals(codes, sample_sizes, populations, np.where(matching, amounts, 0.0))
+        average = total / count if count else 0.0
+        # Ratio estimator, linearized: the error of the total of the residuals from the average
+        residuals = np.where(matching, amounts - average, 0.0)
+        (_,), (residual_error,) = _stratified_totals(codes, sample_sizes, populations, residuals)
+
+        digest = TDigest()
+        digest.update(amounts[matching], (populations / sample_sizes)[codes][matching])
+        return {
+            'transactions': Estimate(float(count), float(Z * count_error)),
+            'total': Estimate(float(total), float(Z * total_error)),
+            'average': Estimate(float(average), float(Z * residual_error / count) if count else 0.0),
+            'customers': None,
+            'median': digest.quantile_estimate(0.5, int(matching.sum())),
+        }
+
+    def rollup(self, by, selections=None, date_range=None):
+        """Estimated total amount per value of ``by``, as a frame of ``value`` and ``error`` columns."""
+        codes, sample_sizes, populations = self._strata_of_sample()
+        matching = self._matching(selections or {}, date_range)
+        groups, labels = pd.factorize(self.sample[by])
+        amounts = np.where(matching & (groups >= 0), self.sample[self.measure].to_numpy(dtype='float64'), 0.0)
+        totals, errors = _stratified_totals(codes, sample_sizes, populations, amounts,
+                                            np.maximum(groups, 0), len(labels))
+        frame = pd.DataFrame({'value': totals, 'error': Z * errors}, index=pd.Index(labels, name=by))
+        return frame[frame['value'] > 0]
+
+    def exact(self, df, selections=None, date_range=None):
+        """The :meth:`summary` numbers computed exactly from the rows ``df``."""
+        rows = filter_frame(df[list(dict.fromkeys(self.columns + [self.id_column]))], selections,
+                            self.date_column, date_range)
+        amounts = rows[self.measure].to_numpy(dtype='float64')
+        return {
+            'transactions': Estimate(len(rows), 0.0),
+            'total': Estimate(float(amounts.sum()), 0.0),
+            'average': Estimate(float(amounts.mean()) if len(amounts) else 0.0, 0.0),
+            'customers': Estimate(int(rows[self.id_column].nunique()), 0.0),
+            'median': Estimate(float(np.median(amounts)) if len(amounts) else float('nan'), 0.0),
+        }
+
+
+def refine_in_background(cache, namespace, version, key, compute):
+    """A future of ``compute()`` run on a background thread, shared by every caller of the same key.
+
+    A future that fails is dropped from ``cache``, so the next call tries again.
+    """
+    global _refiner
+    with _refiner_lock:
+        if _refiner is None:
+            _refiner = ThreadPoolExecutor(max_workers=2, thread_name_prefix='lulu-refine')
+    future = cache.get_or_compute(namespace, version, key, lambda: _refiner.submit(compute))
+    if _failed(future):
+        # Failed before its callback below dropped it
+        cache.discard(namespace, key, future)
+        future = cache.get_or_compute(namespace, version, key, lambda: _refiner.submit(compute))
+    # Added once the future is cached, so even one that already failed is dropped
+    future.add_done_callback(lambda done: _failed(done) and cache.discard(namespace, key, done))
+    return future
+
+
+def _failed(future):
+    return future.done() and (future.cancelled() or future.exception() is not None)
@@ -0,0 +1,293 @@
+"""Streaming, multi-core archive writers for the dashboard package.
+
+Members are written through file-like handles, so generated data can go
+straight into the archive without first being written to the project folder.
+Compression is split into fixed-size blocks that are compressed on a thread
+pool (zlib and zstd release the GIL) and written back in order:
+
+* ``zip``: each block becomes a run of raw deflate data ending in a sync
+  flush, and a final empty block closes the stream, as pigz does. The ZIP
+  records around it are written here too, so the result is an ordinary
+  deflated ZIP64 member that any unzip tool reads.
+* ``tar.zst``: each block becomes an independent zstd frame. Concatenated
+  frames form a valid ``.zst`` stream (``zstd -d``, ``tar --zstd -x``).
+
+Members that are already compressed (Parquet) are stored as they are. Every
+member's size, compressed size and throughput is kept in ``members``.
+"""
+import os
+import struct
+import tarfile
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pyarrow as pa
+
+ARCHIVE_FORMATS = ('zip', 'tar.zst')
+COMPRESS_THREADS = int(os.environ.get('LULU_COMPRESS_THREADS') or os.cpu_count() or 1)
+BLOCK_BYTES = 8 << 20
+# "Version needed to extract" for ZIP64 records
+ZIP64_VERSION = 45
+
+# Already compressed; recompressing them only burns CPU
+STORED_SUFFIXES = ('.parquet', '.zip', '.zst')
+
+
+def _deflate_block(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def _zstd_block(data, level):
+    return pa.Codec('zstd', level).compress(data, asbytes=True)
+
+
+class BlockCompressor:
+    """Compresses a byte stream in ``block_bytes`` blocks on ``pool``, keeping the output in order.
+
+    ``compress``/``flush`` follow ``zlib.compressobj``: each returns whatever
+    compressed output is ready. At most ``2 * threads`` blocks are in flight,
+    which bounds memory. After ``flush`` the compressor can be reused.
+    """
+
+    def __init__(self, compress_block, pool, threads, tail=b'', block_bytes=BLOCK_BYTES):
+        self.compress_block = compress_block
+        self.pool = pool
+        self.max_pending = 2 * threads
+        self.tail = tail
+        self.block_bytes = block_bytes
+        self._buffer = bytearray()
+        self._pending = deque()
+
+    def compress(self, data):
+        self._buffer += data
+        while len(self._buffer) >= self.block_bytes:
+            self._submit(bytes(self._buffer[:self.block_bytes]))
+            del self._buffer[:self.block_bytes]
+        return self._collect(wait=False)
+
+    def flush(self):
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        return self._collect(wait=True) + self.tail
+
+    def _submit(self, block):
+        self._pending.append(self.pool.submit(self.compress_block, block))
+
+    def _collect(self, wait):
+        out = []
+        while self._pending and (wait or len(self._pending) >= self.max_pending or self._pending[0].done()):
+            out.append(self._pending.popleft().result())
+        return b''.join(out)
+
+
+class _Sink:
+    """Write-only file object over a member handle that also answers ``tell`` (Parquet needs it)."""
+
+    def __init__(self, write):
+        self._write = write
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._write(data)
+        n = memoryview(data).nbytes
+        self.position += n
+        return n
+
+    def tell(self):
+        return self.position
+
+    def writable(self):
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        # The member itself is closed by the archive
+        self.closed = True
+
+
+class _Archive:
+    def __init__(self, path, threads=COMPRESS_THREADS):
+        self.path = path
+        self.threads = max(1, threads)
+        self.members = []
+        self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='compress')
+
+    def add_file(self, path, arcname):
+        """Copy the file at ``path`` into the archive as ``arcname``."""
+        with open(path, 'rb') as src, self.open(arcname, compress=not path.endswith(STORED_SUFFIXES)) as dst:
+            while True:
+                block = src.read(BLOCK_BYTES)
+                if not block:
+                    break
+                dst.write(block)
+        return self.members[-1]
+
+    def _record(self, arcname, size, compressed, start):
+        seconds = max(time.perf_counter() - start, 1e-9)
+        member = {'name': arcname, 'bytes': size, 'compressed_bytes': compressed,
+                  'seconds': seconds, 'bytes_per_second': size / seconds}
+        self.members.append(member)
+        return member
+
+    def close(self):
+        self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _dos_date_time(timestamp):
+    year, month, day, hour, minute, second = time.localtime(timestamp)[:6]
+    return hour << 11 | minute << 5 | second // 2, max(year - 1980, 0) << 9 | month << 5 | day
+
+
+class ZipArchive(_Archive):
+    """A ZIP64 archive written record by record.
+
+    Each member is a local header with zero sizes, the (deflated) data and a
+    ZIP64 data descriptor carrying the CRC and sizes, so nothing is seeked
+    back over. The central directory and the ZIP64 end records are written
+    on ``close``.
+    """
+
+    def __init__(self, path, threads=COMPRESS_THREADS, level=6):
+        super().__init__(path, threads)
+        self._file = open(path, 'wb')
+        self._deflate = BlockCompressor(lambda block: _deflate_block(block, level), self._pool, self.threads,
+                                        tail=zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS).flush())
+        self._entries = []
+
+    @contextmanager
+    def open(self, arcname, compress=True):
+        """Writable file object for a new member ``arcname``."""
+        start = time.perf_counter()
+        name = arcname.encode('utf-8')
+        # Sizes and CRC follow the data; bit 11 marks a UTF-8 name
+        flags = 0x08 | (0 if arcname.isascii() else 0x800)
+        method = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        dos_time, dos_date = _dos_date_time(time.time())
+        header_at = self._file.tell()
+        self._file.write(struct.pack('<IHHHHHIIIHH', 0x04034B50, ZIP64_VERSION, flags, method, dos_time, dos_date,
+                                     0, 0xFFFFFFFF, 0xFFFFFFFF, len(name), 20)
+                         + name + struct.pack('<HHQQ', 1, 16, 0, 0))
+
+        data_at = self._file.tell()
+        crc = size = 0
+
+        def write(data):
+            nonlocal crc, size
+            crc = zlib.crc32(data, crc)
+            size += memoryview(data).nbytes
+            self._file.write(self._deflate.compress(data) if compress else data)
+
+        yield _Sink(write)
+        if compress:
+            self._file.write(self._deflate.flush())
+        compressed = self._file.tell() - data_at
+        self._file.write(struct.pack('<IIQQ', 0x08074B50, crc, compressed, size))
+        self._entries.append((name, flags, method, dos_time, dos_date, crc, compressed, size, header_at))
+        self._record(arcname, size, compressed, start)
+
+    def close(self):
+        directory_at = self._file.tell()
+        for name, flags, method, dos_time, dos_date, crc, compressed, size, header_at in self._entries:
+            # Made by Unix (3), so the external attributes hold a file mode
+            self._file.write(struct.pack('<IHHHHHHIIIHHHHHII', 0x02014B50, 3 << 8 | ZIP64_VERSION, ZIP64_VERSION,
+                                         flags, method, dos_time, dos_date, crc, 0xFFFFFFFF, 0xFFFFFFFF,
+                                         len(name), 28, 0, 0, 0, 0o100644 << 16, 0xFFFFFFFF)
+                             + name + struct.pack('<HHQQQ', 1, 24, size, compressed, header_at))
+        end_at = self._file.tell()
+        count = len(self._entries)
+        self._file.write(struct.pack('<IQHHIIQQQQ', 0x06064B50, 44, ZIP64_VERSION, ZIP64_VERSION, 0, 0,
+                                     count, count, end_at - directory_at, directory_at))
+        self._file.write(struct.pack('<IIQI', 0x07064B50, 0, end_at, 1))
+        self._file.write(struct.pack('<IHHHHIIH', 0x06054B50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                                     min(end_at - directory_at, 0xFFFFFFFF), min(directory_at, 0xFFFFFFFF), 0))
+        self._file.close()
+        super().close()
+
+
+def _raw_zstd_frame(data):
+    """``data`` as a zstd frame holding one uncompressed block (its size is fixed by ``len(data)``)."""
+    # Single-segment frame with a 2-byte content size (stored minus 256), no checksum
+    header = struct.pack('<IBH', 0xFD2FB528, 0x60, len(data) - 256)
+    block = (1 | len(data) << 3).to_bytes(3, 'little')
+    return header + block + data
+
+
+class TarZstArchive(_Archive):
+    def __init__(self, path, threads=COMPRESS_THREADS, level=3):
+        super().__init__(path, threads)
+        self._file = open(path, 'wb')
+        self._zstd = BlockCompressor(lambda block: _zstd_block(block, level), self._pool, self.threads)
+        self._offset = 0
+
+    def _write(self, data):
+        self._file.write(self._zstd.compress(data))
+        self._offset += memoryview(data).nbytes
+
+    def _flush(self):
+        self._file.write(self._zstd.flush())
+
+    @staticmethod
+    def _header(arcname, size):
+        info = tarfile.TarInfo(arcname)
+        info.size, info.mtime, info.mode = size, int(time.time()), 0o644
+        # GNU headers stay one 512-byte block even for members over 8 GiB
+        return info.tobuf(format=tarfile.GNU_FORMAT)
+
+    @contextmanager
+    def open(self, arcname, compress=True):
+        """Writable file object for a new member ``arcname``.
+
+        The whole tar stream is compressed, so ``compress`` has no effect. Tar
+        needs the size before the data, so the header goes into a fixed-size
+        uncompressed frame that is rewritten once the member is complete.
+        """
+        start = time.perf_counter()
+        self._flush()
+        header_at = self._file.tell()
+        header = self._header(arcname, 0)
+        self._file.write(_raw_zstd_frame(header))
+        self._offset += len(header)
+
+        begin = self._offset
+        yield _Sink(self._write)
+        size = self._offset - begin
+        self._write(b'\0' * (-size % tarfile.BLOCKSIZE))
+        self._flush()
+
+        end = self._file.tell()
+        self._file.seek(header_at)
+        self._file.write(_raw_zstd_frame(self._header(arcname, size)))
+        self._file.seek(end)
+        self._record(arcname, size, end - header_at, start)
+
+    def close(self):
+        # End-of-archive marker, padded to a whole record like tarfile does
+        self._write(b'\0' * (2 * tarfile.BLOCKSIZE))
+        self._write(b'\0' * (-self._offset % tarfile.RECORDSIZE))
+        self._flush()
+        self._file.close()
+        super().close()
+
+
+def open_archive(path, fmt='zip', threads=COMPRESS_THREADS):
+    """A :class:`ZipArchive` or :class:`TarZstArchive` writing to ``path``."""
+    if fmt == 'zip':
+        return ZipArchive(path, threads)
+    if fmt == 'tar.zst':
+        return TarZstArchive(path, threads)
+    raise ValueError(f"unknown archive format {fmt!r}")
@@ -0,0 +1,248 @@
+"""Benchmarks for the dashboard's load, filter, aggregate and metric paths.
+
+Datasets of each size are made with the generator in complete_zip_creator.py,
+reshaped to the app.py layout, and cached in ``--data-dir``. Every size is
+timed in a fresh process so its peak RSS is its own. Each stage runs
+``--repeat`` times and the fastest run is kept.
+
+Stages:
+
+* ``read_csv``: ``pd.read_csv`` of the whole file.
+* ``convert_parquet`` / ``load_parquet``: the app's load path.
+* ``compact_from_csv``: building a :class:`compact_table.CompactTable` straight
+  from the CSV (``LULU_TABLE_FORMAT=compact``); its size is reported next to
+  the loaded frame's as ``compact_bytes`` / ``frame_bytes``.
+* ``isin_filter``: the five-way ``isin`` mask over the filter columns.
+* ``groupby_<column>``: one chart's groupby-sum on the filtered rows.
+* ``metric_tiles``: the three metric tiles on the filtered rows.
+* ``index_build`` / ``index_filter``: the filter index app.py uses now.
+* ``cube_build`` / ``cube_filter``: the cube app.py uses now.
+* ``cube_charts_and_metrics``: the charts and tiles answered from a cube view.
+
+Results are written as JSON. ``--baseline`` compares them to an earlier run
+and exits with status 1 when any stage is slower than ``--tolerance`` or
+peak RSS grew by more than that.
+
+    python benchmark.py --sizes 1e3 1e4 1e5 1e6 --output results.json
+    python benchmark.py --baseline results.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from compact_table import CompactTable
+from complete_zip_creator import generate_sales_chunks
+from data_cube import SalesCube
+from filter_index import FilterIndex
+from sales_query import CHART_COLUMNS, CUBE_DIMENSIONS, FILTER_COLUMNS, MEASURES
+from sales_storage import convert_csv, load_sales_data, parquet_path_for
+
+DEFAULT_SIZES = ('1e3', '1e4', '1e5', '1e6')
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.2
+# Stages faster than this in both runs are too noisy to compare
+MIN_COMPARE_SECONDS = 0.005
+
+# Fixed so that the same size always produces the same file
+SEED = 42
+END_DATE = date(2025, 6, 30)
+
+# app.py's column names for the generator's columns
+APP_COLUMNS = {
+    'Transaction_ID': 'TransactionID', 'City': 'Store', 'Product_Category': 'Category',
+    'Final_Amount': 'SalesAmount', 'Age_Group': 'AgeGroup', 'Gender': 'Gender',
+    'Nationality': 'Nationality', 'Income_Bracket': 'IncomeLevel', 'Is_Loyalty_Member': 'LoyaltyMember',
+    'Monthly_Ad_Budget': 'AdvertisementSpend', 'Transaction_Date': 'Date',
+}
+
+
+def dataset_path(data_dir, rows):
+    return os.path.join(data_dir, f'sales_{rows}.csv')
+
+
+def make_dataset(path, rows, chunk_size=1_000_000):
+    """Write ``rows`` generated transactions to ``path`` in the app.py layout."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        for i, chunk in enumerate(generate_sales_chunks(rows, chunk_size, SEED, END_DATE)):
+            chunk = chunk[list(APP_COLUMNS)].rename(columns=APP_COLUMNS)
+            chunk['LoyaltyMember'] = np.where(chunk['LoyaltyMember'], 'Yes', 'No')
+            f.write(chunk.to_csv(header=(i == 0), index=False, date_format='%Y-%m-%d').encode('utf-8'))
+    os.replace(tmp_path, path)
+
+
+def selections_for(df):
+    """A five-way selection that keeps all but one value of each filter column."""
+    selections = {}
+    for column in FILTER_COLUMNS:
+        values = sorted(df[column].dropna().unique().tolist(), key=str)
+        selections[column] = values[:-1] if len(values) > 2 else values
+    return selections
+
+
+def timed(stages, name, repeat, fn):
+    """Run ``fn`` ``repeat`` times, record the fastest and median run in ``stages``, return its result."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        runs.append(time.perf_counter() - start)
+    stages[name] = {'seconds': min(runs), 'median_seconds': float(np.median(runs))}
+    return result
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_size(path, repeat):
+    """Time every stage on the dataset at ``path``; returns the result for one size."""
+    stages = {}
+    raw = timed(stages, 'read_csv', repeat, lambda: pd.read_csv(path, parse_dates=['Date']))
+    del raw
+
+    parquet_path = parquet_path_for(path)
+    timed(stages, 'convert_parquet', 1, lambda: convert_csv(path, parquet_path))
+    df = timed(stages, 'load_parquet', repeat, lambda: load_sales_data(path))
+    compact = timed(stages, 'compact_from_csv', repeat, lambda: CompactTable.from_csv(path))
+    table_bytes = {'frame_bytes': int(df.memory_usage(index=True, deep=True).sum()), 'compact_bytes': compact.nbytes}
+    del compact
+
+    selections = selections_for(df)
+
+    def isin_filter():
+        mask = np.ones(len(df), dtype=bool)
+        for column, values in selections.items():
+            mask &= df[column].isin(values).to_numpy()
+        return df[mask]
+
+    filtered = timed(stages, 'isin_filter', repeat, isin_filter)
+    for column in CHART_COLUMNS:
+        timed(stages, f'groupby_{column}', repeat,
+              lambda column=column: filtered.groupby(column, observed=True)['SalesAmount'].sum())
+    timed(stages, 'metric_tiles', repeat, lambda: (filtered['SalesAmount'].sum(), filtered['SalesAmount'].mean(),
+                                                    filtered['AdvertisementSpend'].sum()))
+
+    index = timed(stages, 'index_build', repeat, lambda: FilterIndex(df, FILTER_COLUMNS))
+    timed(stages, 'index_filter', repeat, lambda: index.positions(selections))
+
+    cube = timed(stages, 'cube_build', repeat, lambda: SalesCube(df, CUBE_DIMENSIONS, MEASURES, date_dimension='Date'))
+    view = timed(stages, 'cube_filter', repeat, lambda: cube.filter(selections))
+    timed(stages, 'cube_charts_and_metrics', repeat,
+          lambda: ([view.rollup(column, 'SalesAmount') for column in CHART_COLUMNS],
+                   view.sum('SalesAmount'), view.mean('SalesAmount'), view.sum('AdvertisementSpend')))
+
+    return {'rows': len(df), 'filtered_rows': len(filtered), 'file_bytes': os.path.getsize(path),
+            **table_bytes, 'peak_rss_bytes': peak_rss_bytes(), 'stages': stages}
+
+
+def benchmark(sizes, data_dir, repeat):
+    """Run every size in its own process and return the combined results."""
+    os.makedirs(data_dir, exist_ok=True)
+    results = {}
+    for rows in sizes:
+        path = dataset_path(data_dir, rows)
+        if not os.path.exists(path):
+            print(f"Generating {rows:,} rows -> {path}")
+            make_dataset(path, rows)
+        print(f"Benchmarking {rows:,} rows...")
+        worker = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-one', path,
+                                 '--repeat', str(repeat)], check=True, stdout=subprocess.PIPE, text=True)
+        results[str(rows)] = json.loads(worker.stdout)
+        for name, stage in results[str(rows)]['stages'].items():
+            print(f"   {name:<28} {stage['seconds'] * 1000:>12,.2f} ms")
+        for name in ('frame_bytes', 'compact_bytes', 'peak_rss_bytes'):
+            print(f"   {name:<28} {results[str(rows)][name] / 2 ** 20:>12,.1f} MiB")
+    return {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+            'platform': platform.platform(), 'cpus': os.cpu_count(), 'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE, min_seconds=MIN_COMPARE_SECONDS):
+    """Regressions of ``current`` against ``baseline`` as ``(size, metric, old, new)`` tuples."""
+    regressions = []
+    for size, result in current['results'].items():
+        old = baseline['results'].get(size)
+        if old is None:
+            continue
+        for name, stage in result['stages'].items():
+            before = old['stages'].get(name)
+            if before is None or max(before['seconds'], stage['seconds']) < min_seconds:
+                continue
+            if stage['seconds'] > before['seconds'] * (1 + tolerance):
+                regressions.append((size, name, before['seconds'], stage['seconds']))
+        if result['peak_rss_bytes'] > old['peak_rss_bytes'] * (1 + tolerance):
+            regressions.append((size, 'peak_rss_bytes', old['peak_rss_bytes'], result['peak_rss_bytes']))
+    return regressions
+
+
+def parse_size(text):
+    rows = int(float(text))
+    if rows < 1:
+        raise argparse.ArgumentTypeError(f"size must be positive: {text}")
+    return rows
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Lulu sales dashboard's hot paths.")
+    parser.add_argument('--sizes', nargs='+', type=parse_size, default=[parse_size(s) for s in DEFAULT_SIZES],
+                        help="dataset sizes in rows, e.g. 1e3 1e6 1e8 (default: %s)" % ' '.join(DEFAULT_SIZES))
+    parser.add_argument('--data-dir', default='benchmark_data',
+                        help="where generated datasets are cached (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help="runs per stage; the fastest is kept (default: %(default)s)")
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help="JSON file the results are written to (default: %(default)s)")
+    parser.add_argument('--baseline', help="earlier results to compare against; regressions exit with status 1")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slowdown / RSS growth as a fraction (default: %(default)s)")
+    parser.add_argument('--run-one', metavar='PATH', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.run_one:
+        json.dump(run_size(args.run_one, args.repeat), sys.stdout)
+        return 0
+
+    # Read before the run, so the output may overwrite the baseline file
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    current = benchmark(args.sizes, args.data_dir, args.repeat)
+    with open(args.output, 'w') as f:
+        json.dump(current, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if baseline is None:
+        return 0
+    regressions = compare(current, baseline, args.tolerance)
+    for size, name, before, after in regressions:
+        print(f"REGRESSION {int(size):,} rows {name}: {before:,.4g} -> {after:,.4g} ({after / before - 1:+.0%})")
+    if regressions:
+        return 1
+    print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""Server-side chart payloads with a bounded number of points.
+
+Plotly serializes every point it is given into the page, so long series are
+reduced before they reach a figure: a daily series is resampled to weeks or
+months once it spans too many days, and whatever is still above the point
+budget is downsampled with Largest-Triangle-Three-Buckets (LTTB), which keeps
+the peaks and troughs that define the shape of the line.
+"""
+import os
+
+import numpy as np
+
+MAX_POINTS = int(os.environ.get('LULU_CHART_MAX_POINTS', 500))
+
+# Resampling only kicks in when a series has more than this many times the
+# point budget; below that LTTB alone keeps the daily detail
+RESAMPLE_FACTOR = 4
+
+FREQUENCIES = {'Day': 'D', 'Week': 'W', 'Month': 'MS'}
+
+
+def lttb(x, y, threshold):
+    """Indices of ``threshold`` points of (``x``, ``y``) chosen by LTTB, always keeping both ends.
+
+    A ``threshold`` below 3 leaves just the ends.
+    """
+    n = len(y)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        return np.array([0, n - 1]) if n > 1 else np.arange(n)
+
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    # threshold - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x, next_y = x[end:edges[i + 2]].mean(), y[end:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+        area = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def time_series(series, granularity='Auto', max_points=MAX_POINTS):
+    """Reduce a per-day ``series`` (DatetimeIndex) to at most ``max_points`` points.
+
+    ``granularity`` is ``'Day'``, ``'Week'``, ``'Month'`` or ``'Auto'``, which
+    picks the finest of those leaving at most ``RESAMPLE_FACTOR * max_points``
+    points. Returns the reduced series and the granularity used.
+    """
+    if series.empty:
+        return series, 'Day' if granularity == 'Auto' else granularity
+
+    if granularity == 'Auto':
+        days = (series.index.max() - series.index.min()).days + 1
+        granularity = 'Month'
+        for name, days_per_point in (('Day', 1), ('Week', 7)):
+            if days / days_per_point <= RESAMPLE_FACTOR * max_points:
+                granularity = name
+                break
+
+    if granularity != 'Day':
+        series = series.resample(FREQUENCIES[granularity]).sum()
+    keep = lttb(series.index.asi8, series.to_numpy(), max_points)
+    return series.iloc[keep], granularity
@@ -0,0 +1,514 @@
+"""Compact in-memory form of the sales table.
+
+Loaded into pandas, the dataset keeps IDs such as "T001"/"TXN00001" as
+Python strings, dimensions as int32-coded categoricals (or strings),
+Yes/No flags as strings, dates as 8-byte datetimes and amounts as floats.
+:class:`CompactTable` holds the same rows in a fraction of that:
+
+* dimensions as dictionary codes of the narrowest unsigned type (uint8 for
+  up to 255 values), the code after the last value marking a missing one;
+* two-valued columns (Yes/No loyalty, Gender, booleans) as packed bits;
+* dates as int32 day offsets from 1970-01-01;
+* amounts as int32 fixed-point cents when every value has at most two
+  decimals and fits, otherwise float32; other integers in their narrowest type;
+* IDs made of a constant prefix and a number as just the number, plus the
+  prefix and zero padding that print it again.
+
+:meth:`CompactTable.from_csv` builds the table from the CSV in streamed
+pyarrow batches, so the full string frame never exists; :func:`load_compact`
+prefers an up-to-date Parquet copy. Rows go back to ordinary frames (with
+categoricals and datetimes) only for what is shown: :meth:`~CompactTable.take`
+for a page or an export chunk, ``table[column]`` for one column.
+``table[columns]`` and :meth:`~CompactTable.row_range` give smaller tables
+over the same arrays, for building a cube per row range on several cores.
+"""
+import copy
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from sales_schema import open_csv, source_columns, to_layout
+from sales_storage import is_stale, parquet_path_for
+
+# Columns holding "<prefix><number>" identifiers in either dataset layout
+ID_COLUMNS = ('TransactionID', 'Transaction_ID')
+
+CSV_BLOCK_BYTES = 16 << 20
+
+_INT32 = np.iinfo(np.int32)
+_MISSING_DAY = _INT32.min
+
+
+def _narrowest(low, high):
+    for dtype in (np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return np.int64
+
+
+def _freeze(array):
+    array.flags.writeable = False
+    return array
+
+
+def _with(column, **attributes):
+    # A shallow copy of a finished column with some of its arrays replaced
+    clone = copy.copy(column)
+    clone.__dict__.update(attributes)
+    return clone
+
+
+class _Codes:
+    """Dictionary-encoded strings: the distinct values plus one narrow code per row."""
+
+    def __init__(self):
+        self.values = []
+        self._lookup = {}
+        self._chunks = []
+
+    def extend(self, array):
+        if not pa.types.is_dictionary(array.type):
+            array = pc.dictionary_encode(array)
+        remap = np.array([self._lookup.setdefault(v, len(self._lookup)) for v in array.dictionary.to_pylist()]
+                         + [-1], dtype=np.int32)
+        indices = array.indices.fill_null(len(array.dictionary)).to_numpy(zero_copy_only=False)
+        self._chunks.append(remap[indices])
+
+    def finish(self):
+        self.values = list(self._lookup)
+        missing = len(self.values)
+        self.codes = np.empty(sum(len(chunk) for chunk in self._chunks), dtype=_narrowest(0, missing))
+        start = 0
+        for chunk in self._chunks:
+            self.codes[start:start + len(chunk)] = np.where(chunk < 0, missing, chunk)
+            start += len(chunk)
+        del self._chunks, self._lookup
+        if len(self.values) <= 2 and not (self.codes == missing).any():
+            return _Bits(self.codes == 1, self.values)
+        _freeze(self.codes)
+        return self
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+    def row_range(self, start, stop):
+        return _with(self, codes=self.codes[start:stop])
+
+    def to_arrow(self, positions):
+        codes = self.codes[positions]
+        missing = codes == len(self.values)
+        indices = pa.array(codes.astype(np.int32), mask=missing if missing.any() else None)
+        return pa.DictionaryArray.from_arrays(indices, pa.array(self.values, pa.string()))
+
+    def sort_key(self, positions):
+        # Rank the (few) values once instead of comparing labels per row
+        ranks = np.append(np.argsort(np.argsort(np.asarray(self.values, dtype=object))), -1).astype('float64')
+        ranks[-1] = np.nan
+        return ranks[self.codes[positions]]
+
+
+class _Bits:
+    """Two-valued column as one bit per row; ``labels`` are the values of bits 0 and 1 (``None`` for booleans)."""
+
+    def __init__(self, bits=None, labels=None):
+        self.labels = labels
+        self._chunks = []
+        if bits is not None:
+            self.size = len(bits)
+            self.packed = _freeze(np.packbits(bits))
+
+    def extend(self, array):
+        if array.null_count:
+            raise ValueError("boolean columns with missing values are not supported")
+        self._chunks.append(array.to_numpy(zero_copy_only=False))
+
+    def finish(self):
+        bits = np.concatenate(self._chunks) if self._chunks else np.zeros(0, dtype=bool)
+        del self._chunks
+        self.size = len(bits)
+        self.packed = _freeze(np.packbits(bits))
+        return self
+
+    @property
+    def nbytes(self):
+        return self.packed.nbytes
+
+    def bits(self, positions):
+        return np.unpackbits(self.packed, count=self.size)[positions]
+
+    def row_range(self, start, stop):
+        # Only the bytes covering the range are unpacked and packed again
+        shift = start % 8
+        bits = np.unpackbits(self.packed[start // 8:(stop + 7) // 8])[shift:shift + stop - start]
+        return _Bits(bits.astype(bool), self.labels)
+
+    def to_arrow(self, positions):
+        bits = self.bits(positions).astype(bool)
+        if self.labels is None:
+            return pa.array(bits)
+        return pa.DictionaryArray.from_arrays(pa.array(bits.astype(np.int32)), pa.array(self.labels, pa.string()))
+
+    def sort_key(self, positions):
+        bits = self.bits(positions).astype('float64')
+        # A column with a single value is all zero bits and needs no flip
+        if self.labels is not None and len(self.labels) == 2 and str(self.labels[0]) > str(self.labels[1]):
+            bits = 1 - bits
+        return bits
+
+
+class _Days:
+    """Dates as int32 days since 1970-01-01."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def extend(self, array):
+        if not pa.types.is_date32(array.type):
+            array = array.cast(pa.date32())
+        days = array.cast(pa.int32()).fill_null(_MISSING_DAY)
+        self._chunks.append(days.to_numpy(zero_copy_only=False))
+
+    def finish(self):
+        self.days = _freeze(np.concatenate(self._chunks) if self._chunks else np.zeros(0, dtype=np.int32))
+        del self._chunks
+        return self
+
+    @property
+    def nbytes(self):
+        return self.days.nbytes
+
+    def row_range(self, start, stop):
+        return _with(self, days=self.days[start:stop])
+
+    def to_arrow(self, positions):
+        days = self.days[positions]
+        missing = days == _MISSING_DAY
+        return pa.array(days, pa.int32(), mask=missing if missing.any() else None).cast(pa.date32())
+
+    def sort_key(self, positions):
+        days = self.days[positions].astype('float64')
+        days[days == _MISSING_DAY] = np.nan
+        return days
+
+
+class _Amounts:
+    """Amounts as int32 cents while every value allows it, float32 from the first one that does not."""
+
+    SCALE = 100
+
+    def __init__(self):
+        self._chunks = []
+        self.fixed = True
+
+    def extend(self, array):
+        source = array.to_numpy(zero_copy_only=False)
+        values = source.astype('float64')
+        if self.fixed:
+            cents = np.rint(values * self.SCALE)
+            if source.dtype == np.float32:
+                # float32 (the Parquet copy) only holds the nearest value to each decimal
+                exact = np.array_equal((cents / self.SCALE).astype(np.float32), source)
+            else:
+                exact = np.all(np.abs(values * self.SCALE - cents) < 1e-6)
+            if exact and (len(cents) == 0 or (cents.min() >= _INT32.min and cents.max() <= _INT32.max)):
+                self._chunks.append(cents.astype(np.int32))
+                return
+            self.fixed = False
+        self._chunks.append(values.astype(np.float32))
+
+    def finish(self):
+        if self.fixed:
+            self.data = np.concatenate(self._chunks) if self._chunks else np.zeros(0, dtype=np.int32)
+        else:
+            self.data = np.concatenate([chunk if chunk.dtype == np.float32 else
+                                        (chunk / self.SCALE).astype(np.float32) for chunk in self._chunks])
+        del self._chunks
+        _freeze(self.data)
+        return self
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def row_range(self, start, stop):
+        return _with(self, data=self.data[start:stop])
+
+    def values(self, positions=slice(None)):
+        """The amounts as float64."""
+        data = self.data[positions].astype('float64')
+        return data / self.SCALE if self.fixed else data
+
+    def to_arrow(self, positions):
+        return pa.array(self.values(positions), from_pandas=True)
+
+    def sort_key(self, positions):
+        return self.values(positions)
+
+
+class _Integers:
+    """Whole numbers in the narrowest integer type that holds them (float32 if any are missing)."""
+
+    def __init__(self):
+        self._chunks = []
+        self.missing = False
+
+    def extend(self, array):
+        self.missing = self.missing or array.null_count > 0
+        self._chunks.append(array.to_numpy(zero_copy_only=False))
+
+    def finish(self):
+        data = np.concatenate(self._chunks) if self._chunks else np.zeros(0, dtype=np.int64)
+        del self._chunks
+        if self.missing:
+            self.data = data.astype(np.float32)
+        else:
+            self.data = data.astype(_narrowest(data.min(), data.max()) if len(data) else np.uint8)
+        _freeze(self.data)
+        return self
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def row_range(self, start, stop):
+        return _with(self, data=self.data[start:stop])
+
+    def to_arrow(self, positions):
+        data = self.data[positions]
+        return pa.array(data if self.missing else data.astype(np.int64), from_pandas=True)
+
+    def sort_key(self, positions):
+        return self.data[positions].astype('float64')
+
+
+class _Strings:
+    """Anything else, kept as one Arrow string array (no Python objects)."""
+
+    def __init__(self, chunks=None):
+        self._chunks = list(chunks or [])
+
+    def extend(self, array):
+        if pa.types.is_dictionary(array.type):
+            array = array.cast(array.type.value_type)
+        self._chunks.append(array.cast(pa.string()))
+
+    def finish(self):
+        self.array = pa.concat_arrays(self._chunks) if self._chunks else pa.array([], pa.string())
+        del self._chunks
+        return self
+
+    @property
+    def nbytes(self):
+        return self.array.nbytes
+
+    def row_range(self, start, stop):
+        return _with(self, array=self.array.slice(start, stop - start))
+
+    def to_arrow(self, positions):
+        return self.array.take(pa.array(positions, pa.int64()))
+
+    def sort_key(self, positions):
+        codes, _ = pd.factorize(self.to_arrow(positions).to_pandas(), sort=True)
+        return np.where(codes >= 0, codes, np.nan).astype('float64')
+
+
+class _Ids:
+    """"<prefix><number>" identifiers as the number alone.
+
+    The prefix must be the same on every row, and a number written with
+    leading zeros must be exactly ``width`` digits long, so that
+    ``prefix + str(number).zfill(width)`` gives back the original text.
+    Columns that break either rule are kept as strings.
+    """
+
+    PATTERN = r'^(?P<prefix>\D*)(?P<number>\d+)$'
+
+    def __init__(self):
+        self.prefix = None
+        self.width = None
+        self._zero_led = 0
+        self._chunks = []
+        self._fallback = None
+
+    def extend(self, array):
+        if pa.types.is_dictionary(array.type):
+            array = array.cast(array.type.value_type)
+        if self._fallback is None and not self._extend_numbers(array):
+            self._fallback = _Strings(self._format(chunk) for chunk in self._chunks)
+            self._chunks = []
+        if self._fallback is not None:
+            self._fallback.extend(array)
+
+    def _extend_numbers(self, array):
+        if len(array) == 0:
+            return True
+        parts = pc.extract_regex(array, self.PATTERN)
+        if parts.null_count:
+            return False
+        prefixes = pc.unique(parts.field('prefix')).to_pylist()
+        if len(prefixes) != 1 or self.prefix not in (None, prefixes[0]):
+            return False
+        digits = parts.field('number')
+        lengths = pc.utf8_length(digits).to_numpy()
+        zero_led = lengths[pc.starts_with(digits, '0').to_numpy(zero_copy_only=False)]
+        width = int(lengths.min()) if self.width is None else min(self.width, int(lengths.min()))
+        zero_led = max(self._zero_led, int(zero_led.max()) if len(zero_led) else 0)
+        if zero_led > width:
+            return False
+        self.prefix, self.width, self._zero_led = prefixes[0], width, zero_led
+        self._chunks.append(pc.cast(digits, pa.int64()).to_numpy())
+        return True
+
+    def _format(self, numbers):
+        digits = pc.utf8_lpad(pa.array(numbers, pa.int64()).cast(pa.string()), width=self.width, padding='0')
+        return pc.binary_join_element_wise(self.prefix, digits, '')
+
+    def finish(self):
+        if self._fallback is not None:
+            return self._fallback.finish()
+        numbers = np.concatenate(self._chunks) if self._chunks else np.zeros(0, dtype=np.int64)
+        del self._chunks
+        self.numbers = _freeze(numbers.astype(_narrowest(0, numbers.max()) if len(numbers) else np.uint8))
+        self.prefix, self.width = self.prefix or '', self.width or 0
+        return self
+
+    @property
+    def nbytes(self):
+        return self.numbers.nbytes
+
+    def row_range(self, start, stop):
+        return _with(self, numbers=self.numbers[start:stop])
+
+    def to_arrow(self, positions):
+        return self._format(self.numbers[positions].astype(np.int64))
+
+    def sort_key(self, positions):
+        return self.numbers[positions].astype('float64')
+
+
+def _column_for(name, data_type):
+    if pa.types.is_dictionary(data_type):
+        data_type = data_type.value_type
+    if pa.types.is_string(data_type) or pa.types.is_large_string(data_type):
+        return _Ids() if name in ID_COLUMNS else _Codes()
+    if pa.types.is_boolean(data_type):
+        return _Bits()
+    if pa.types.is_date(data_type) or pa.types.is_timestamp(data_type):
+        return _Days()
+    if pa.types.is_floating(data_type):
+        return _Amounts()
+    if pa.types.is_integer(data_type):
+        return _Integers()
+    return _Strings()
+
+
+class CompactTable:
+    """Read-only sales rows in compact column encodings (see the module docstring)."""
+
+    def __init__(self, columns, size):
+        self._columns = columns
+        self.columns = list(columns)
+        self.size = size
+
+    @classmethod
+    def from_batches(cls, batches):
+        """Build a table from an iterable of Arrow record batches with the same schema."""
+        columns, size = None, 0
+        for batch in batches:
+            if columns is None:
+                columns = {field.name: _column_for(field.name, field.type) for field in batch.schema}
+            for name, array in zip(batch.schema.names, batch.columns):
+                columns[name].extend(array)
+            size += batch.num_rows
+        if columns is None:
+            raise ValueError("no record batches to build a table from")
+        return cls({name: column.finish() for name, column in columns.items()}, size)
+
+    @classmethod
+    def from_csv(cls, csv_path, columns=None, layout=None, block_size=CSV_BLOCK_BYTES):
+        """Stream ``csv_path`` (only ``columns``, named as in ``layout``) into a table, one block at a time."""
+        return cls.from_batches(open_csv(csv_path, columns, layout, block_size))
+
+    @classmethod
+    def from_parquet(cls, parquet_path, columns=None, layout=None):
+        source, names = source_columns(pq.read_schema(parquet_path).names, columns, layout)
+        return cls.from_batches(to_layout(batch, source, layout)
+                                for batch in pq.ParquetFile(parquet_path).iter_batches(columns=names))
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls.from_batches(pa.Table.from_pandas(df, preserve_index=False).to_batches())
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        """One whole column as a pandas Series, or, for a list of columns, a table of just those."""
+        if isinstance(key, list):
+            return CompactTable({name: self._columns[name] for name in key}, self.size)
+        return self.take(slice(None), [key])[key]
+
+    def row_range(self, start, stop):
+        """The rows ``start:stop`` as a table sharing this one's arrays (bits are packed anew).
+
+        Pickles to just those rows, so a range can be sent to a worker process.
+        """
+        stop = min(stop, self.size)
+        return CompactTable({name: column.row_range(start, stop) for name, column in self._columns.items()},
+                            stop - start)
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self._columns.values())
+
+    def memory_usage(self):
+        """Bytes held per column."""
+        return pd.Series({name: column.nbytes for name, column in self._columns.items()}, dtype='int64')
+
+    def encoding(self, column):
+        """How ``column`` is stored, e.g. ``'uint8 codes'`` or ``'int32 cents'``."""
+        data = self._columns[column]
+        if isinstance(data, _Codes):
+            return f'{data.codes.dtype} codes'
+        if isinstance(data, _Bits):
+            return 'bits'
+        if isinstance(data, _Days):
+            return 'int32 days'
+        if isinstance(data, _Amounts):
+            return 'int32 cents' if data.fixed else 'float32'
+        if isinstance(data, _Ids):
+            return f'{data.numbers.dtype} ids'
+        if isinstance(data, _Integers):
+            return str(data.data.dtype)
+        return 'arrow strings'
+
+    def take(self, positions, columns=None):
+        """The rows at ``positions`` (or a slice) of ``columns`` as a DataFrame with the pandas dtypes
+        :func:`sales_storage.load_sales_data` would give."""
+        columns = self.columns if columns is None else list(columns)
+        if isinstance(positions, slice):
+            positions = np.arange(self.size)[positions]
+        positions = np.asarray(positions, dtype=np.int64)
+        table = pa.table({name: self._columns[name].to_arrow(positions) for name in columns})
+        return table.to_pandas(date_as_object=False)
+
+    def to_frame(self, columns=None):
+        return self.take(slice(None), columns)
+
+    def sort_key(self, column, positions):
+        """Numeric keys ordering ``column`` at ``positions`` (NaN for missing values)."""
+        return self._columns[column].sort_key(np.asarray(positions, dtype=np.int64))
+
+
+def load_compact(csv_path, columns=None, layout=None):
+    """:class:`CompactTable` of ``csv_path``, read from its Parquet copy when that is up to date."""
+    parquet_path = parquet_path_for(csv_path)
+    if os.path.exists(parquet_path) and not (os.path.exists(csv_path) and is_stale(csv_path, parquet_path)):
+        return CompactTable.from_parquet(parquet_path, columns, layout)
+    return CompactTable.from_csv(csv_path, columns, layout)
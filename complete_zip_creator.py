@@ -1,26 +1,18 @@
+import argparse
 import os
-import zipfile
+import shutil
+import sys
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-import random
-
-print("🚀 Creating Complete Lulu Sales Dashboard Package...")
-print("=" * 70)
-
-# Create project directory
-project_name = "lulu_sales_dashboard"
-if not os.path.exists(project_name):
-    os.makedirs(project_name)
+from datetime import datetime
 
-# Set random seed for reproducibility
-np.random.seed(42)
-random.seed(42)
+from archive_writer import ARCHIVE_FORMATS, COMPRESS_THREADS, open_archive
+from sales_storage import convert_csv, write_parquet
+from startup_snapshot import file_digest, file_signature, read_snapshot, snapshot_path_for, update_snapshot
 
 # ============================================================================
-# 1. GENERATE SYNTHETIC DATA
+# SYNTHETIC DATA GENERATOR
 # ============================================================================
-print("\n📊 Step 1: Generating synthetic sales data (100 rows)...")
 
 cities = ['Dubai', 'Abu Dhabi', 'Sharjah', 'Ajman', 'Ras Al Khaimah', 'Fujairah', 'Umm Al Quwain']
 nationalities = ['UAE National', 'Indian', 'Pakistani', 'Filipino', 'Egyptian', 'Jordanian', 'British', 'American']
@@ -30,67 +22,182 @@ income_brackets = ['Low (< 5000 AED)', 'Medium (5000-15000 AED)', 'High (15000-3
 product_categories = ['Groceries', 'Electronics', 'Clothing', 'Home & Kitchen', 'Personal Care', 'Toys & Games', 'Sports', 'Books & Stationery']
 loyalty_tiers = ['Bronze', 'Silver', 'Gold', 'Platinum']
 
-data = []
-
-for i in range(100):
-    transaction_id = f'TXN{str(i+1).zfill(5)}'
-    customer_id = f'CUST{str(random.randint(1, 50)).zfill(4)}'
-    days_ago = random.randint(0, 180)
-    transaction_date = datetime.now() - timedelta(days=days_ago)
-    city = random.choice(cities)
-    nationality = random.choice(nationalities)
-    age_group = random.choice(age_groups)
-    gender = random.choice(genders)
-    income = random.choice(income_brackets)
-    category = random.choice(product_categories)
-    quantity = random.randint(1, 10)
-    unit_price = round(random.uniform(10, 500), 2)
-    total_amount = round(quantity * unit_price, 2)
-    discount = round(random.uniform(0, 0.3) * total_amount, 2)
-    final_amount = round(total_amount - discount, 2)
-    is_loyalty_member = random.choice([True, False])
-    loyalty_tier = random.choice(loyalty_tiers) if is_loyalty_member else 'None'
-    loyalty_points_earned = int(final_amount * 0.1) if is_loyalty_member else 0
-    loyalty_points_redeemed = random.randint(0, 100) if is_loyalty_member and random.random() > 0.7 else 0
-    
-    ad_budget_map = {
-        'Groceries': 50000, 'Electronics': 80000, 'Clothing': 60000,
-        'Home & Kitchen': 45000, 'Personal Care': 40000, 'Toys & Games': 35000,
-        'Sports': 30000, 'Books & Stationery': 25000
-    }
-    ad_budget = ad_budget_map[category]
-    store = f'Lulu {city}'
-    
-    data.append({
-        'Transaction_ID': transaction_id, 'Customer_ID': customer_id,
-        'Transaction_Date': transaction_date.strftime('%Y-%m-%d'),
-        'Store_Location': store, 'City': city, 'Nationality': nationality,
-        'Age_Group': age_group, 'Gender': gender, 'Income_Bracket': income,
-        'Product_Category': category, 'Quantity': quantity, 'Unit_Price': unit_price,
-        'Total_Amount': total_amount, 'Discount': discount, 'Final_Amount': final_amount,
-        'Is_Loyalty_Member': is_loyalty_member, 'Loyalty_Tier': loyalty_tier,
-        'Loyalty_Points_Earned': loyalty_points_earned,
-        'Loyalty_Points_Redeemed': loyalty_points_redeemed,
-        'Monthly_Ad_Budget': ad_budget
-    })
-
-df = pd.DataFrame(data)
-csv_path = os.path.join(project_name, 'lulu_sales_data.csv')
-df.to_csv(csv_path, index=False)
-print(f"   ✅ Generated {len(df)} transactions")
-print(f"   💰 Total Revenue: AED {df['Final_Amount'].sum():,.2f}")
+ad_budget_map = {
+    'Groceries': 50000, 'Electronics': 80000, 'Clothing': 60000,
+    'Home & Kitchen': 45000, 'Personal Care': 40000, 'Toys & Games': 35000,
+    'Sports': 30000, 'Books & Stationery': 25000
+}
+
+DEFAULT_ROWS = 100
+DEFAULT_CHUNK_SIZE = 1_000_000
+DEFAULT_SEED = 42
+
+# Helper modules shipped next to the generated app.py
+SUPPORT_MODULES = ['sales_schema.py', 'sales_storage.py', 'filter_index.py', 'data_cube.py', 'dataset_cache.py',
+                   'incremental.py', 'aggregation.py', 'parallel_agg.py', 'process_pool.py', 'chart_data.py',
+                   'instrumentation.py', 'shared_dataset.py', 'approximate.py', 'result_cache.py',
+                   'startup_snapshot.py', 'derived_metrics.py']
+
+
+def _categorical(codes, labels):
+    return pd.Categorical.from_codes(codes, categories=labels)
+
+
+def generate_sales_chunks(rows=DEFAULT_ROWS, chunk_size=DEFAULT_CHUNK_SIZE, seed=DEFAULT_SEED, end_date=None):
+    """Yield the synthetic transactions as DataFrames of at most ``chunk_size`` rows.
+
+    Every column is drawn for the whole chunk at once from a single seeded
+    ``np.random.Generator``, so memory is bounded by ``chunk_size`` and the same
+    (rows, chunk_size, seed, end_date) always produces the same data.
+    """
+    rng = np.random.default_rng(seed)
+    end_day = np.datetime64(end_date or datetime.now().date(), 'D')
+
+    city_labels = np.array(cities)
+    store_labels = [f'Lulu {city}' for city in cities]
+    customer_labels = [f'CUST{str(i).zfill(4)}' for i in range(1, 51)]
+    tier_labels = loyalty_tiers + ['None']
+    ad_budgets = np.array([ad_budget_map[c] for c in product_categories], dtype=np.int64)
+
+    for start in range(0, rows, chunk_size):
+        n = min(chunk_size, rows - start)
+
+        city = rng.integers(0, len(cities), n)
+        category = rng.integers(0, len(product_categories), n)
+        days_ago = rng.integers(0, 181, n)
+        quantity = rng.integers(1, 11, n)
+        unit_price = np.round(rng.uniform(10, 500, n), 2)
+        total_amount = np.round(quantity * unit_price, 2)
+        discount = np.round(rng.uniform(0, 0.3, n) * total_amount, 2)
+        final_amount = np.round(total_amount - discount, 2)
+
+        is_member = rng.random(n) < 0.5
+        tier = np.where(is_member, rng.integers(0, len(loyalty_tiers), n), len(loyalty_tiers))
+        points_earned = np.where(is_member, (final_amount * 0.1).astype(np.int64), 0)
+        redeems = is_member & (rng.random(n) > 0.7)
+        points_redeemed = np.where(redeems, rng.integers(0, 101, n), 0)
+
+        ids = pd.Series(np.arange(start + 1, start + n + 1)).astype(str).str.zfill(5)
+
+        yield pd.DataFrame({
+            'Transaction_ID': ('TXN' + ids).to_numpy(),
+            'Customer_ID': _categorical(rng.integers(0, 50, n), customer_labels),
+            'Transaction_Date': end_day - days_ago.astype('timedelta64[D]'),
+            'Store_Location': _categorical(city, store_labels),
+            'City': _categorical(city, city_labels),
+            'Nationality': _categorical(rng.integers(0, len(nationalities), n), nationalities),
+            'Age_Group': _categorical(rng.integers(0, len(age_groups), n), age_groups),
+            'Gender': _categorical(rng.integers(0, len(genders), n), genders),
+            'Income_Bracket': _categorical(rng.integers(0, len(income_brackets), n), income_brackets),
+            'Product_Category': _categorical(category, product_categories),
+            'Quantity': quantity, 'Unit_Price': unit_price,
+            'Total_Amount': total_amount, 'Discount': discount, 'Final_Amount': final_amount,
+            'Is_Loyalty_Member': is_member,
+            'Loyalty_Tier': _categorical(tier, tier_labels),
+            'Loyalty_Points_Earned': points_earned,
+            'Loyalty_Points_Redeemed': points_redeemed,
+            'Monthly_Ad_Budget': ad_budgets[category]
+        }, index=pd.RangeIndex(start, start + n))
+
+
+def write_sales_csv(target, rows=DEFAULT_ROWS, chunk_size=DEFAULT_CHUNK_SIZE, seed=DEFAULT_SEED, end_date=None):
+    """Stream the generated chunks as CSV to ``target`` (a path or binary file) and return summary stats for the log."""
+    if isinstance(target, str):
+        with open(target, 'wb') as f:
+            return write_sales_csv(f, rows, chunk_size, seed, end_date)
+
+    summary = {'rows': 0, 'revenue': 0.0, 'min_date': None, 'max_date': None,
+               'cities': set(), 'categories': set()}
+
+    for i, chunk in enumerate(generate_sales_chunks(rows, chunk_size, seed, end_date)):
+        target.write(chunk.to_csv(header=(i == 0), index=False, date_format='%Y-%m-%d').encode('utf-8'))
+
+        first, last = chunk['Transaction_Date'].min(), chunk['Transaction_Date'].max()
+        summary['rows'] += len(chunk)
+        summary['revenue'] += float(chunk['Final_Amount'].sum())
+        summary['min_date'] = first if summary['min_date'] is None else min(summary['min_date'], first)
+        summary['max_date'] = last if summary['max_date'] is None else max(summary['max_date'], last)
+        summary['cities'].update(chunk['City'].unique())
+        summary['categories'].update(chunk['Product_Category'].unique())
+
+    return summary
+
+
+def format_bytes(n):
+    for unit in ('B', 'kB', 'MB'):
+        if n < 1000:
+            return f"{n:,.1f} {unit}"
+        n /= 1000
+    return f"{n:,.1f} GB"
+
+
+def paint_snapshot(project_dir, data_file='lulu_sales_data.csv'):
+    """Run the generated dashboard once, headless, so the package ships with its startup snapshot.
+
+    Returns the snapshot's path, or ``None`` when Streamlit is not installed
+    here or the run left no snapshot (say, with ``LULU_FAST_STARTUP=0``).
+    """
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        return None
+    project_dir = os.path.abspath(project_dir)
+    cwd = os.getcwd()
+    os.chdir(project_dir)
+    sys.path.insert(0, project_dir)
+    try:
+        AppTest.from_file(os.path.join(project_dir, 'app.py'), default_timeout=3600).run()
+    finally:
+        sys.path.remove(project_dir)
+        os.chdir(cwd)
+
+    data_path = os.path.join(project_dir, data_file)
+    signature = file_signature(data_path)
+    if read_snapshot(data_path, signature) is None:
+        return None
+    # Unpacking gives the CSV a new mtime; the digest lets the snapshot apply anyway
+    update_snapshot(data_path, signature, digest=file_digest(data_path))
+    return snapshot_path_for(data_path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build the Lulu sales dashboard package.")
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS,
+                        help="number of synthetic transactions to generate (default: %(default)s)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="rows generated and written per chunk (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED,
+                        help="seed for the random generator (default: %(default)s)")
+    parser.add_argument('--end-date', type=lambda s: datetime.strptime(s, '%Y-%m-%d').date(), default=None,
+                        help="latest transaction date, YYYY-MM-DD (default: today)")
+    parser.add_argument('--stream', action='store_true',
+                        help="write the dataset straight into the archive instead of the project folder")
+    parser.add_argument('--format', choices=ARCHIVE_FORMATS, default='zip',
+                        help="archive format (default: %(default)s)")
+    parser.add_argument('--compress-threads', type=int, default=COMPRESS_THREADS,
+                        help="threads compressing archive members (default: %(default)s)")
+    args = parser.parse_args(argv)
+    if args.rows < 1 or args.chunk_size < 1 or args.compress_threads < 1:
+        parser.error("--rows, --chunk-size and --compress-threads must be positive")
+    return args
+
 
 # ============================================================================
-# 2. CREATE APP.PY (MAIN DASHBOARD)
+# DASHBOARD PACKAGE TEMPLATES
 # ============================================================================
-print("\n📱 Step 2: Creating Streamlit dashboard (app.py)...")
 
-app_code = '''import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+app_code = '''import json
+import os
+import streamlit as st
 from datetime import datetime
 
+# Only what painting the startup snapshot needs is imported here; the helper
+# modules that pull in pandas, numpy and pyarrow are imported by the
+# functions that load and query the dataset
+from instrumentation import debug_panel, metrics, start_rerun
+from result_cache import results
+from startup_snapshot import FAST_STARTUP, file_signature, read_snapshot, update_snapshot
+
 # Page configuration
 st.set_page_config(
     page_title="Lulu Stores UAE - Sales Dashboard",
@@ -114,14 +221,148 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
-# Load data
-@st.cache_data
-def load_data():
-    df = pd.read_csv('lulu_sales_data.csv')
-    df['Transaction_Date'] = pd.to_datetime(df['Transaction_Date'])
-    return df
+# Columns the dashboard actually uses; everything else stays on disk
+DASHBOARD_COLUMNS = [
+    'Transaction_Date', 'Customer_ID', 'City', 'Nationality', 'Age_Group', 'Gender', 'Income_Bracket',
+    'Product_Category', 'Discount', 'Final_Amount', 'Is_Loyalty_Member', 'Loyalty_Tier',
+    'Loyalty_Points_Earned', 'Loyalty_Points_Redeemed', 'Monthly_Ad_Budget'
+]
+
+# Pre-aggregated cube: every KPI and chart below rolls it up instead of
+# scanning the transactions
+CUBE_DIMENSIONS = [
+    'Transaction_Date', 'City', 'Product_Category', 'Loyalty_Tier', 'Gender',
+    'Age_Group', 'Nationality', 'Income_Bracket', 'Is_Loyalty_Member'
+]
+
+FILTER_COLUMNS = ['City', 'Product_Category', 'Loyalty_Tier', 'Gender']
+
+def dashboard_metrics():
+    # KPIs and ratios, declared once: all of them come out of one fused pass over
+    # the matching rows per filter state (overall, or per category for the ad chart)
+    from derived_metrics import Metric, distinct, per_group, rows, total
+    return {
+        'total_revenue': Metric(total('Final_Amount')),
+        'total_transactions': Metric(rows()),
+        'avg_transaction': Metric(total('Final_Amount'), rows()),
+        'loyalty_pct': Metric(rows(where='Is_Loyalty_Member'), rows(), scale=100),
+        'total_discount': Metric(total('Discount')),
+        'discount_rate': Metric(total('Discount'), total('Final_Amount', 'Discount'), scale=100),
+        'points_redeemed_pct': Metric(total('Loyalty_Points_Redeemed'), total('Loyalty_Points_Earned'), scale=100),
+        'revenue_per_customer': Metric(total('Final_Amount'), distinct('Customer_ID')),
+        'ad_budget': Metric(per_group('Monthly_Ad_Budget', 'Product_Category')),
+        'roi': Metric(total('Final_Amount'), per_group('Monthly_Ad_Budget', 'Product_Category')),
+    }
+
+# KPI tiles, five per row: (metric, label, format, help)
+KPI_TILES = [
+    ('total_revenue', "💰 Total Revenue", "AED {:,.0f}", None),
+    ('total_transactions', "🛍️ Transactions", "{:,.0f}", None),
+    ('avg_transaction', "📊 Avg Transaction", "AED {:,.0f}", None),
+    ('loyalty_pct', "⭐ Loyalty Members", "{:.1f}%", None),
+    ('total_discount', "🎁 Total Discounts", "AED {:,.0f}", None),
+    ('roi', "📣 ROI", "{:.2f}×", "Revenue per AED of monthly ad budget"),
+    ('discount_rate', "🏷️ Discount Rate", "{:.1f}%", None),
+    ('points_redeemed_pct', "🎯 Points Redeemed", "{:.1f}%", "Share of loyalty points earned"),
+    ('revenue_per_customer', "🧑‍🤝‍🧑 Revenue per Customer", "AED {:,.0f}", None),
+]
 
-df = load_data()
+# Approximate mode: a sample and sketches per City/category stratum answer
+# the KPIs and revenue breakdowns with error bars without touching the rows
+SKETCH_STRATA = ['City', 'Product_Category']
+SKETCH_COLUMNS = ['Loyalty_Tier', 'Gender', 'Nationality', 'Income_Bracket', 'Age_Group']
+BREAKDOWNS = {'Nationality': 'Nationality', 'Income Bracket': 'Income_Bracket', 'Age Group': 'Age_Group'}
+
+# "reload" re-reads the whole dataset when the CSV changes, "incremental"
+# ingests appended rows and new daily partition files by delta
+INGEST_MODE = os.environ.get('LULU_INGEST_MODE', 'reload')
+
+# With LULU_SHARED_DIR, the dataset is mapped from the copy shared_dataset.py
+# publishes for every server process on the host
+SHARED_DIR = os.environ.get('LULU_SHARED_DIR')
+
+def build_dashboard_data(df):
+    from derived_metrics import MetricSet
+    from parallel_agg import parallel_cube, parallel_sketch
+    # Built from per-row-range cubes on all cores for large datasets
+    cube = parallel_cube(df, CUBE_DIMENSIONS, ['Final_Amount', 'Discount'],
+                         date_dimension='Transaction_Date')
+    sketch = parallel_sketch(df, SKETCH_STRATA, 'Final_Amount', 'Customer_ID', SKETCH_COLUMNS,
+                             date_column='Transaction_Date')
+    derived = MetricSet(df, dashboard_metrics(), FILTER_COLUMNS, date_column='Transaction_Date', by=['Product_Category'])
+    return df, cube, derived, sketch
+
+def extend_dashboard_data(data, delta, df):
+    _, cube, derived, sketch = data
+    return df, cube.add(delta), derived.add(delta), sketch.add(delta)
+
+def load_dashboard_data(path):
+    from sales_storage import load_sales_data
+    # Parquet copy of the CSV with categoricals and native dates, in this
+    # dashboard's column names whichever layout the CSV has
+    return build_dashboard_data(load_sales_data(path, columns=DASHBOARD_COLUMNS, layout='package'))
+
+# Opt-in per-rerun timings (LULU_INSTRUMENT=1), shown in the sidebar and exported as metrics
+rerun = start_rerun('template')
+metrics.watch_cache('results', results)
+
+def load_data():
+    # Load data once per process, shared read-only by all sessions
+    global df, cube, derived, sketch, version
+    from dataset_cache import datasets, views
+    metrics.watch_cache('datasets', datasets)
+    with rerun.stage('load') as stage:
+        if SHARED_DIR:
+            from shared_dataset import attach, current_path
+            datasets.register('sales', current_path(SHARED_DIR),
+                              lambda pointer: build_dashboard_data(attach(pointer, DASHBOARD_COLUMNS)))
+            df, cube, derived, sketch = datasets.get('sales')
+            version = datasets.version('sales')
+        elif INGEST_MODE == 'incremental':
+            from incremental import open_dataset
+            live = open_dataset('sales', 'lulu_sales_data.csv', DASHBOARD_COLUMNS,
+                                build_dashboard_data, extend_dashboard_data, layout='package')
+            df, cube, derived, sketch = views(live.snapshot())
+            version = live.version
+        else:
+            datasets.register('sales', 'lulu_sales_data.csv', load_dashboard_data)
+            df, cube, derived, sketch = datasets.get('sales')
+            version = datasets.version('sales')
+        stage['rows_out'] = len(df)
+
+def filtered_view():
+    # The cube view of the current filters, loading the dataset first if this rerun has not
+    global view
+    if df is None:
+        load_data()
+    if view is None:
+        with rerun.stage('filter', rows_in=len(df)) as stage:
+            view = cube.filter(selections, date_range=(date_range[0], date_range[1]))
+            stage['rows_out'] = view.count()
+    return view
+
+# Fast startup (LULU_FAST_STARTUP, on by default): the default view is painted
+# from the snapshot the first process to compute it left next to the dataset,
+# and the dataset is only loaded once a filter changes. Incrementally ingested
+# data changes without the CSV changing, so that mode always loads.
+# (the shared copy's CURRENT pointer, see shared_dataset.current_path, without importing it)
+DATA_SOURCE = os.path.join(SHARED_DIR, 'CURRENT') if SHARED_DIR else 'lulu_sales_data.csv'
+snapshot_signature = file_signature(DATA_SOURCE) if FAST_STARTUP and INGEST_MODE != 'incremental' else None
+snapshot = read_snapshot(DATA_SOURCE, snapshot_signature) if snapshot_signature else None
+if snapshot is not None and not ({'options', 'date_span', 'kpis'} <= snapshot.keys()
+                                 and {name for name, *_ in KPI_TILES} <= snapshot['kpis'].keys()):
+    snapshot = None
+snapshot_parts = {}
+
+df = view = None
+if snapshot is None:
+    load_data()
+    # Bounds from the date-ordered cube cells rather than a scan of every row
+    first_date, last_date = (d.date() for d in cube.date_span())
+    options = {column: [str(value) for value in df[column].dropna().unique()] for column in FILTER_COLUMNS}
+else:
+    first_date, last_date = (datetime.fromisoformat(d).date() for d in snapshot['date_span'])
+    options = snapshot['options']
 
 # Header
 st.markdown('<h1 class="main-header">🛒 LULU HYPERMARKET UAE - SALES ANALYTICS DASHBOARD</h1>', unsafe_allow_html=True)
@@ -133,79 +374,141 @@ st.sidebar.header("🔍 Filter Options")
 
 date_range = st.sidebar.date_input(
     "Select Date Range",
-    value=(df['Transaction_Date'].min(), df['Transaction_Date'].max()),
-    min_value=df['Transaction_Date'].min().date(),
-    max_value=df['Transaction_Date'].max().date()
+    value=(first_date, last_date),
+    min_value=first_date,
+    max_value=last_date
 )
+# While the second end of the range is being picked only one date is set
+if len(date_range) == 1:
+    date_range = (date_range[0], date_range[0])
 
 cities = st.sidebar.multiselect(
     "Select City",
-    options=df['City'].unique(),
-    default=df['City'].unique()
+    options=options['City'],
+    default=options['City']
 )
 
 categories = st.sidebar.multiselect(
     "Select Product Category",
-    options=df['Product_Category'].unique(),
-    default=df['Product_Category'].unique()
+    options=options['Product_Category'],
+    default=options['Product_Category']
 )
 
 loyalty = st.sidebar.multiselect(
     "Loyalty Tier",
-    options=df['Loyalty_Tier'].unique(),
-    default=df['Loyalty_Tier'].unique()
+    options=options['Loyalty_Tier'],
+    default=options['Loyalty_Tier']
 )
 
 gender = st.sidebar.multiselect(
     "Gender",
-    options=df['Gender'].unique(),
-    default=df['Gender'].unique()
+    options=options['Gender'],
+    default=options['Gender']
+)
+
+st.sidebar.markdown("---")
+approximate = st.sidebar.toggle(
+    "⚡ Approximate mode",
+    help="KPIs and breakdowns from per-city/category samples and sketches, with 95% error bars"
+)
+refine = approximate and st.sidebar.toggle(
+    "🎯 Refine to exact",
+    help="Compute the exact KPIs in the background and show them once they are ready"
 )
 
 # Apply filters
-filtered_df = df[
-    (df['Transaction_Date'].dt.date >= date_range[0]) &
-    (df['Transaction_Date'].dt.date <= date_range[1]) &
-    (df['City'].isin(cities)) &
-    (df['Product_Category'].isin(categories)) &
-    (df['Loyalty_Tier'].isin(loyalty)) &
-    (df['Gender'].isin(gender))
-]
+selections = {'City': cities, 'Product_Category': categories, 'Loyalty_Tier': loyalty, 'Gender': gender}
+at_defaults = (not approximate and tuple(date_range) == (first_date, last_date)
+               and all(set(selections[column]) == set(options[column]) for column in FILTER_COLUMNS))
+from_snapshot = snapshot is not None and at_defaults
+if not from_snapshot:
+    filtered_view()
+
+# The filter state results are memoized under
+filter_key = (tuple((column, tuple(sorted(map(str, values)))) for column, values in selections.items()),
+              (str(date_range[0]), str(date_range[1])))
+
+def estimate_text(estimate, prefix=''):
+    if estimate is None:
+        return "—"
+    text = f"{prefix}{estimate.value:,.0f}"
+    return f"{text} ± {estimate.error:,.0f}" if estimate.error >= 0.5 else text
+
+def approximate_kpis(exact):
+    # Exact numbers once the background refinement has them, the sketch's estimates until then
+    failed = exact is not None and exact.done() and (exact.cancelled() or exact.exception() is not None)
+    done = exact is not None and exact.done() and not failed
+    numbers = exact.result() if done else sketch.summary(selections, date_range)
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("💰 Total Revenue", estimate_text(numbers['total'], 'AED '))
+    col2.metric("🛍️ Transactions", estimate_text(numbers['transactions']))
+    col3.metric("📊 Avg Transaction", estimate_text(numbers['average'], 'AED '))
+    col4.metric("🧑‍🤝‍🧑 Unique Customers", estimate_text(numbers['customers']),
+                help=None if numbers['customers'] else "Refine to exact for this selection")
+    col5.metric("⚖️ Median Transaction", estimate_text(numbers['median'], 'AED '))
+    if done:
+        st.caption("✅ Exact")
+    elif failed:
+        st.caption("⚠️ Refining to the exact numbers failed; showing the approximation until the page reruns")
+    elif exact is None:
+        st.caption("≈ Approximate: ± is the 95% confidence interval")
+    else:
+        st.caption("⏳ Approximate for now, refining to the exact numbers in the background…")
 
 # KPI Metrics
-col1, col2, col3, col4, col5 = st.columns(5)
-
-with col1:
-    total_revenue = filtered_df['Final_Amount'].sum()
-    st.metric("💰 Total Revenue", f"AED {total_revenue:,.0f}")
-
-with col2:
-    total_transactions = len(filtered_df)
-    st.metric("🛍️ Transactions", f"{total_transactions:,}")
-
-with col3:
-    avg_transaction = filtered_df['Final_Amount'].mean()
-    st.metric("📊 Avg Transaction", f"AED {avg_transaction:,.0f}")
-
-with col4:
-    loyalty_members = filtered_df[filtered_df['Is_Loyalty_Member'] == True].shape[0]
-    loyalty_pct = (loyalty_members / total_transactions * 100) if total_transactions > 0 else 0
-    st.metric("⭐ Loyalty Members", f"{loyalty_pct:.1f}%")
-
-with col5:
-    total_discount = filtered_df['Discount'].sum()
-    st.metric("🎁 Total Discounts", f"AED {total_discount:,.0f}")
+if approximate:
+    with rerun.stage('kpis_approximate'):
+        exact = None
+        if refine:
+            from approximate import refine_in_background
+            exact = refine_in_background(results, 'sales:exact', version, filter_key,
+                                         lambda: sketch.exact(df, selections, date_range))
+        # Polls every second while the exact answer is pending, without rerunning the page
+        st.fragment(approximate_kpis, run_every=1 if exact is not None and not exact.done() else None)(exact)
+
+    with rerun.stage('explore'):
+        st.subheader("🔬 Quick Exploration")
+        breakdown_label = st.radio("Break revenue down by", list(BREAKDOWNS), horizontal=True)
+        breakdown_column = BREAKDOWNS[breakdown_label]
+        breakdown = sketch.rollup(breakdown_column, selections, date_range).sort_values('value').reset_index()
+        import plotly.express as px
+        fig_explore = px.bar(
+            breakdown,
+            x='value',
+            y=breakdown_column,
+            orientation='h',
+            error_x='error',
+            labels={'value': 'Revenue (AED, ± 95%)', breakdown_column: breakdown_label}
+        )
+        fig_explore.update_traces(marker_color='#E31837')
+        fig_explore.update_layout(height=350)
+        st.plotly_chart(rerun.widget('chart_explore', fig_explore), width='stretch')
+
+else:
+    with rerun.stage('kpis'):
+        if from_snapshot:
+            kpis = snapshot['kpis']
+        else:
+            kpis = results.get_or_compute('sales:kpis', version, filter_key,
+                                          lambda: derived.evaluate(selections, date_range))
+            if at_defaults and snapshot_signature:
+                snapshot_parts.update(kpis=kpis, options=options, date_span=[str(first_date), str(last_date)])
+
+        for start in range(0, len(KPI_TILES), 5):
+            for column, (name, label, number_format, help_text) in zip(st.columns(5), KPI_TILES[start:start + 5]):
+                column.metric(label, number_format.format(kpis[name]), help=help_text)
 
 st.markdown("---")
 
-# Row 1: Sales by Category (Bar Chart) and City Distribution (Pie Chart)
-col1, col2 = st.columns(2)
+# Charts, one tab per section. Only the open tab runs on a rerun: its panels'
+# data is computed concurrently on a thread pool and memoized per filter
+# state, so a filter change recomputes just the visible panels. Plotly
+# itself is imported by the first figure that is actually built.
+def category_sales():
+    return view.rollup('Product_Category', 'Final_Amount').reset_index().sort_values('Final_Amount', ascending=True)
 
-with col1:
-    st.subheader("📊 Sales by Product Category")
-    category_sales = filtered_df.groupby('Product_Category')['Final_Amount'].sum().reset_index()
-    category_sales = category_sales.sort_values('Final_Amount', ascending=True)
-    
+def category_chart(category_sales):
+    import plotly.express as px
     fig_bar = px.bar(
         category_sales,
         x='Final_Amount',
@@ -216,12 +519,13 @@ with col1:
         labels={'Final_Amount': 'Revenue (AED)', 'Product_Category': 'Category'}
     )
     fig_bar.update_layout(height=400, showlegend=False)
-    st.plotly_chart(fig_bar, use_container_width=True)
+    return fig_bar
+
+def city_sales():
+    return view.rollup('City', 'Final_Amount').reset_index()
 
-with col2:
-    st.subheader("🌍 Sales Distribution by City")
-    city_sales = filtered_df.groupby('City')['Final_Amount'].sum().reset_index()
-    
+def city_chart(city_sales):
+    import plotly.express as px
     fig_pie = px.pie(
         city_sales,
         values='Final_Amount',
@@ -230,16 +534,15 @@ with col2:
     )
     fig_pie.update_traces(textposition='inside', textinfo='percent+label')
     fig_pie.update_layout(height=400)
-    st.plotly_chart(fig_pie, use_container_width=True)
+    return fig_pie
 
-# Row 2: Customer Demographics and Loyalty Analysis
-col1, col2 = st.columns(2)
+def age_sales():
+    return view.rollup(['Age_Group', 'Gender'], 'Final_Amount').reset_index()
 
-with col1:
-    st.subheader("👥 Customer Demographics - Age Groups")
-    
-    fig_age = px.histogram(
-        filtered_df,
+def age_chart(age_sales):
+    import plotly.express as px
+    fig_age = px.bar(
+        age_sales,
         x='Age_Group',
         y='Final_Amount',
         color='Gender',
@@ -248,12 +551,14 @@ with col1:
         color_discrete_map={'Male': '#1f77b4', 'Female': '#e377c2'}
     )
     fig_age.update_layout(height=400)
-    st.plotly_chart(fig_age, use_container_width=True)
+    return fig_age
 
-with col2:
-    st.subheader("⭐ Loyalty Program Performance")
-    loyalty_sales = filtered_df[filtered_df['Loyalty_Tier'] != 'None'].groupby('Loyalty_Tier')['Final_Amount'].sum().reset_index()
-    
+def loyalty_sales():
+    loyalty_sales = view.rollup('Loyalty_Tier', 'Final_Amount').reset_index()
+    return loyalty_sales[loyalty_sales['Loyalty_Tier'] != 'None']
+
+def loyalty_chart(loyalty_sales):
+    import plotly.express as px
     fig_loyalty = px.pie(
         loyalty_sales,
         values='Final_Amount',
@@ -263,24 +568,23 @@ with col2:
     )
     fig_loyalty.update_traces(textposition='inside', textinfo='percent+label')
     fig_loyalty.update_layout(height=400)
-    st.plotly_chart(fig_loyalty, use_container_width=True)
-
-# Row 3: Ad Budget vs Sales and Nationality Distribution
-col1, col2 = st.columns(2)
-
-with col1:
-    st.subheader("💵 Advertisement Budget vs Sales")
-    ad_sales = filtered_df.groupby('Product_Category').agg({
-        'Final_Amount': 'sum',
-        'Monthly_Ad_Budget': 'first'
-    }).reset_index()
-    
+    return fig_loyalty
+
+def ad_sales():
+    ad_sales = derived.evaluate(selections, date_range, by='Product_Category')
+    ad_sales = ad_sales[['total_revenue', 'ad_budget', 'roi']].reset_index()
+    return ad_sales.rename(columns={'total_revenue': 'Final_Amount', 'ad_budget': 'Monthly_Ad_Budget'})
+
+def ad_chart(ad_sales):
+    import plotly.graph_objects as go
     fig_ad = go.Figure()
     fig_ad.add_trace(go.Bar(
         x=ad_sales['Product_Category'],
         y=ad_sales['Final_Amount'],
         name='Sales Revenue',
-        marker_color='#E31837'
+        marker_color='#E31837',
+        text=[f"ROI {roi:.1f}×" for roi in ad_sales['roi']],
+        textposition='outside'
     ))
     fig_ad.add_trace(go.Bar(
         x=ad_sales['Product_Category'],
@@ -295,13 +599,15 @@ with col1:
         yaxis_title='Amount (AED)',
         legend=dict(orientation='h', yanchor='bottom', y=1.02, xanchor='right', x=1)
     )
-    st.plotly_chart(fig_ad, use_container_width=True)
+    return fig_ad
 
-with col2:
-    st.subheader("🌐 Customer Nationality Distribution")
-    nationality_count = filtered_df['Nationality'].value_counts().reset_index()
+def nationality_count():
+    nationality_count = view.rollup('Nationality', stat='count').sort_values(ascending=False).reset_index()
     nationality_count.columns = ['Nationality', 'Count']
-    
+    return nationality_count
+
+def nationality_chart(nationality_count):
+    import plotly.express as px
     fig_nat = px.bar(
         nationality_count.head(8),
         x='Count',
@@ -311,16 +617,15 @@ with col2:
         color_continuous_scale='Viridis'
     )
     fig_nat.update_layout(height=400, showlegend=False)
-    st.plotly_chart(fig_nat, use_container_width=True)
+    return fig_nat
 
-# Row 4: Income Distribution and Transaction Trends
-col1, col2 = st.columns(2)
+def income_sales():
+    return view.rollup('Income_Bracket', 'Final_Amount').reset_index()
 
-with col1:
-    st.subheader("💰 Sales by Income Bracket")
-    
-    fig_income = px.histogram(
-        filtered_df,
+def income_chart(income_sales):
+    import plotly.express as px
+    fig_income = px.bar(
+        income_sales,
         x='Income_Bracket',
         y='Final_Amount',
         color='Income_Bracket',
@@ -328,22 +633,89 @@ with col1:
         color_discrete_sequence=px.colors.sequential.Greens
     )
     fig_income.update_layout(height=400, showlegend=False)
-    st.plotly_chart(fig_income, use_container_width=True)
+    return fig_income
+
+def daily_sales():
+    return view.rollup('Transaction_Date', 'Final_Amount')
 
-with col2:
-    st.subheader("📈 Daily Transaction Trends")
-    daily_sales = filtered_df.groupby('Transaction_Date')['Final_Amount'].sum().reset_index()
-    
+def granularity_control():
+    return st.selectbox("Granularity", ['Auto', 'Day', 'Week', 'Month'], key='trend_granularity')
+
+def trend_chart(daily_sales, granularity):
+    import plotly.express as px
+    from chart_data import time_series
+    # Resampled and LTTB-downsampled on the server so the payload stays bounded
+    trend, granularity = time_series(daily_sales, granularity)
+    daily_sales = trend.reset_index()
     fig_trend = px.line(
         daily_sales,
         x='Transaction_Date',
         y='Final_Amount',
-        labels={'Final_Amount': 'Revenue (AED)', 'Transaction_Date': 'Date'},
-        markers=True
+        labels={'Final_Amount': 'Revenue (AED)', 'Transaction_Date': granularity},
+        markers=len(daily_sales) <= 100
     )
     fig_trend.update_traces(line_color='#E31837', line_width=3)
     fig_trend.update_layout(height=400)
-    st.plotly_chart(fig_trend, use_container_width=True)
+    return fig_trend
+
+# (name, title, data, figure, control) of the two panels in each tab; a
+# control is a widget whose value is passed on to the figure
+SECTIONS = {
+    "📊 Sales": [
+        ('chart_category', "📊 Sales by Product Category", category_sales, category_chart, None),
+        ('chart_city', "🌍 Sales Distribution by City", city_sales, city_chart, None),
+    ],
+    "👥 Customers": [
+        ('chart_age', "👥 Customer Demographics - Age Groups", age_sales, age_chart, None),
+        ('chart_loyalty', "⭐ Loyalty Program Performance", loyalty_sales, loyalty_chart, None),
+    ],
+    "💵 Marketing": [
+        ('chart_ad_budget', "💵 Advertisement Budget vs Sales", ad_sales, ad_chart, None),
+        ('chart_nationality', "🌐 Customer Nationality Distribution", nationality_count, nationality_chart, None),
+    ],
+    "📈 Trends": [
+        ('chart_income', "💰 Sales by Income Bracket", income_sales, income_chart, None),
+        ('chart_trend', "📈 Daily Transaction Trends", daily_sales, trend_chart, granularity_control),
+    ],
+}
+
+tabs = st.tabs(list(SECTIONS), key='section', on_change='rerun')
+for tab, panels in zip(tabs, SECTIONS.values()):
+    if not tab.open:
+        continue
+    with tab:
+        columns = st.columns(2)
+        settings = {}
+        for column, (name, title, _, _, control) in zip(columns, panels):
+            with column:
+                st.subheader(title)
+                settings[name] = control() if control else None
+        # Figures are snapshotted per control value, e.g. "chart_trend:Auto"
+        figure_keys = {name: name if settings[name] is None else f'{name}:{settings[name]}' for name, *_ in panels}
+        cached = snapshot.get('figures', {}) if from_snapshot else {}
+
+        missing = [panel for panel in panels if figure_keys[panel[0]] not in cached]
+        if missing:
+            filtered_view()
+            with rerun.stage('panel_data'):
+                data = results.get_many('sales:panels', version,
+                                        {(name, filter_key): compute for name, _, compute, _, _ in missing})
+
+        for column, (name, _, _, figure, control) in zip(columns, panels):
+            with column, rerun.stage(name):
+                if figure_keys[name] in cached:
+                    fig = json.loads(cached[figure_keys[name]])
+                else:
+                    fig = figure(data[(name, filter_key)], *([settings[name]] if control else []))
+                    if at_defaults and snapshot_signature:
+                        snapshot_parts.setdefault('figures', {})[figure_keys[name]] = fig.to_json()
+                st.plotly_chart(rerun.widget(name, fig), width='stretch')
+
+if snapshot_parts:
+    update_snapshot(DATA_SOURCE, snapshot_signature, **snapshot_parts)
+
+rerun.finish()
+debug_panel(st.sidebar, rerun)
 
 # Footer
 st.markdown("---")
@@ -355,28 +727,11 @@ st.markdown("""
     """, unsafe_allow_html=True)
 '''
 
-with open(os.path.join(project_name, 'app.py'), 'w', encoding='utf-8') as f:
-    f.write(app_code)
-print("   ✅ Created app.py")
-
-# ============================================================================
-# 3. CREATE REQUIREMENTS.TXT
-# ============================================================================
-print("\n📦 Step 3: Creating requirements.txt...")
-
-requirements_content = """streamlit==1.31.0
-pandas==2.1.4
-numpy==1.26.3
-plotly==5.18.0"""
-
-with open(os.path.join(project_name, 'requirements.txt'), 'w') as f:
-    f.write(requirements_content)
-print("   ✅ Created requirements.txt")
-
-# ============================================================================
-# 4. CREATE README.MD
-# ============================================================================
-print("\n📄 Step 4: Creating README.md...")
+requirements_content = """streamlit==1.65.0
+pandas==3.0.6
+numpy==2.4.6
+pyarrow==25.0.1
+plotly==7.1.0"""
 
 readme_content = """# 🛒 Lulu Hypermarket UAE - Sales Analytics Dashboard
 
@@ -385,7 +740,7 @@ A comprehensive, interactive sales dashboard for Lulu Stores in UAE, built with
 ## 📊 Dashboard Features
 
 ### Data Components
-1. **Transactional Sales Data** - 100 transactions with complete details
+1. **Transactional Sales Data** - {rows} transactions with complete details
 2. **Demographic Analysis** - Customer segmentation by age, gender, nationality, income
 3. **Loyalty Program Metrics** - Bronze, Silver, Gold, Platinum tier tracking
 4. **Advertisement Budget Analysis** - ROI tracking for all product categories
@@ -395,6 +750,10 @@ A comprehensive, interactive sales dashboard for Lulu Stores in UAE, built with
 - **Pie Charts**: City-wise sales, loyalty tier performance
 - **Histograms**: Age groups, income brackets
 - **Line Charts**: Daily transaction trends
+- Charts are grouped into tabs, and only the open tab is computed and drawn
+- A new server process paints the default view from `lulu_sales_data.snapshot.json`
+  (shipped with the package) and loads the dataset once a filter changes
+  (`LULU_FAST_STARTUP=0` turns this off)
 
 ### Interactive Filters
 - Date range selection
@@ -402,6 +761,9 @@ A comprehensive, interactive sales dashboard for Lulu Stores in UAE, built with
 - Product categories
 - Loyalty tiers
 - Gender-based analysis
+- ⚡ Approximate mode: KPIs (including unique customers and the median sale) and
+  revenue by nationality, income or age from samples and sketches, with 95% error
+  bars; "Refine to exact" computes the exact KPIs in the background
 
 ## 🚀 Quick Start
 
@@ -420,6 +782,20 @@ A comprehensive, interactive sales dashboard for Lulu Stores in UAE, built with
 3. **Open browser**
    Navigate to http://localhost:8501
 
+### Several Server Processes
+
+Publish the dataset once per host and let every Streamlit process map it
+read-only instead of loading its own copy:
+
+```bash
+python shared_dataset.py --dir /dev/shm/lulu_sales --layout package &
+LULU_SHARED_DIR=/dev/shm/lulu_sales streamlit run app.py --server.port 8501
+LULU_SHARED_DIR=/dev/shm/lulu_sales streamlit run app.py --server.port 8502
+```
+
+The publisher republishes whenever the CSV changes; the dashboards switch to
+the new copy on their next rerun.
+
 ### Deploy to Streamlit Cloud
 
 1. **Push to GitHub**
@@ -444,7 +820,24 @@ A comprehensive, interactive sales dashboard for Lulu Stores in UAE, built with
 ```
 lulu_sales_dashboard/
 ├── app.py                    # Main dashboard application
-├── lulu_sales_data.csv      # Synthetic sales data (100 rows)
+├── sales_schema.py           # Column mapping and types of both CSV layouts
+├── sales_storage.py          # CSV -> Parquet storage layer
+├── filter_index.py           # Bitmap index for the filters
+├── data_cube.py              # Pre-aggregated cube behind KPIs and charts
+├── dataset_cache.py          # Process-wide shared dataset cache
+├── incremental.py            # Incremental ingestion of new sales
+├── aggregation.py            # Chunked, mergeable partial aggregates
+├── parallel_agg.py           # Multi-core filter + aggregate
+├── process_pool.py           # Worker processes that never re-run app.py
+├── chart_data.py             # Resampling and LTTB downsampling for charts
+├── instrumentation.py        # Opt-in rerun timings and metrics export
+├── shared_dataset.py         # One memory-mapped dataset for several server processes
+├── approximate.py            # Samples and sketches behind the approximate mode
+├── result_cache.py           # Memo of computed results per filter selection
+├── startup_snapshot.py       # KPIs and figures of the default view for a fast first paint
+├── derived_metrics.py        # KPIs and ratios declared once, computed in one fused pass
+├── lulu_sales_data.csv      # Synthetic sales data ({rows} rows)
+├── lulu_sales_data.parquet  # Columnar copy loaded by the dashboard, in date order
 ├── requirements.txt          # Python dependencies
 └── README.md                # This file
 ```
@@ -456,6 +849,15 @@ lulu_sales_dashboard/
 - **Average Transaction Value**
 - **Loyalty Member Percentage**
 - **Total Discounts Given**
+- **ROI**: revenue per AED of monthly ad budget
+- **Discount Rate**: discounts as a share of the pre-discount amount
+- **Points Redeemed**: loyalty points redeemed as a share of points earned
+- **Revenue per Customer**
+
+New ratios are declared once in `dashboard_metrics()` in `app.py`, from the base
+aggregates in `derived_metrics.py` (`total`, `rows`, `distinct`, `per_group`).
+To show one as a tile, add a `(metric, label, format, help)` row to `KPI_TILES`;
+tiles are laid out five per row.
 
 ## 📊 Data Schema
 
@@ -472,7 +874,7 @@ Modify in `app.py`:
 - Colors (Lulu brand: Red #E31837, Gold #FFD700)
 - Filter options
 - Chart configurations
-- KPI metrics
+- KPI metrics (`dashboard_metrics()` and `KPI_TILES`)
 
 ## 🛠️ Technologies
 
@@ -491,15 +893,6 @@ This dashboard uses synthetic data for demonstration. Replace with actual sales
 **Purpose**: Stakeholder presentations and data-driven decision making
 """
 
-with open(os.path.join(project_name, 'README.md'), 'w', encoding='utf-8') as f:
-    f.write(readme_content)
-print("   ✅ Created README.md")
-
-# ============================================================================
-# 5. CREATE .GITIGNORE
-# ============================================================================
-print("\n🚫 Step 5: Creating .gitignore...")
-
 gitignore_content = """# Python
 __pycache__/
 *.py[cod]
@@ -525,56 +918,148 @@ Thumbs.db
 # Environment
 .env"""
 
-with open(os.path.join(project_name, '.gitignore'), 'w') as f:
-    f.write(gitignore_content)
-print("   ✅ Created .gitignore")
-
-# ============================================================================
-# 6. CREATE ZIP FILE
-# ============================================================================
-print("\n📦 Step 6: Creating ZIP file...")
-
-zip_filename = f"{project_name}.zip"
-
-with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
-    for root, dirs, files in os.walk(project_name):
-        for file in files:
-            file_path = os.path.join(root, file)
-            arcname = os.path.relpath(file_path, os.path.dirname(project_name))
-            zipf.write(file_path, arcname)
-            print(f"   📄 Added: {arcname}")
-
-print(f"\n   ✅ Created: {zip_filename}")
-
-# ============================================================================
-# SUMMARY
-# ============================================================================
-print("\n" + "=" * 70)
-print("✨ PROJECT CREATION COMPLETE!")
-print("=" * 70)
-print(f"\n📁 Project Folder: {project_name}/")
-print(f"📦 ZIP File: {zip_filename}")
-print(f"\n📊 Data Summary:")
-print(f"   - Total Transactions: {len(df)}")
-print(f"   - Total Revenue: AED {df['Final_Amount'].sum():,.2f}")
-print(f"   - Date Range: {df['Transaction_Date'].min()} to {df['Transaction_Date'].max()}")
-print(f"   - Cities: {len(df['City'].unique())}")
-print(f"   - Product Categories: {len(df['Product_Category'].unique())}")
-
-print(f"\n📦 Package Contents:")
-print(f"   ✅ app.py (Streamlit Dashboard)")
-print(f"   ✅ lulu_sales_data.csv (100 rows)")
-print(f"   ✅ requirements.txt")
-print(f"   ✅ README.md")
-print(f"   ✅ .gitignore")
-
-print(f"\n🚀 Next Steps:")
-print(f"   1. Extract {zip_filename}")
-print(f"   2. cd {project_name}")
-print(f"   3. pip install -r requirements.txt")
-print(f"   4. streamlit run app.py")
-print(f"\n   OR deploy to Streamlit Cloud (see README.md)")
-
-print("\n" + "=" * 70)
-print("🎉 Ready to impress your stakeholders!")
-print("=" * 70)
\ No newline at end of file
+def main(argv=None):
+    args = parse_args(argv)
+
+    print("🚀 Creating Complete Lulu Sales Dashboard Package...")
+    print("=" * 70)
+
+    # Create project directory
+    project_name = "lulu_sales_dashboard"
+    if not os.path.exists(project_name):
+        os.makedirs(project_name)
+
+    # ========================================================================
+    # 1. GENERATE SYNTHETIC DATA
+    # ========================================================================
+    print(f"\n📊 Step 1: Generating synthetic sales data ({args.rows:,} rows)...")
+
+    archive_filename = f"{project_name}.{args.format}"
+    archive = open_archive(archive_filename, args.format, args.compress_threads)
+
+    def report(member):
+        print(f"   📄 Added: {member['name']} ({format_bytes(member['bytes'])} -> "
+              f"{format_bytes(member['compressed_bytes'])}, {format_bytes(member['bytes_per_second'])}/s)")
+
+    csv_path = os.path.join(project_name, 'lulu_sales_data.csv')
+    parquet_path = os.path.join(project_name, 'lulu_sales_data.parquet')
+    if args.stream:
+        # Both members are generated from the same seed and end date, so the second pass
+        # reproduces the first exactly; nothing touches the project folder
+        end_date = args.end_date or datetime.now().date()
+        with archive.open(csv_path) as f:
+            summary = write_sales_csv(f, args.rows, args.chunk_size, args.seed, end_date)
+        report(archive.members[-1])
+        with archive.open(parquet_path, compress=False) as f:
+            write_parquet(generate_sales_chunks(args.rows, args.chunk_size, args.seed, end_date), f)
+        report(archive.members[-1])
+        for stale in (csv_path, parquet_path):
+            if os.path.exists(stale):
+                os.remove(stale)
+    else:
+        summary = write_sales_csv(csv_path, args.rows, args.chunk_size, args.seed, args.end_date)
+        convert_csv(csv_path, parquet_path)
+    print(f"   ✅ Generated {summary['rows']:,} transactions")
+    print(f"   💰 Total Revenue: AED {summary['revenue']:,.2f}")
+    print(f"   ✅ Converted to {os.path.basename(parquet_path)}")
+
+    # ========================================================================
+    # 2. CREATE APP.PY (MAIN DASHBOARD)
+    # ========================================================================
+    print("\n📱 Step 2: Creating Streamlit dashboard (app.py)...")
+
+    with open(os.path.join(project_name, 'app.py'), 'w', encoding='utf-8') as f:
+        f.write(app_code)
+    print("   ✅ Created app.py")
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    for module in SUPPORT_MODULES:
+        shutil.copy(os.path.join(here, module), os.path.join(project_name, module))
+        print(f"   ✅ Added {module}")
+
+    if not args.stream:
+        # The first visitor then gets the default view without loading the dataset
+        snapshot_path = paint_snapshot(project_name)
+        if snapshot_path:
+            print(f"   ✅ Painted the default view into {os.path.basename(snapshot_path)}")
+        else:
+            print("   ⚠️ Skipped the startup snapshot (Streamlit is not installed here or fast startup is off)")
+
+    # ========================================================================
+    # 3. CREATE REQUIREMENTS.TXT
+    # ========================================================================
+    print("\n📦 Step 3: Creating requirements.txt...")
+
+    with open(os.path.join(project_name, 'requirements.txt'), 'w') as f:
+        f.write(requirements_content)
+    print("   ✅ Created requirements.txt")
+
+    # ========================================================================
+    # 4. CREATE README.MD
+    # ========================================================================
+    print("\n📄 Step 4: Creating README.md...")
+
+    with open(os.path.join(project_name, 'README.md'), 'w', encoding='utf-8') as f:
+        f.write(readme_content.replace('{rows}', f"{summary['rows']:,}"))
+    print("   ✅ Created README.md")
+
+    # ========================================================================
+    # 5. CREATE .GITIGNORE
+    # ========================================================================
+    print("\n🚫 Step 5: Creating .gitignore...")
+
+    with open(os.path.join(project_name, '.gitignore'), 'w') as f:
+        f.write(gitignore_content)
+    print("   ✅ Created .gitignore")
+
+    # ========================================================================
+    # 6. CREATE ZIP FILE
+    # ========================================================================
+    print(f"\n📦 Step 6: Creating {args.format} archive ({args.compress_threads} compression threads)...")
+
+    with archive:
+        for root, dirs, files in os.walk(project_name):
+            for file in files:
+                file_path = os.path.join(root, file)
+                arcname = os.path.relpath(file_path, os.path.dirname(project_name))
+                report(archive.add_file(file_path, arcname))
+
+    print(f"\n   ✅ Created: {archive_filename}")
+
+    # ========================================================================
+    # SUMMARY
+    # ========================================================================
+    print("\n" + "=" * 70)
+    print("✨ PROJECT CREATION COMPLETE!")
+    print("=" * 70)
+    print(f"\n📁 Project Folder: {project_name}/")
+    print(f"📦 Archive: {archive_filename}")
+    print(f"\n📊 Data Summary:")
+    print(f"   - Total Transactions: {summary['rows']:,}")
+    print(f"   - Total Revenue: AED {summary['revenue']:,.2f}")
+    print(f"   - Date Range: {summary['min_date']:%Y-%m-%d} to {summary['max_date']:%Y-%m-%d}")
+    print(f"   - Cities: {len(summary['cities'])}")
+    print(f"   - Product Categories: {len(summary['categories'])}")
+
+    print(f"\n📦 Package Contents:")
+    print(f"   ✅ app.py (Streamlit Dashboard)")
+    print(f"   ✅ lulu_sales_data.csv ({summary['rows']:,} rows)")
+    print(f"   ✅ lulu_sales_data.parquet")
+    print(f"   ✅ requirements.txt")
+    print(f"   ✅ README.md")
+    print(f"   ✅ .gitignore")
+
+    print(f"\n🚀 Next Steps:")
+    print(f"   1. Extract {archive_filename}")
+    print(f"   2. cd {project_name}")
+    print(f"   3. pip install -r requirements.txt")
+    print(f"   4. streamlit run app.py")
+    print(f"\n   OR deploy to Streamlit Cloud (see README.md)")
+
+    print("\n" + "=" * 70)
+    print("🎉 Ready to impress your stakeholders!")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Pre-aggregated data cube for the dashboards.
+
+At load time the transactions are grouped once by every low-cardinality
+dimension the dashboards filter or chart on, keeping the row count and the
+sum and sum of squares of each measure per cell. KPIs and charts are then
+answered by rolling up the cells that match the current filters, so their
+cost depends on the number of cells rather than the number of transactions.
+Cubes over disjoint sets of rows merge cell-wise, and new transactions are
+added by aggregating just the new rows and folding their cells in by key. Cells are kept in date order, so a
+date range is found by binary search instead of comparing every cell.
+"""
+import numpy as np
+import pandas as pd
+
+from filter_index import FilterIndex
+from sales_storage import concat_frames, date_bounds
+
+
+class SalesCube:
+    def __init__(self, df, dimensions, measures, date_dimension=None):
+        self.dimensions = list(dimensions)
+        self.measures = list(measures)
+        self.date_dimension = date_dimension
+
+        # float64 for the aggregates even when the source columns are float32
+        values = {m: df[m].astype('float64') for m in self.measures}
+        squares = {f'{m}_sq': values[m] ** 2 for m in self.measures}
+        frame = pd.DataFrame({**{d: df[d] for d in self.dimensions}, **values, **squares})
+
+        aggregations = {'count': (self.measures[0], 'size')}
+        for m in self.measures:
+            aggregations[f'{m}_sum'] = (m, 'sum')
+            aggregations[f'{m}_sumsq'] = (f'{m}_sq', 'sum')
+
+        self._set_cells(frame.groupby(self.dimensions, observed=True, sort=False).agg(**aggregations).reset_index())
+
+    def _set_cells(self, cells):
+        if self.date_dimension is not None:
+            cells = cells.sort_values(self.date_dimension, kind='stable', ignore_index=True)
+        self.cells = cells
+        self.index = FilterIndex(cells, [d for d in self.dimensions if d != self.date_dimension])
+
+    @property
+    def nbytes(self):
+        return int(self.cells.memory_usage(index=True, deep=True).sum()) + self.index.nbytes
+
+    def _like(self):
+        cube = SalesCube.__new__(SalesCube)
+        cube.dimensions, cube.measures, cube.date_dimension = self.dimensions, self.measures, self.date_dimension
+        return cube
+
+    def merge(self, *others):
+        """Return a new cube combining the cells of this cube and ``others`` (same layout)."""
+        cells = concat_frames([self.cells] + [other.cells for other in others])
+        cells = cells.groupby(self.dimensions, observed=True, sort=False).sum().reset_index()
+        merged = self._like()
+        merged._set_cells(cells)
+        return merged
+
+    def add(self, df):
+        """Return a new cube that also counts the transactions in ``df``.
+
+        Only ``df`` is grouped. Its cells are matched by key against the
+        existing cells dated on or after its first date, which is a short tail
+        of the date-ordered cells when new sales are appended. Matching cells
+        get the new counts and sums added; the others are appended in date
+        order and only they are added to the filter index. Cells dated before
+        the newest existing one (a backfill) cannot be appended in order, so
+        that case falls back to :meth:`merge`.
+        """
+        delta = SalesCube(df, self.dimensions, self.measures, self.date_dimension)
+        if not len(delta.cells):
+            return self
+        if not len(self.cells):
+            return delta
+
+        start, last = 0, None
+        if self.date_dimension is not None:
+            dates = self.cells[self.date_dimension].to_numpy()
+            start = int(np.searchsorted(dates, delta.cells[self.date_dimension].to_numpy()[0], 'left'))
+            last = dates[-1]
+
+        def keys(cells):
+            return pd.MultiIndex.from_arrays([cells[d].to_numpy(dtype=object) for d in self.dimensions])
+
+        matched = keys(self.cells.iloc[start:]).get_indexer(keys(delta.cells))
+        hit = matched >= 0
+        new = delta.cells[~hit]
+        if len(new) and last is not None:
+            new_first = new[self.date_dimension].to_numpy()[0]
+            if np.isnat(last) or np.isnat(new_first) or new_first < last:
+                return self.merge(delta)
+
+        # Cell keys are unique, so the matched positions are too
+        positions = start + matched[hit]
+        updated = {}
+        for column in self.cells.columns.difference(self.dimensions, sort=False):
+            values = self.cells[column].to_numpy().copy()
+            values[positions] += delta.cells[column].to_numpy()[hit]
+            updated[column] = values
+        cells = self.cells.assign(**updated)
+
+        added = self._like()
+        if len(new):
+            added.cells = concat_frames([cells, new])
+            added.index = self.index.append(new)
+        else:
+            added.cells, added.index = cells, self.index
+        return added
+
+    def filter(self, selections=None, date_range=None):
+        """Return a :class:`CubeView` over the cells matching the filters.
+
+        ``selections`` maps dimensions to the selected values; ``date_range`` is
+        an inclusive ``(start, end)`` pair applied to ``date_dimension``.
+        """
+        positions = self.index.positions(selections or {})
+        if date_range is not None:
+            # The range is one slice of the date-ordered cells; the matching
+            # positions (sorted too) are cut to it by a second binary search
+            start, stop = date_bounds(self.cells[self.date_dimension].to_numpy(), date_range)
+            positions = positions[np.searchsorted(positions, start):np.searchsorted(positions, stop)]
+        return CubeView(self.cells.iloc[positions], self.measures)
+
+    def date_span(self):
+        """``(first, last)`` date of ``date_dimension`` in the cube, without scanning the rows."""
+        dates = self.cells[self.date_dimension].dropna()
+        return dates.iloc[0], dates.iloc[-1]
+
+
+class CubeView:
+    def __init__(self, cells, measures):
+        self.cells = cells
+        self.measures = measures
+
+    def count(self):
+        return int(self.cells['count'].sum())
+
+    def sum(self, measure):
+        return float(self.cells[f'{measure}_sum'].sum())
+
+    def mean(self, measure):
+        count = self.count()
+        return self.sum(measure) / count if count else 0.0
+
+    def std(self, measure):
+        count = self.count()
+        if count < 2:
+            return 0.0
+        total, squares = self.sum(measure), float(self.cells[f'{measure}_sumsq'].sum())
+        return float(np.sqrt(max(squares - total * total / count, 0.0) / (count - 1)))
+
+    def rollup(self, by, measure=None, stat='sum'):
+        """Aggregate the view by one or more dimensions.
+
+        ``stat`` is one of ``'sum'``, ``'count'``, ``'mean'`` or ``'std'``; the
+        result is a Series indexed by ``by`` and named after the measure (or
+        ``'count'``).
+        """
+        groups = self.cells.groupby(by, observed=True)
+        if stat == 'count':
+            return groups['count'].sum().rename('count')
+
+        sums = groups[['count', f'{measure}_sum', f'{measure}_sumsq']].sum()
+        count, total, squares = sums['count'], sums[f'{measure}_sum'], sums[f'{measure}_sumsq']
+        if stat == 'sum':
+            result = total
+        elif stat == 'mean':
+            result = total / count
+        elif stat == 'std':
+            variance = (squares - total * total / count) / (count - 1)
+            result = np.sqrt(variance.clip(lower=0))
+        else:
+            raise ValueError(f"unknown stat {stat!r}")
+        return result.rename(measure)
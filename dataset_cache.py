@@ -0,0 +1,168 @@
+"""Process-wide cache of loaded datasets shared by every dashboard session.
+
+Each dataset is registered once with the file it comes from and a loader
+that turns the file into whatever the dashboard needs (frame, filter index,
+cube...). ``get`` hands every caller shallow views of the same loaded
+frames with their NumPy buffers marked read-only, so sessions share one copy
+of the data instead of each receiving a pickled duplicate. When the file's size or mtime changes the
+loader runs again and the new object is swapped in atomically. When several
+datasets are registered, the least recently used ones are evicted to stay
+under ``max_bytes``.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_BYTES = int(os.environ.get('LULU_CACHE_MAX_BYTES', 4 << 30))
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _leaves(value):
+    if isinstance(value, (tuple, list)):
+        for item in value:
+            yield from _leaves(item)
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _leaves(item)
+    else:
+        yield value
+
+
+def _frames(value):
+    return (item for item in _leaves(value) if isinstance(item, pd.DataFrame))
+
+
+def estimate_nbytes(value):
+    """Memory held by the DataFrames inside ``value`` (frames, tuples, lists, dicts).
+
+    Everything else that reports its own ``nbytes`` is counted too: arrays, a
+    :class:`compact_table.CompactTable`, and the cube, filter index, metric set
+    and sketches loaded alongside the frame.
+    """
+    total = 0
+    for item in _leaves(value):
+        if isinstance(item, pd.DataFrame):
+            total += int(item.memory_usage(index=True, deep=True).sum())
+        elif isinstance(getattr(item, 'nbytes', None), (int, np.integer)):
+            total += int(item.nbytes)
+    return total
+
+
+def freeze(value):
+    """Mark the NumPy buffers behind every DataFrame in ``value`` read-only."""
+    for frame in _frames(value):
+        for column in frame.columns:
+            array = frame[column].values
+            if isinstance(array, pd.Categorical):
+                array = array.codes
+            if not isinstance(array, np.ndarray) or array.dtype == object:
+                continue
+            # Walk up to the block that owns the memory so writes through pandas fail too
+            while isinstance(array.base, np.ndarray):
+                array = array.base
+            array.flags.writeable = False
+    return value
+
+
+def views(value):
+    """Copy of the ``value`` structure whose DataFrames are zero-copy views of the originals.
+
+    Writes to a view either fail on the read-only buffers or copy just that
+    view's data, never the shared frame other sessions are reading.
+    """
+    if isinstance(value, pd.DataFrame):
+        return value.copy(deep=False)
+    if isinstance(value, tuple):
+        return tuple(views(item) for item in value)
+    if isinstance(value, list):
+        return [views(item) for item in value]
+    if isinstance(value, dict):
+        return {key: views(item) for key, item in value.items()}
+    return value
+
+
+class _Entry:
+    def __init__(self, path, loader):
+        self.path = path
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.value = None
+        self.signature = None
+        self.nbytes = 0
+        self.version = 0
+
+
+class DatasetCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, name, path, loader):
+        """Register ``loader(path)`` under ``name``; re-registering keeps the loaded data."""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry.path != path:
+                self._entries[name] = _Entry(path, loader)
+            else:
+                entry.loader = loader
+
+    def get(self, name):
+        """Return the loaded dataset, (re)loading it if the file changed since the last load."""
+        with self._lock:
+            entry = self._entries[name]
+            self._entries.move_to_end(name)
+
+        signature = _file_signature(entry.path)
+        if entry.value is not None and entry.signature == signature:
+            self.hits += 1
+            return views(entry.value)
+
+        with entry.lock:
+            # Another session may have reloaded it while we waited for the lock
+            signature = _file_signature(entry.path)
+            if entry.value is None or entry.signature != signature:
+                self.misses += 1
+                value = freeze(entry.loader(entry.path))
+                entry.value, entry.signature = value, signature
+                entry.nbytes = estimate_nbytes(value)
+                entry.version += 1
+            else:
+                self.hits += 1
+            value = entry.value
+
+        self._evict(keep=name)
+        return views(value)
+
+    def version(self, name):
+        """Load counter for ``name``; it changes every time the dataset is reloaded."""
+        return self._entries[name].version
+
+    def invalidate(self, name):
+        entry = self._entries[name]
+        with entry.lock:
+            entry.value, entry.signature, entry.nbytes = None, None, 0
+
+    def nbytes(self):
+        return sum(entry.nbytes for entry in self._entries.values())
+
+    def _evict(self, keep):
+        with self._lock:
+            for name, entry in list(self._entries.items()):
+                if self.nbytes() <= self.max_bytes:
+                    break
+                if name != keep and entry.value is not None:
+                    entry.value, entry.signature, entry.nbytes = None, None, 0
+
+
+# Shared by every session of the Streamlit server (modules are imported once per process)
+datasets = DatasetCache()
@@ -0,0 +1,267 @@
+"""Derived metrics declared once and computed together in one pass.
+
+A metric is a ratio (or a plain value) of base aggregates:
+
+* ``total(*columns, where=flag)``: the sum of the columns, optionally only over rows where a flag column is true;
+* ``rows(where=flag)``: the row count;
+* ``distinct(column)``: the number of distinct values;
+* ``per_group(column, by)``: a constant held per value of ``by`` (like a category's monthly ad budget), summed
+  over the groups present.
+
+:class:`MetricSet` compiles a dashboard's metrics into the distinct base
+aggregates they need. At load time the summed columns are stacked into one
+row-major float32 matrix, and the filter columns get a bitmap index. Per
+filter state, the matching rows of the matrix are gathered once and reduced
+once, in float64: a column sum, or a single ``bincount`` over
+group-and-aggregate cells when grouped. So every metric comes out of the
+same pass. A metric built from aggregates that are already declared costs
+nothing extra, and a new sum adds a column to the pass instead of another
+scan and filtered copy. Distinct counts and per-group constants take one
+more pass over an integer code column each.
+
+Besides the bitmaps, a set holds 4 bytes per row for each summed column,
+each code column and the dates (as day numbers). The arrays have spare
+capacity, like :meth:`filter_index.FilterIndex.append`'s bitmaps, so
+:meth:`MetricSet.add` writes just the new rows.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from filter_index import FilterIndex
+
+# Day number of a missing date: before every date, so no date range holds it
+MISSING_DAY = np.iinfo(np.int32).min
+
+
+def total(*columns, where=None):
+    return ('sum', columns, where)
+
+
+def rows(where=None):
+    return ('count', (), where)
+
+
+def distinct(column):
+    return ('distinct', (column,), None)
+
+
+def per_group(column, by):
+    return ('per_group', (column,), by)
+
+
+class Metric(namedtuple('Metric', ['numerator', 'denominator', 'scale'], defaults=(None, 1))):
+    """``scale * numerator / denominator`` (just ``scale * numerator`` without a denominator); 0 when
+    the denominator is 0."""
+
+
+def _write(array, start, values):
+    """``array`` with ``values`` written from row ``start`` on, grown (with room to spare) if it is too short.
+
+    Rows from ``start`` on are overwritten in place; only the first ``start``
+    rows are copied when the array grows.
+    """
+    stop = start + len(values)
+    if stop > len(array):
+        grown = np.empty((max(stop, 2 * len(array)),) + array.shape[1:], dtype=array.dtype)
+        grown[:start] = array[:start]
+        array = grown
+    array[start:stop] = values
+    return array
+
+
+def _day_numbers(dates):
+    days = np.asarray(dates.to_numpy()).astype('datetime64[D]')
+    return np.where(np.isnat(days), MISSING_DAY, days.astype(np.int64)).astype(np.int32)
+
+
+def _day_number(date):
+    return int(np.datetime64(pd.Timestamp(date), 'D').astype(np.int64))
+
+
+class MetricSet:
+    """``metrics`` (``{name: Metric}``) compiled over the rows of ``df``.
+
+    :meth:`evaluate` answers them for the rows matching ``filters`` selections
+    and a ``date_column`` range, overall or per value of one of ``by``.
+    """
+
+    def __init__(self, df, metrics, filters=(), date_column=None, by=()):
+        self.metrics = dict(metrics)
+        self.filters = list(filters)
+        self.date_column = date_column
+        self.by = list(by)
+
+        aggregates = []
+        for metric in self.metrics.values():
+            for aggregate in (metric.numerator, metric.denominator):
+                if aggregate is not None and aggregate not in aggregates:
+                    aggregates.append(aggregate)
+        # Sums (and flagged counts) become columns of the matrix; a plain count is the row count
+        self._summed = [a for a in aggregates if a[0] == 'sum' or (a[0] == 'count' and a[2] is not None)]
+        self._distinct = [a for a in aggregates if a[0] == 'distinct']
+        self._per_group = [a for a in aggregates if a[0] == 'per_group']
+
+        self._code_columns = list(dict.fromkeys(self.by + [a[1][0] for a in self._distinct]
+                                                + [a[2] for a in self._per_group]))
+        # Labels only ever grow, so sets extended from this one share them and
+        # each knows how many of them are its own
+        self._labels = {column: [] for column in self._code_columns}
+        self._label_codes = {column: {} for column in self._code_columns}
+        self._label_counts = {column: 0 for column in self._code_columns}
+        self._constants = {a: np.zeros(0) for a in self._per_group}
+        self.size = 0
+        self._values = np.zeros((0, len(self._summed)), dtype=np.float32)
+        self._codes = {column: np.zeros(0, dtype=np.int32) for column in self._code_columns}
+        self._days = np.zeros(0, dtype=np.int32)
+        self._last_day = None
+        self._date_ordered = True
+        self._extend(df)
+        self.index = FilterIndex(df, self.filters)
+
+    def _matrix(self, df):
+        matrix = np.empty((len(df), len(self._summed)), dtype=np.float32)
+        for i, (kind, columns, where) in enumerate(self._summed):
+            values = np.ones(len(df)) if kind == 'count' else sum(df[c].to_numpy(dtype='float64') for c in columns)
+            if where is not None:
+                values = values * df[where].to_numpy(dtype='float64')
+            matrix[:, i] = values
+        return matrix
+
+    def _encode(self, column, values):
+        """Codes of the Series ``values`` among ``column``'s labels; labels not seen before are added."""
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # The categories are mapped onto the labels, not every row
+            codes = values.cat.codes.to_numpy()
+            uniques = list(values.cat.categories)
+            if (codes < 0).any():
+                codes = np.where(codes < 0, len(uniques), codes)
+                uniques.append(None)
+        else:
+            codes, uniques = pd.factorize(values, use_na_sentinel=False)
+            uniques = [None if pd.isna(value) else value for value in uniques]
+        labels, lookup = self._labels[column], self._label_codes[column]
+        unseen = [value for value in uniques if value not in lookup]
+        lookup.update(zip(unseen, range(len(labels), len(labels) + len(unseen))))
+        labels.extend(unseen)
+        self._label_counts[column] = len(labels)
+        mapping = np.fromiter(map(lookup.__getitem__, uniques), dtype=np.int32, count=len(uniques))
+        return mapping[codes]
+
+    def _extend(self, df):
+        start = self.size
+        known = dict(self._label_counts)
+        self._values = _write(self._values, start, self._matrix(df))
+        for column in self._code_columns:
+            self._codes[column] = _write(self._codes[column], start, self._encode(column, df[column]))
+        for aggregate in self._per_group:
+            (column,), by = aggregate[1], aggregate[2]
+            # NaN until a group's first row is seen: a categorical's labels
+            # include categories that have no rows yet
+            constants = _write(self._constants[aggregate], known[by],
+                               np.full(self._label_counts[by] - known[by], np.nan))
+            # The first value seen per new group; groups seen before keep theirs
+            codes = self._codes[by][start:start + len(df)]
+            unset = np.flatnonzero(np.isnan(constants[codes]))
+            new_codes, first_rows = np.unique(codes[unset], return_index=True)
+            constants[new_codes] = df[column].to_numpy(dtype='float64')[unset[first_rows]]
+            self._constants[aggregate] = constants
+        if self.date_column is not None and len(df):
+            days = _day_numbers(df[self.date_column])
+            # Still date-ordered if the new rows are, and start no earlier than the last day so far
+            self._date_ordered = (self._date_ordered and (self._last_day is None or days[0] >= self._last_day)
+                                  and not (days[1:] < days[:-1]).any())
+            self._last_day = max(self._last_day if self._last_day is not None else MISSING_DAY, int(days.max()))
+            self._days = _write(self._days, start, days)
+        self.size += len(df)
+
+    def add(self, df):
+        """Return a new set that also counts the rows of ``df``, at a cost proportional to ``len(df)``.
+
+        The new rows go into the arrays' spare capacity, so this set keeps
+        answering for its own rows; only extend the newest set.
+        """
+        new = MetricSet.__new__(MetricSet)
+        new.__dict__.update(self.__dict__)
+        new._label_counts = dict(self._label_counts)
+        new._codes = dict(self._codes)
+        new._constants = dict(self._constants)
+        new._extend(df)
+        new.index = self.index.append(df)
+        return new
+
+    @property
+    def nbytes(self):
+        """Bytes held by the arrays (spare capacity included) and the filter index."""
+        arrays = [self._values, self._days, *self._codes.values(), *self._constants.values()]
+        return sum(array.nbytes for array in arrays) + self.index.nbytes
+
+    def positions(self, selections=None, date_range=None):
+        """Sorted positions of the rows matching ``selections`` and the inclusive ``date_range``."""
+        positions = self.index.positions(selections or {})
+        if date_range is None:
+            return positions
+        start, end = (_day_number(d) for d in date_range)
+        days = self._days[positions]
+        if self._date_ordered:
+            # Date-ordered rows (as loaded from the Parquet copy): cut by binary search
+            return positions[np.searchsorted(days, start, 'left'):np.searchsorted(days, end, 'right')]
+        return positions[(days >= start) & (days <= end)]
+
+    def _aggregates(self, positions, groups, group_count):
+        values = self._values[positions]
+        k = values.shape[1]
+        if groups is None:
+            sums = values.sum(axis=0, dtype=np.float64)[None, :]
+            counts = np.array([len(positions)], dtype='float64')
+        else:
+            # One bincount over (group, aggregate) cells sums every column per group at once
+            cells = (groups[:, None].astype(np.int64) * k + np.arange(k)).ravel()
+            sums = np.bincount(cells, weights=values.ravel(), minlength=group_count * k).reshape(group_count, k)
+            counts = np.bincount(groups, minlength=group_count)
+
+        # bincount gives int64 for empty weights; every aggregate is float64
+        result = {a: sums[:, i].astype('float64') for i, a in enumerate(self._summed)}
+        result[rows()] = counts.astype('float64')
+        group_codes = np.zeros(len(positions), dtype=np.int64) if groups is None else groups.astype(np.int64)
+        for aggregate in self._distinct:
+            column = aggregate[1][0]
+            codes = self._codes[column][positions]
+            distinct_count = self._label_counts[column] or 1
+            pairs = np.unique(group_codes * distinct_count + codes)
+            result[aggregate] = np.bincount(pairs // distinct_count, minlength=len(counts)).astype('float64')
+        for aggregate in self._per_group:
+            by = aggregate[2]
+            codes = self._codes[by][positions]
+            group_size = self._label_counts[by] or 1
+            present = np.unique(group_codes * group_size + codes)
+            result[aggregate] = np.bincount(present // group_size, minlength=len(counts),
+                                            weights=self._constants[aggregate][present % group_size]).astype('float64')
+        return result
+
+    def evaluate(self, selections=None, date_range=None, by=None):
+        """Every metric for the matching rows: a ``{name: float}`` dict, or with ``by`` (one of the
+        compiled ``by`` columns) a DataFrame indexed by its values, one column per metric."""
+        positions = self.positions(selections, date_range)
+        if by is None:
+            aggregates = self._aggregates(positions, None, 1)
+        else:
+            groups = self._codes[by][positions]
+            aggregates = self._aggregates(positions, groups, self._label_counts[by])
+
+        values = {}
+        for name, metric in self.metrics.items():
+            numerator = aggregates[metric.numerator] * metric.scale
+            if metric.denominator is None:
+                values[name] = numerator
+            else:
+                denominator = aggregates[metric.denominator]
+                values[name] = np.divide(numerator, denominator, out=np.zeros_like(numerator),
+                                         where=denominator != 0)
+
+        if by is None:
+            return {name: float(value[0]) for name, value in values.items()}
+        present = aggregates[rows()] > 0
+        labels = pd.Index(self._labels[by][:self._label_counts[by]], name=by)[present]
+        return pd.DataFrame({name: value[present] for name, value in values.items()}, index=labels)
@@ -0,0 +1,109 @@
+"""Bitmap index for the dashboard's multiselect filters.
+
+Built once when the dataset is loaded: for every filter column and every
+distinct value we keep a packed bitmap (one bit per row) of the rows holding
+that value. A filter selection is resolved by OR-ing the bitmaps of the
+selected values within a column and AND-ing across columns, which touches
+n/8 bytes per selected value instead of re-evaluating ``isin`` masks.
+New rows can be appended without rebuilding the existing bitmaps.
+"""
+import numpy as np
+import pandas as pd
+
+
+class FilterIndex:
+    def __init__(self, df, columns):
+        self.size = len(df)
+        self.columns = list(columns)
+        self._values = {}
+        self._bitmaps = {}
+        for column in self.columns:
+            codes, uniques = pd.factorize(df[column])
+            self._values[column] = list(uniques)
+            self._bitmaps[column] = {
+                value: np.packbits(codes == code) for code, value in enumerate(uniques)
+            }
+
+    def append(self, df):
+        """Return a new index over the existing rows followed by the rows of ``df``.
+
+        Bitmaps are grown with spare capacity and only the bytes covering the
+        new rows are written, so the cost is proportional to ``len(df)``. This
+        index keeps answering for its own rows; only extend the newest index.
+        """
+        new = FilterIndex.__new__(FilterIndex)
+        new.size = self.size + len(df)
+        new.columns = self.columns
+        new._values, new._bitmaps = {}, {}
+
+        start, shift, nbytes = self.size // 8, self.size % 8, (new.size + 7) // 8
+        for column in self.columns:
+            values, bitmaps = list(self._values[column]), dict(self._bitmaps[column])
+            codes, uniques = pd.factorize(df[column])
+            for code, value in enumerate(uniques):
+                if value not in bitmaps:
+                    values.append(value)
+                    bitmaps[value] = np.zeros(0, dtype=np.uint8)
+                # Leading zero bits line the new rows up with the partially used last byte
+                packed = np.packbits(np.concatenate([np.zeros(shift, dtype=bool), codes == code]))
+                bitmap = _reserve(bitmaps[value], nbytes)
+                bitmap[start:start + len(packed)] |= packed
+                bitmaps[value] = bitmap
+            new._values[column], new._bitmaps[column] = values, bitmaps
+        return new
+
+    @property
+    def nbytes(self):
+        """Bytes held by the bitmaps, spare capacity included."""
+        return sum(bitmap.nbytes for bitmaps in self._bitmaps.values() for bitmap in bitmaps.values())
+
+    def values(self, column):
+        """Distinct values of ``column`` in order of first appearance."""
+        return list(self._values[column])
+
+    def mask(self, selections):
+        """Packed bitmap of the rows matching every ``{column: selected values}`` entry.
+
+        Columns that are not mentioned, or whose selection covers every value,
+        do not restrict the result.
+        """
+        nbytes = (self.size + 7) // 8
+        result = None
+        for column, selected in selections.items():
+            bitmaps = self._bitmaps[column]
+            selected = set(selected)
+            if selected.issuperset(bitmaps):
+                continue
+
+            column_mask = np.zeros(nbytes, dtype=np.uint8)
+            for value in selected:
+                if value in bitmaps:
+                    # Bitmaps of values absent from later appends stop short of nbytes
+                    bitmap = bitmaps[value][:nbytes]
+                    column_mask[:len(bitmap)] |= bitmap
+
+            if result is None:
+                result = column_mask
+            else:
+                np.bitwise_and(result, column_mask, out=result)
+
+        if result is None:
+            result = np.packbits(np.ones(self.size, dtype=bool))
+        return result
+
+    def positions(self, selections):
+        """Row positions (sorted ``int64`` array) matching ``selections``."""
+        bits = np.unpackbits(self.mask(selections), count=self.size)
+        return np.flatnonzero(bits)
+
+    def count(self, selections):
+        return int(np.unpackbits(self.mask(selections), count=self.size).sum())
+
+
+def _reserve(bitmap, nbytes):
+    """``bitmap`` itself if it can hold ``nbytes``, else a zero-padded copy with room to grow."""
+    if len(bitmap) >= nbytes:
+        return bitmap
+    grown = np.zeros(max(nbytes, 2 * len(bitmap)), dtype=np.uint8)
+    grown[:len(bitmap)] = bitmap
+    return grown
@@ -0,0 +1,323 @@
+"""Incremental ingestion of new sales into an already loaded dataset.
+
+Stores keep writing transactions during the day, either by appending lines
+to the main CSV or by dropping new CSV/Parquet partition files (one per
+``Date``/``Transaction_Date``, e.g. ``2025-06-30.csv``) into a directory next
+to it. :class:`IncrementalDataset` loads the dataset once and then only reads
+what is new: the CSV bytes past the last ingested line and partition files it
+has not seen yet. The new rows are appended in place to column buffers with
+spare capacity (:class:`RowBuffer`), and handed to an ``extend`` callback
+that updates the filter index and cube by the delta. The result is swapped in
+atomically, so readers always see a consistent snapshot. A CSV that is
+truncated or replaced (rotated) is reloaded from scratch.
+"""
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from sales_schema import read_csv, source_columns, to_layout
+from sales_storage import concat_frames, load_sales_data
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = float(os.environ.get('LULU_INGEST_INTERVAL', 5))
+PARTITION_SUFFIXES = ('.csv', '.parquet')
+
+
+def partition_dir_for(csv_path):
+    return os.path.splitext(csv_path)[0] + '_partitions'
+
+
+def _codes_dtype(categories):
+    # The code width pandas itself picks for this many categories, so wrapping
+    # the buffer in a Categorical does not copy it
+    for dtype in (np.int8, np.int16, np.int32):
+        if len(categories) < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+class RowBuffer:
+    """A frame's columns in arrays with spare capacity, so appended rows are written in place.
+
+    :meth:`frame` returns a zero-copy DataFrame over the rows so far. Appends
+    only write past those rows (or into a larger copy when the capacity runs
+    out), so a frame handed out earlier keeps seeing exactly its own rows.
+    Categorical columns keep their codes, with new categories added at the
+    end; other non-numeric columns are held as object arrays.
+    """
+
+    def __init__(self, frame, growth=2.0):
+        self.size = 0
+        self.growth = growth
+        self.columns = list(frame.columns)
+        self._arrays = {}
+        self._categories = {}
+        for column in self.columns:
+            dtype = frame[column].dtype
+            if isinstance(dtype, pd.CategoricalDtype):
+                self._categories[column] = pd.Index([])
+                self._arrays[column] = np.zeros(0, dtype=np.int8)
+            else:
+                values = frame[column].to_numpy()
+                self._arrays[column] = np.zeros(0, dtype=values.dtype)
+        self.append(frame)
+
+    def _reserve(self, column, rows, dtype):
+        array = self._arrays[column]
+        if len(array) >= rows and array.dtype == dtype:
+            return array
+        grown = np.empty(max(rows, int(len(array) * self.growth), 1024), dtype=dtype)
+        grown[:self.size] = array[:self.size]
+        self._arrays[column] = grown
+        return grown
+
+    def append(self, delta):
+        """Write the rows of ``delta`` (same columns) after the current rows; returns :meth:`frame`."""
+        rows = self.size + len(delta)
+        for column in self.columns:
+            values = delta[column]
+            if column in self._categories:
+                values = values.astype('category')
+                categories, new_categories = self._categories[column], values.cat.categories
+                mapping = categories.get_indexer(new_categories)
+                unseen = mapping < 0
+                if unseen.any():
+                    mapping[unseen] = np.arange(len(categories), len(categories) + unseen.sum())
+                    categories = categories.append(new_categories[unseen])
+                    self._categories[column] = categories
+                raw = values.cat.codes.to_numpy()
+                # Missing values keep code -1
+                codes = np.full(len(raw), -1, dtype=np.int64)
+                codes[raw >= 0] = mapping[raw[raw >= 0]]
+                array = self._reserve(column, rows, _codes_dtype(categories))
+            else:
+                array = self._reserve(column, rows, self._arrays[column].dtype)
+                codes = values.to_numpy(dtype=array.dtype)
+            array[self.size:rows] = codes
+        self.size = rows
+        return self.frame()
+
+    def frame(self):
+        columns = {}
+        for column in self.columns:
+            values = self._arrays[column][:self.size]
+            if column in self._categories:
+                values = pd.Categorical.from_codes(values, categories=self._categories[column], validate=False)
+            elif values.dtype == object:
+                values = pd.Series(values, dtype=object, copy=False)
+            columns[column] = values
+        return pd.DataFrame(columns, copy=False)
+
+
+def conform(delta, like):
+    """Cast ``delta``'s columns to the dtypes of the already loaded frame ``like``."""
+    columns = {}
+    for column in like.columns:
+        dtype = like[column].dtype
+        values = delta[column]
+        if isinstance(dtype, pd.CategoricalDtype):
+            columns[column] = values.astype('category')
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            columns[column] = pd.to_datetime(values).astype(dtype)
+        else:
+            columns[column] = values.astype(dtype)
+    return pd.DataFrame(columns)
+
+
+def _read_parquet(path, columns=None, layout=None):
+    source, names = source_columns(pq.read_schema(path).names, columns, layout)
+    return to_layout(pq.read_table(path, columns=names), source, layout).to_pandas(date_as_object=False)
+
+
+def _offset_after_rows(path, rows):
+    """Byte offset just past the header and the first ``rows`` data lines of ``path``."""
+    remaining = rows + 1
+    offset = 0
+    with open(path, 'rb') as f:
+        while remaining:
+            block = f.read(1 << 24)
+            if not block:
+                break
+            count = block.count(b'\n')
+            if count < remaining:
+                remaining -= count
+                offset += len(block)
+                continue
+            position = -1
+            for _ in range(remaining):
+                position = block.index(b'\n', position + 1)
+            return offset + position + 1
+    return offset
+
+
+class IncrementalDataset:
+    """A dataset that follows appends to its CSV and new partition files.
+
+    ``build(df)`` turns the initial frame into the dashboard's data (for
+    example ``(df, index, cube)``); ``extend(data, delta, df)`` must return
+    the same structure updated with the new rows in ``delta``, ``df`` being
+    the whole frame with them appended. Columns are named as in ``layout``
+    (see :data:`sales_schema.LAYOUTS`) whichever layout the files have.
+    """
+
+    def __init__(self, csv_path, columns, build, extend, partition_dir=None, layout=None):
+        self.csv_path = csv_path
+        self.columns = list(columns)
+        self.build = build
+        self.extend = extend
+        self.partition_dir = partition_dir or partition_dir_for(csv_path)
+        self.layout = layout
+        self.version = 0
+        self.rows = 0
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        with self._lock:
+            self._load()
+        # Partitions that landed before startup
+        self.refresh()
+
+    def _load(self):
+        self._inode = os.stat(self.csv_path).st_ino
+        self._header = None
+        self._offset = None
+        self._seen = set()
+
+        frame = load_sales_data(self.csv_path, columns=self.columns, layout=self.layout)
+        self._like = frame.iloc[:0]
+        self._buffer = RowBuffer(frame)
+        self._data = self.build(self._buffer.frame())
+        self.rows = len(frame)
+        self._offset_rows = len(frame)
+
+    def _replaced(self):
+        """Whether the CSV was truncated below what was ingested, or replaced by another file."""
+        stat = os.stat(self.csv_path)
+        if stat.st_ino != self._inode or (self._offset is not None and stat.st_size < self._offset):
+            return True
+        if self._header is not None:
+            with open(self.csv_path, 'rb') as f:
+                return f.readline() != self._header
+        return False
+
+    def snapshot(self):
+        """The current dashboard data; never mutated by later refreshes."""
+        return self._data
+
+    def refresh(self):
+        """Ingest whatever arrived since the last call; returns the number of new rows."""
+        with self._lock:
+            if self._replaced():
+                # A rotated or truncated CSV: the ingested rows no longer match
+                # it, so start over from the file and every partition
+                logger.warning("%s was truncated or replaced; reloading it", self.csv_path)
+                self._load()
+                self.version += 1
+            # Nothing is marked as ingested until the delta is in, so rows
+            # that fail to read or extend are read again next time
+            tail, offset = self._read_csv_tail()
+            partitions = self._read_partitions()
+            parts = [part for part in [tail, *partitions.values()] if part is not None and len(part)]
+            if parts:
+                delta = concat_frames(parts) if len(parts) > 1 else parts[0]
+                size = self._buffer.size
+                try:
+                    self._data = self.extend(self._data, delta, self._buffer.append(delta))
+                except Exception:
+                    # Rows the index and cube never saw are overwritten by the next append
+                    self._buffer.size = size
+                    raise
+            self._offset = offset
+            self._seen.update(partitions)
+            if not parts:
+                return 0
+            self.rows += len(delta)
+            self.version += 1
+            logger.info("ingested %d new rows from %s (now %d)", len(delta), self.csv_path, self.rows)
+            return len(delta)
+
+    def start(self, interval=DEFAULT_POLL_INTERVAL):
+        """Poll for new data every ``interval`` seconds in a daemon thread."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._poll, args=(interval,), daemon=True,
+                                        name=f'ingest-{os.path.basename(self.csv_path)}')
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _poll(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("incremental ingest of %s failed", self.csv_path)
+
+    def _read_csv_tail(self):
+        """The whole new lines of the CSV and the offset just past them."""
+        if self._offset is None:
+            # Byte position of the first row not yet loaded, found once by counting lines
+            self._offset = _offset_after_rows(self.csv_path, self._offset_rows)
+            with open(self.csv_path, 'rb') as f:
+                self._header = f.readline()
+
+        size = os.path.getsize(self.csv_path)
+        if size <= self._offset:
+            return None, self._offset
+        with open(self.csv_path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read(size - self._offset)
+
+        # Only whole lines; a line still being written is picked up next time
+        end = data.rfind(b'\n') + 1
+        if not end:
+            return None, self._offset
+        return self._parse(read_csv(self._header + data[:end], self.columns, self.layout)), self._offset + end
+
+    def _partition_files(self):
+        if not os.path.isdir(self.partition_dir):
+            return []
+        return sorted(name for name in os.listdir(self.partition_dir) if name.endswith(PARTITION_SUFFIXES))
+
+    def _read_partitions(self):
+        """``{name: rows}`` of the partitions not ingested yet; one that cannot be read is tried again later."""
+        partitions = {}
+        for name in self._partition_files():
+            if name in self._seen:
+                continue
+            try:
+                partitions[name] = self._read_partition(name)
+            except Exception:
+                # Most likely still being written
+                logger.warning("could not read partition %s; retrying on the next refresh", name, exc_info=True)
+        return partitions
+
+    def _read_partition(self, name):
+        path = os.path.join(self.partition_dir, name)
+        if name.endswith('.parquet'):
+            return self._parse(_read_parquet(path, self.columns, self.layout))
+        return self._parse(read_csv(path, self.columns, self.layout))
+
+    def _parse(self, frame):
+        return conform(frame, self._like)
+
+
+_datasets = {}
+_datasets_lock = threading.Lock()
+
+
+def open_dataset(name, csv_path, columns, build, extend, interval=DEFAULT_POLL_INTERVAL, layout=None):
+    """Process-wide :class:`IncrementalDataset` for ``name``, created and started on first use."""
+    with _datasets_lock:
+        dataset = _datasets.get(name)
+        if dataset is None:
+            dataset = _datasets[name] = IncrementalDataset(csv_path, columns, build, extend, layout=layout)
+            dataset.start(interval)
+        return dataset
@@ -0,0 +1,246 @@
+"""Opt-in timing of dashboard reruns.
+
+Set ``LULU_INSTRUMENT=1`` to turn it on; otherwise :func:`start_rerun`
+returns a recorder that does nothing. Each rerun records, per stage (load,
+filter, metrics, every chart, the table), its wall time and the rows going
+in and out, plus the approximate bytes each widget sends to the browser.
+
+Finished reruns go into the process-wide :data:`metrics` registry, which
+keeps the last ``LULU_METRICS_WINDOW`` latencies per dashboard and stage and
+the hit rate of the registered caches. They are exported three ways:
+
+* one JSON log line per rerun on the ``lulu.reruns`` logger;
+* Prometheus text format, written to ``LULU_METRICS_FILE`` after every rerun
+  (for node_exporter's textfile collector) and/or served on
+  ``LULU_METRICS_PORT``;
+* :func:`debug_panel`, a collapsed expander in the dashboard's sidebar.
+
+NumPy, pandas and pyarrow are imported only once something is recorded, so
+importing this module (for the no-op recorder) stays cheap.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENABLED = os.environ.get('LULU_INSTRUMENT', '0').lower() not in ('', '0', 'false', 'no')
+METRICS_FILE = os.environ.get('LULU_METRICS_FILE')
+METRICS_PORT = int(os.environ.get('LULU_METRICS_PORT', 0))
+WINDOW = int(os.environ.get('LULU_METRICS_WINDOW', 1000))
+QUANTILES = (0.5, 0.9, 0.99)
+
+logger = logging.getLogger('lulu.reruns')
+
+
+def payload_bytes(value):
+    """Approximate bytes Streamlit sends for ``value``: Arrow IPC for frames, JSON for figures."""
+    import pandas as pd
+    import pyarrow as pa
+    if isinstance(value, pd.Series):
+        value = value.to_frame()
+    if isinstance(value, pd.DataFrame):
+        table = pa.Table.from_pandas(value)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().size
+    if hasattr(value, 'to_json'):
+        return len(value.to_json())
+    return len(json.dumps(value, default=str))
+
+
+class Rerun:
+    """Stage timings, row counts and widget payloads of one dashboard rerun."""
+
+    enabled = True
+
+    def __init__(self, dashboard, registry):
+        self.dashboard = dashboard
+        self.registry = registry
+        self.stages = []
+        self.widgets = []
+        self.seconds = None
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """Time the block as stage ``name``; set ``rows_out`` on the yielded record if it applies."""
+        record = {'stage': name, 'seconds': 0.0, 'rows_in': rows_in, 'rows_out': None}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            self.stages.append(record)
+
+    def widget(self, name, value):
+        """Record the payload size of ``value`` shown as widget ``name`` and return ``value``."""
+        self.widgets.append({'widget': name, 'bytes': payload_bytes(value)})
+        return value
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self._start
+        self.registry.observe(self)
+        logger.info(json.dumps({
+            'event': 'rerun', 'dashboard': self.dashboard, 'seconds': round(self.seconds, 6),
+            'stages': self.stages, 'widgets': self.widgets, 'caches': self.registry.cache_stats(),
+        }, default=str))
+
+
+class _NullRerun:
+    enabled = False
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        yield {}
+
+    def widget(self, name, value):
+        return value
+
+    def finish(self):
+        pass
+
+
+def _quantiles(samples):
+    import numpy as np
+    return dict(zip(QUANTILES, np.quantile(samples, QUANTILES))) if samples else {}
+
+
+class MetricsRegistry:
+    """Rerun and stage latencies of this process, plus the counters of the watched caches."""
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.caches = {}
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._totals = defaultdict(lambda: [0, 0.0])
+        self._lock = threading.Lock()
+        self._server = None
+
+    def watch_cache(self, name, cache):
+        """Report ``cache.hits``/``cache.misses`` as cache ``name``."""
+        self.caches[name] = cache
+
+    def observe(self, rerun):
+        with self._lock:
+            for key, seconds in [((rerun.dashboard, None), rerun.seconds)] + \
+                    [((rerun.dashboard, s['stage']), s['seconds']) for s in rerun.stages]:
+                self._samples[key].append(seconds)
+                totals = self._totals[key]
+                totals[0] += 1
+                totals[1] += seconds
+        if METRICS_FILE:
+            self.write(METRICS_FILE)
+
+    def cache_stats(self):
+        stats = {}
+        for name, cache in self.caches.items():
+            lookups = cache.hits + cache.misses
+            stats[name] = {'hits': cache.hits, 'misses': cache.misses,
+                           'hit_rate': cache.hits / lookups if lookups else None}
+        return stats
+
+    def latency(self, dashboard):
+        """Rerun and per-stage latency quantiles (ms) over the last ``window`` reruns of ``dashboard``."""
+        import pandas as pd
+        with self._lock:
+            keys = [key for key in self._samples if key[0] == dashboard]
+            rows = {key[1] or '(rerun)': {f'p{q * 100:g}_ms': value * 1000
+                                          for q, value in _quantiles(list(self._samples[key])).items()}
+                    for key in keys}
+        return pd.DataFrame.from_dict(rows, orient='index')
+
+    def prometheus(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = [
+            '# HELP lulu_rerun_seconds Dashboard rerun latency (quantiles over the last reruns).',
+            '# TYPE lulu_rerun_seconds summary',
+        ]
+        stage_lines = [
+            '# HELP lulu_stage_seconds Latency of one stage of a dashboard rerun.',
+            '# TYPE lulu_stage_seconds summary',
+        ]
+        with self._lock:
+            for (dashboard, stage), samples in self._samples.items():
+                name, out = ('lulu_rerun_seconds', lines) if stage is None else ('lulu_stage_seconds', stage_lines)
+                labels = f'dashboard="{dashboard}"' + ('' if stage is None else f',stage="{stage}"')
+                for q, value in _quantiles(list(samples)).items():
+                    out.append(f'{name}{{{labels},quantile="{q:g}"}} {value:.6f}')
+                count, total = self._totals[(dashboard, stage)]
+                out.append(f'{name}_sum{{{labels}}} {total:.6f}')
+                out.append(f'{name}_count{{{labels}}} {count}')
+        lines += stage_lines
+        for metric, key in (('lulu_cache_hits_total', 'hits'), ('lulu_cache_misses_total', 'misses')):
+            lines += [f'# TYPE {metric} counter']
+            lines += [f'{metric}{{cache="{name}"}} {stats[key]}' for name, stats in self.cache_stats().items()]
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Write :meth:`prometheus` to ``path`` atomically."""
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.prometheus())
+        os.replace(tmp_path, path)
+
+    def serve(self, port):
+        """Serve :meth:`prometheus` on ``http://0.0.0.0:port/metrics`` from a daemon thread (once)."""
+        with self._lock:
+            if self._server is not None:
+                return
+            registry = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = registry.prometheus().encode()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            self._server = ThreadingHTTPServer(('0.0.0.0', port), Handler)
+            threading.Thread(target=self._server.serve_forever, daemon=True, name='lulu-metrics').start()
+
+
+# Shared by every session of the Streamlit server
+metrics = MetricsRegistry()
+
+
+def start_rerun(dashboard):
+    """A :class:`Rerun` recorder for this rerun of ``dashboard``, or a no-op one when disabled."""
+    if not ENABLED:
+        return _NullRerun()
+    if not logger.handlers:
+        logger.addHandler(logging.StreamHandler())
+        logger.setLevel(logging.INFO)
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT)
+    return Rerun(dashboard, metrics)
+
+
+def debug_panel(container, rerun):
+    """Show ``rerun`` and the process-wide latencies in a collapsed expander of ``container``."""
+    if not rerun.enabled:
+        return
+    import pandas as pd
+    seconds = rerun.seconds if rerun.seconds is not None else time.perf_counter() - rerun._start
+    stages = pd.DataFrame(rerun.stages, columns=['stage', 'seconds', 'rows_in', 'rows_out'])
+    stages.insert(1, 'ms', stages.pop('seconds') * 1000)
+
+    panel = container.expander("🛠️ Debug: rerun metrics")
+    panel.caption(f"This rerun: {seconds * 1000:,.1f} ms")
+    panel.dataframe(stages, hide_index=True)
+    panel.caption("Bytes sent per widget")
+    panel.dataframe(pd.DataFrame(rerun.widgets, columns=['widget', 'bytes']), hide_index=True)
+    panel.caption(f"Latency over the last {rerun.registry.window:,} reruns (ms)")
+    panel.dataframe(rerun.registry.latency(rerun.dashboard))
+    for name, stats in rerun.registry.cache_stats().items():
+        rate = '–' if stats['hit_rate'] is None else f"{stats['hit_rate']:.0%}"
+        panel.caption(f"Cache {name}: {rate} hits ({stats['hits']:,} of {stats['hits'] + stats['misses']:,})")
@@ -0,0 +1,158 @@
+"""Multi-core execution of the dashboards' filter + aggregate work.
+
+The rows are split into one partition per worker, either as contiguous row
+ranges of an in-memory frame or as groups of Parquet row groups of a file,
+and each partition is filtered and aggregated in a separate process. The
+per-partition results (:class:`aggregation.PartialAggregate`,
+:class:`data_cube.SalesCube` or :class:`approximate.SalesSketch`) are small
+and are merged in the parent, so a refresh over tens of millions of rows
+keeps every core busy.
+
+Work below ``PARALLEL_MIN_ROWS`` rows runs inline, where starting processes
+would cost more than it saves.
+"""
+import atexit
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from aggregation import PartialAggregate, file_column, filter_frame, required_columns
+from approximate import SalesSketch
+from data_cube import SalesCube
+from process_pool import process_pool
+from sales_schema import source_columns, to_layout
+from sales_storage import convert_csv, date_row_groups, is_stale, parquet_path_for
+
+WORKERS = int(os.environ.get('LULU_WORKERS') or os.cpu_count() or 1)
+PARALLEL_MIN_ROWS = int(os.environ.get('LULU_PARALLEL_MIN_ROWS', 2_000_000))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(workers=WORKERS):
+    """The process pool shared by every caller in this process."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Never forked from the (multithreaded) dashboard process itself; see process_pool
+            _pool = process_pool(workers, preload=[__name__])
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def row_ranges(rows, parts):
+    """``parts`` contiguous ``(start, stop)`` ranges covering ``rows`` rows."""
+    bounds = np.linspace(0, rows, max(1, min(parts, rows)) + 1).astype(int)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _rows(df, start, stop):
+    # A DataFrame's or a compact_table.CompactTable's rows start:stop
+    return df.iloc[start:stop] if isinstance(df, pd.DataFrame) else df.row_range(start, stop)
+
+
+def row_group_partitions(parquet_path, parts, row_groups=None):
+    """Split the file's row groups (or just ``row_groups``) into at most ``parts`` lists of similar row counts."""
+    metadata = pq.ParquetFile(parquet_path).metadata
+    if row_groups is None:
+        row_groups = range(metadata.num_row_groups)
+    sizes = {i: metadata.row_group(i).num_rows for i in row_groups}
+    partitions = [[] for _ in range(min(parts, len(sizes)))]
+    loads = [0] * len(partitions)
+    for group in sorted(sizes, key=lambda i: -sizes[i]):
+        target = loads.index(min(loads))
+        partitions[target].append(group)
+        loads[target] += sizes[group]
+    return [sorted(p) for p in partitions if p]
+
+
+def _parquet_source(path):
+    if path.endswith('.parquet'):
+        return path
+    parquet_path = parquet_path_for(path)
+    if is_stale(path, parquet_path):
+        convert_csv(path, parquet_path)
+    return parquet_path
+
+
+def _aggregate_frame(df, measures, group_by, selections, date_column, date_range):
+    df = filter_frame(df, selections, date_column, date_range)
+    return PartialAggregate.from_frame(df, measures, group_by)
+
+
+def _aggregate_row_groups(parquet_path, row_groups, measures, group_by, selections, date_column, date_range,
+                          layout=None):
+    columns = required_columns(measures, group_by, selections, date_column)
+    parquet = pq.ParquetFile(parquet_path)
+    source, names = source_columns(parquet.schema_arrow.names, columns, layout)
+    result = PartialAggregate(measures, group_by)
+    # One row group at a time keeps each worker's memory bounded
+    for group in row_groups:
+        df = to_layout(parquet.read_row_group(group, columns=names), source, layout).to_pandas(date_as_object=False)
+        result = result.merge(_aggregate_frame(df, measures, group_by, selections, date_column, date_range))
+    return result
+
+
+def parallel_aggregate(source, measures, group_by=(), selections=None, date_column=None, date_range=None,
+                       workers=WORKERS, layout=None):
+    """Filter and aggregate ``source`` (a DataFrame or a CSV/Parquet path) on ``workers`` processes.
+
+    A file's columns are named as in ``layout`` whichever layout it has.
+    """
+    args = (measures, group_by, selections, date_column, date_range)
+
+    if isinstance(source, str):
+        parquet_path = _parquet_source(source)
+        # Row groups entirely outside the date range are never read
+        header = pq.read_schema(parquet_path).names
+        row_groups = date_row_groups(parquet_path, date_range, file_column(header, date_column, layout))
+        partitions = row_group_partitions(parquet_path, workers, row_groups)
+        if workers <= 1 or len(partitions) <= 1:
+            return _aggregate_row_groups(parquet_path, sum(partitions, []), *args, layout)
+        futures = [get_pool(workers).submit(_aggregate_row_groups, parquet_path, groups, *args, layout)
+                   for groups in partitions]
+    else:
+        if workers <= 1 or len(source) < PARALLEL_MIN_ROWS:
+            return _aggregate_frame(source, *args)
+        df = source[required_columns(measures, group_by, selections, date_column)]
+        futures = [get_pool(workers).submit(_aggregate_frame, df.iloc[start:stop], *args)
+                   for start, stop in row_ranges(len(df), workers)]
+
+    result = PartialAggregate(measures, group_by)
+    for future in futures:
+        result = result.merge(future.result())
+    return result
+
+
+def parallel_cube(df, dimensions, measures, date_dimension=None, workers=WORKERS):
+    """Build a :class:`SalesCube` from per-row-range cubes built on ``workers`` processes."""
+    if workers <= 1 or len(df) < PARALLEL_MIN_ROWS:
+        return SalesCube(df, dimensions, measures, date_dimension)
+
+    df = df[list(dict.fromkeys(dimensions + measures))]
+    futures = [get_pool(workers).submit(SalesCube, _rows(df, start, stop), dimensions, measures, date_dimension)
+               for start, stop in row_ranges(len(df), workers)]
+    cubes = [future.result() for future in futures]
+    return cubes[0].merge(*cubes[1:])
+
+
+def parallel_sketch(df, strata, measure, id_column, columns=(), date_column=None, workers=WORKERS):
+    """Build a :class:`SalesSketch` from per-row-range sketches built on ``workers`` processes."""
+    if workers <= 1 or len(df) < PARALLEL_MIN_ROWS:
+        return SalesSketch(df, strata, measure, id_column, columns, date_column)
+
+    df = df[list(dict.fromkeys(list(strata) + list(columns) + [measure, id_column]
+                               + ([date_column] if date_column else [])))]
+    # A different seed per range, or every range would draw the same sample keys
+    futures = [get_pool(workers).submit(SalesSketch, _rows(df, start, stop), strata, measure, id_column,
+                                        columns, date_column, seed=seed)
+               for seed, (start, stop) in enumerate(row_ranges(len(df), workers))]
+    sketches = [future.result() for future in futures]
+    result = sketches[0]
+    for sketch in sketches[1:]:
+        result = result.merge(sketch)
+    return result
@@ -0,0 +1,50 @@
+"""Worker processes that never re-run the dashboard script.
+
+Streamlit runs app.py as ``__main__`` inside a server that already has
+threads, which rules out the usual ways of starting worker processes:
+forking a multithreaded process can deadlock the child on a lock some other
+thread held, and a spawn or forkserver child re-executes ``__main__`` (the
+whole dashboard) before running its first task.
+
+:func:`process_pool` starts every worker of a pool up front, from a
+forkserver, while this module stands in for ``__main__``. So each child
+imports only this module (plus the ``preload`` modules, imported once in the
+forkserver and inherited), and a task is a function of an importable module.
+The pool never starts another worker afterwards.
+"""
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+_start_lock = threading.Lock()
+
+
+def _started():
+    return os.getpid()
+
+
+def process_pool(workers, preload=()):
+    """A :class:`ProcessPoolExecutor` of ``workers`` processes, all running by the time it returns."""
+    if os.name == 'posix':
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__, *preload])
+    else:
+        context = multiprocessing.get_context('spawn')
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+    this = sys.modules[__name__]
+    with _start_lock:
+        main = sys.modules['__main__']
+        sys.modules['__main__'] = this
+        try:
+            # No worker is idle yet, so every submit starts one more process
+            started = [pool.submit(_started) for _ in range(workers)]
+        finally:
+            # Streamlit may have installed the next script run's module meanwhile; keep that one
+            if sys.modules['__main__'] is this:
+                sys.modules['__main__'] = main
+    for future in started:
+        future.result()
+    return pool
@@ -0,0 +1,195 @@
+"""Async HTTP/JSON API serving the numbers app.py shows to other services.
+
+    GET  /summary?Store=Dubai&Store=Ajman&Category=Grocery
+    POST /summary            {"Store": ["Dubai", "Ajman"], "Category": ["Grocery"]}
+    GET  /options
+    GET  /health
+
+``/summary`` returns the metric tiles and the chart series for a filter
+selection (see :func:`sales_query.summarize`); filter columns left out are
+not filtered. Queries are CPU-bound, so they run on a pool of worker
+processes, each of which loads the dataset once through
+:mod:`sales_query`, just like a dashboard process.
+
+Every selection is reduced to its canonical key (:func:`sales_query.selection_key`)
+and combined with the dataset's file version. Concurrent requests for the same
+key share one computation, and finished results are kept in a
+:class:`result_cache.ResultCache` (LRU with a TTL). So hundreds of clients
+asking for the same slice cost one query, and a changed file is never answered
+from the cache.
+
+    python query_api.py --port 8502 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from parallel_agg import WORKERS
+from process_pool import process_pool
+from result_cache import DEFAULT_TTL, ResultCache
+from sales_query import DATA_PATH, dataset_version, query_options, query_summary, selection_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = int(os.environ.get('LULU_API_PORT', 8502))
+DEFAULT_CACHE_SIZE = int(os.environ.get('LULU_API_CACHE_SIZE', 1024))
+MAX_BODY_BYTES = 1 << 20
+
+_MISSING = object()
+
+
+class QueryService:
+    """Runs queries on a process pool, coalescing identical ones and caching their results."""
+
+    def __init__(self, path=DATA_PATH, workers=WORKERS, cache_size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_TTL):
+        self.path = path
+        self.cache = ResultCache(cache_size, ttl)
+        self.coalesced = 0
+        self._inflight = {}
+        # Workers start with sales_query imported and nothing loaded; each loads the dataset on its first query
+        self._executor = process_pool(workers, preload=['sales_query'])
+
+    async def _run(self, version, key, fn, *args):
+        value = self.cache.get(self.path, version, key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        future = self._inflight.get((version, key))
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+            self._inflight[(version, key)] = future
+            future.add_done_callback(lambda done: self._finish(version, key, done))
+        else:
+            self.coalesced += 1
+        # A client that disconnects must not cancel the query for everyone else waiting on it
+        return await asyncio.shield(future)
+
+    def _finish(self, version, key, future):
+        del self._inflight[(version, key)]
+        if not future.cancelled() and future.exception() is None:
+            self.cache.put(self.path, version, key, future.result())
+
+    async def version(self):
+        # Stats files, or asks the shard hosts; either way not on the event loop
+        return await asyncio.get_running_loop().run_in_executor(None, dataset_version, self.path)
+
+    async def options(self):
+        version = await self.version()
+        return await self._run(version, 'options', query_options, self.path)
+
+    async def summary(self, selections):
+        version = await self.version()
+        options = await self._run(version, 'options', query_options, self.path)
+        key = selection_key(selections, options)
+        return await self._run(version, ('summary', key), query_summary, key, self.path)
+
+    def stats(self):
+        return {'hits': self.cache.hits, 'misses': self.cache.misses, 'coalesced': self.coalesced,
+                'entries': len(self.cache), 'inflight': len(self._inflight)}
+
+    def close(self):
+        self._executor.shutdown(cancel_futures=True)
+
+
+class QueryServer:
+    """Minimal HTTP/1.1 server (keep-alive, JSON only) over ``asyncio`` streams."""
+
+    def __init__(self, service):
+        self.service = service
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        if url.path == '/health':
+            return HTTPStatus.OK, {'status': 'ok', 'version': list(await self.service.version()),
+                                   'cache': self.service.stats()}
+        if url.path == '/options' and method == 'GET':
+            return HTTPStatus.OK, await self.service.options()
+        if url.path == '/summary' and method in ('GET', 'POST'):
+            if method == 'POST':
+                selections = json.loads(body or b'{}')
+                if not isinstance(selections, dict):
+                    raise ValueError("expected a JSON object of {column: [values]}")
+            else:
+                selections = parse_qs(url.query, keep_blank_values=True)
+            return HTTPStatus.OK, await self.service.summary(selections)
+        return HTTPStatus.NOT_FOUND, {'error': f"no route for {method} {url.path}"}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': "body too large"})
+                    break
+                body = await reader.readexactly(length)
+
+                try:
+                    status, payload = await self.dispatch(method, target, body)
+                except ValueError as error:
+                    status, payload = HTTPStatus.BAD_REQUEST, {'error': str(error)}
+                except Exception:
+                    logger.exception("query %s %s failed", method, target)
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': "query failed"}
+                await self._respond(writer, status, payload)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        writer.write(f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+                     f'Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n'.encode('latin-1') + data)
+        await writer.drain()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        logger.info("serving %s on http://%s:%d", self.service.path, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the Lulu sales dashboard aggregates as JSON.")
+    parser.add_argument('--data', default=DATA_PATH, help="sales CSV to serve (default: %(default)s)")
+    parser.add_argument('--host', default='127.0.0.1', help="interface to listen on (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="port to listen on (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help="query worker processes (default: %(default)s)")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                        help="results kept in the LRU cache (default: %(default)s)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    service = QueryService(os.path.abspath(args.data), args.workers, args.cache_size)
+    try:
+        asyncio.run(QueryServer(service).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
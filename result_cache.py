@@ -0,0 +1,132 @@
+"""Process-wide memo of computed dashboard results.
+
+Entries are keyed on a dataset (``namespace``), the dataset's version and a
+canonical filter selection (see :func:`sales_query.selection_key`), and hold
+small computed results such as the metric tiles and chart series, never the
+filtered rows. The cache is bounded (least recently used entries go first),
+entries expire after ``ttl`` seconds, and when a dataset shows up with a new
+version every entry of its older versions is dropped.
+
+``get_or_compute`` lets only one thread compute a missing entry; the others
+asking for the same key wait for it instead of repeating the work.
+``get_many`` computes several missing entries at once on a shared pool of
+``LULU_RESULT_THREADS`` threads.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MAX_ENTRIES = int(os.environ.get('LULU_RESULT_CACHE_SIZE', 256))
+DEFAULT_TTL = float(os.environ.get('LULU_RESULT_TTL', 600))
+THREADS = int(os.environ.get('LULU_RESULT_THREADS', 4))
+
+_MISSING = object()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=THREADS, thread_name_prefix='lulu-results')
+        return _pool
+
+
+class ResultCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._computing = {}
+        self._lock = threading.Lock()
+
+    def _check_version(self, namespace, version):
+        # Caller holds the lock
+        if self._versions.get(namespace, version) != version:
+            for stale in [k for k in self._entries if k[0] == namespace]:
+                del self._entries[stale]
+        self._versions[namespace] = version
+
+    def get(self, namespace, version, key, default=None):
+        """The cached result, or ``default`` when missing or expired (counted as a hit or miss)."""
+        with self._lock:
+            value = self._lookup(namespace, version, key)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def _lookup(self, namespace, version, key):
+        self._check_version(namespace, version)
+        entry = self._entries.get((namespace, key))
+        if entry is None:
+            return _MISSING
+        value, expires = entry
+        if expires < time.monotonic():
+            del self._entries[(namespace, key)]
+            return _MISSING
+        self._entries.move_to_end((namespace, key))
+        return value
+
+    def put(self, namespace, version, key, value):
+        with self._lock:
+            self._check_version(namespace, version)
+            self._entries[(namespace, key)] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end((namespace, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, namespace, key, value=_MISSING):
+        """Drop the entry for ``key`` (only if it still holds ``value``, when given)."""
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is not None and (value is _MISSING or entry[0] is value):
+                del self._entries[(namespace, key)]
+
+    def get_or_compute(self, namespace, version, key, compute):
+        """The cached result for ``key``, computing and storing ``compute()`` if needed."""
+        with self._lock:
+            value = self._lookup(namespace, version, key)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+            self.misses += 1
+            lock = self._computing.setdefault((namespace, version, key), threading.Lock())
+
+        with lock:
+            # Someone else may have computed it while we waited
+            with self._lock:
+                value = self._lookup(namespace, version, key)
+            if value is _MISSING:
+                value = compute()
+                self.put(namespace, version, key, value)
+
+        with self._lock:
+            self._computing.pop((namespace, version, key), None)
+        return value
+
+    def get_many(self, namespace, version, computations):
+        """``{key: result}`` for a ``{key: compute}`` dict, computing the missing results concurrently."""
+        futures = {key: _get_pool().submit(self.get_or_compute, namespace, version, key, compute)
+                   for key, compute in computations.items()}
+        return {key: future.result() for key, future in futures.items()}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Shared by every session of the Streamlit server
+results = ResultCache()
@@ -0,0 +1,245 @@
+"""Filter + aggregate queries behind app.py, importable without Streamlit.
+
+:func:`open_sales` returns a :class:`Snapshot` of the current dataset: the
+loaded frame with its filter index and cube (shared by everything in the
+process through :mod:`dataset_cache` or :mod:`incremental`), or, for files
+too large to load, just the filter options with every query streamed from
+disk. With ``LULU_SHARD_DIR`` or ``LULU_SHARD_HOSTS`` the dataset is one
+shard per store (see :mod:`sharded_dataset`) and every query fans out to the
+selected stores' shards only. :func:`summarize` turns a filtered view into the numbers app.py shows,
+as plain JSON-serializable values, and :func:`selection_key` gives the
+canonical form of a filter selection that results are cached under;
+:func:`cached_summary` memoizes summaries in the process-wide
+:data:`result_cache.results`.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from aggregation import distinct_values, filter_frame, head_rows, iter_chunks, should_stream
+from compact_table import load_compact
+from dataset_cache import datasets, views
+from filter_index import FilterIndex
+from incremental import open_dataset, partition_dir_for
+from parallel_agg import parallel_aggregate, parallel_cube
+from result_cache import results
+from sales_storage import load_sales_data
+from shared_dataset import SHARED_DIR, attach, current_path
+from sharded_dataset import SHARD_DIR, SHARD_HOSTS, ShardedDataset
+from table_view import iter_rows
+
+COLUMNS = ["TransactionID", "Store", "Category", "SalesAmount", "AgeGroup", "Gender",
+           "Nationality", "IncomeLevel", "LoyaltyMember", "AdvertisementSpend", "Date"]
+FILTER_COLUMNS = ["Store", "Category", "AgeGroup", "Gender", "LoyaltyMember"]
+CUBE_DIMENSIONS = FILTER_COLUMNS + ["Nationality", "Date"]
+MEASURES = ["SalesAmount", "AdvertisementSpend"]
+CHART_COLUMNS = ["Category", "AgeGroup", "Nationality"]
+DATA_PATH = "lulu_sales_data.csv"
+TABLE_ROWS = 1000
+
+# "reload" re-reads the whole dataset when the CSV changes, "incremental"
+# ingests appended rows and new partition files by delta
+INGEST_MODE = os.environ.get("LULU_INGEST_MODE", "reload")
+
+# "compact" keeps the reloaded rows as a compact_table.CompactTable (coded
+# dimensions, packed flags, int32 days and cents) instead of a pandas frame
+TABLE_FORMAT = os.environ.get("LULU_TABLE_FORMAT", "pandas")
+
+
+def build_dashboard_data(df):
+    # Index the filter columns and pre-aggregate the cube that answers the metrics and charts
+    index = FilterIndex(df, FILTER_COLUMNS)
+    cube = parallel_cube(df, CUBE_DIMENSIONS, MEASURES, date_dimension="Date")
+    return df, index, cube
+
+
+def extend_dashboard_data(data, delta, df):
+    _, index, cube = data
+    return df, index.append(delta), cube.add(delta)
+
+
+def load_dashboard_data(path):
+    if TABLE_FORMAT == "compact":
+        return build_dashboard_data(load_compact(path, columns=COLUMNS, layout="app"))
+    # Load dataset (converted to Parquet on first run), in app.py's column names
+    # even when the file has the generated package's layout
+    return build_dashboard_data(load_sales_data(path, columns=COLUMNS, layout="app"))
+
+
+# One per process, so the hosts' shard lists and versions are cached across reruns
+_shards = ShardedDataset(SHARD_DIR, "Store", SHARD_HOSTS) if SHARD_DIR or SHARD_HOSTS else None
+
+
+def sharded():
+    """The :class:`sharded_dataset.ShardedDataset` behind the dashboard, or ``None`` when it is not sharded."""
+    return _shards
+
+
+def dataset_version(path=DATA_PATH):
+    """Changes whenever the CSV, its partition directory, the shared generation or a shard changes;
+    cheap enough to check per request."""
+    shards = sharded()
+    if shards is not None:
+        return ("sharded",) + shards.version()
+    version = []
+    for p in (path, partition_dir_for(path)) + ((current_path(SHARED_DIR),) if SHARED_DIR else ()):
+        if os.path.exists(p):
+            stat = os.stat(p)
+            version += [stat.st_size, stat.st_mtime_ns]
+    return tuple(version)
+
+
+class Snapshot:
+    """The dataset as of one :func:`open_sales` call.
+
+    ``df``, ``index`` and ``cube`` are ``None`` when the file is streamed or
+    sharded (``shards`` is then the :class:`sharded_dataset.ShardedDataset`);
+    ``df`` is a :class:`compact_table.CompactTable` when ``LULU_TABLE_FORMAT=compact``.
+    """
+
+    def __init__(self, path, options, version, df=None, index=None, cube=None, shards=None):
+        self.path = path
+        self.options = options
+        self.version = version
+        self.df, self.index, self.cube = df, index, cube
+        self.shards = shards
+
+    @property
+    def streaming(self):
+        return self.df is None
+
+    def aggregate(self, selections=None):
+        """Metrics and chart rollups (a cube view or streamed partial aggregate) for ``selections``."""
+        if self.shards is not None:
+            return self.shards.aggregate(MEASURES, CHART_COLUMNS, selections)
+        if self.streaming:
+            return parallel_aggregate(self.path, MEASURES, CHART_COLUMNS, selections, layout="app")
+        return self.cube.filter(selections)
+
+    def matching_rows(self, selections=None, limit=TABLE_ROWS):
+        """``(table, rows)``: a frame and the positions in it of the rows matching ``selections``.
+
+        Streamed files and shards only give the first ``limit`` matches.
+        """
+        if self.shards is not None:
+            table = self.shards.head_rows(selections, limit=limit, columns=COLUMNS)
+            return table, np.arange(len(table))
+        if self.streaming:
+            table = head_rows(self.path, selections, limit=limit, columns=COLUMNS, layout="app")
+            return table, np.arange(len(table))
+        return self.df, self.index.positions(selections or {})
+
+    def iter_matching(self, selections=None, columns=COLUMNS):
+        """Every row matching ``selections`` as DataFrames of ``columns``, for exports."""
+        if self.shards is not None:
+            return self.shards.iter_matching(selections, columns)
+        if self.streaming:
+            return (filter_frame(chunk, selections)[columns] for chunk in iter_chunks(self.path, COLUMNS, layout="app"))
+        return iter_rows(self.df, self.index.positions(selections or {}), columns)
+
+
+def open_sales(path=DATA_PATH, ingest_mode=INGEST_MODE):
+    """The current :class:`Snapshot` of the dataset at ``path``, loaded once per process."""
+    # With LULU_SHARED_DIR the rows come from the generation shared_dataset.py
+    # published for every worker on the host, mapped read-only; a new
+    # generation is picked up on the next call
+    if SHARED_DIR:
+        datasets.register(path, current_path(SHARED_DIR),
+                          lambda pointer: build_dashboard_data(attach(pointer, COLUMNS)))
+        df, index, cube = datasets.get(path)
+        options = {column: index.values(column) for column in FILTER_COLUMNS}
+        return Snapshot(path, options, ("shared", datasets.version(path)), df, index, cube)
+
+    # Sharded per store: nothing is loaded, and each query runs on the
+    # selected stores' shards only, in parallel, here or on the shard hosts
+    shards = sharded()
+    if shards is not None:
+        version = ("sharded",) + shards.version()
+        options = results.get_or_compute(f"{path}:shards", version, "options",
+                                         lambda: shards.distinct_values(FILTER_COLUMNS))
+        return Snapshot(path, options, version, shards=shards)
+
+    # Files above LULU_STREAMING_THRESHOLD_BYTES are never loaded whole: every
+    # query streams them chunk by chunk (row groups spread over LULU_WORKERS
+    # processes) and only the filter options are cached
+    if should_stream(path):
+        datasets.register(f"{path}:options", path, lambda p: distinct_values(p, FILTER_COLUMNS, layout="app"))
+        return Snapshot(path, datasets.get(f"{path}:options"), dataset_version(path))
+
+    if ingest_mode == "incremental":
+        live = open_dataset(path, path, COLUMNS, build_dashboard_data, extend_dashboard_data, layout="app")
+        df, index, cube = views(live.snapshot())
+        version = ("incremental", live.version)
+    else:
+        datasets.register(path, path, load_dashboard_data)
+        df, index, cube = datasets.get(path)
+        version = ("reload", datasets.version(path))
+    options = {column: index.values(column) for column in FILTER_COLUMNS}
+    return Snapshot(path, options, version, df, index, cube)
+
+
+def selection_key(selections, options):
+    """Canonical, hashable form of ``selections``.
+
+    Values are de-duplicated and sorted, and columns whose selection covers
+    every option (or that are missing) are dropped, so every way of saying
+    "no filter" on a column gives the same key. An empty selection is kept:
+    it matches nothing. Each selection must be a list of values (a tuple or
+    set will do), so a single value is not taken apart character by character.
+    """
+    selections = selections or {}
+    unknown = set(selections) - set(FILTER_COLUMNS)
+    if unknown:
+        raise ValueError(f"unknown filter columns: {', '.join(sorted(unknown))}")
+
+    key = []
+    for column in FILTER_COLUMNS:
+        if column not in selections:
+            continue
+        if not isinstance(selections[column], (list, tuple, set, frozenset)):
+            raise ValueError(f"expected a list of values for {column}, got {selections[column]!r}")
+        selected = set(selections[column])
+        if selected.issuperset(options[column]):
+            continue
+        key.append((column, tuple(sorted(selected, key=str))))
+    return tuple(key)
+
+
+def _series(rollup):
+    return {str(label): float(value) for label, value in rollup.items()}
+
+
+def summarize(view):
+    """The metric tiles and chart series of app.py for ``view``, as JSON-serializable values."""
+    return {
+        "transactions": int(view.count()),
+        "total_sales": view.sum("SalesAmount"),
+        "avg_sales": view.mean("SalesAmount"),
+        "ad_spend": view.sum("AdvertisementSpend"),
+        "charts": {column: _series(view.rollup(column, "SalesAmount")) for column in CHART_COLUMNS},
+    }
+
+
+def cached_summary(snapshot, selections, cache=results):
+    """:func:`summarize` of ``selections`` on ``snapshot``, memoized under the canonical selection."""
+    key = selection_key(selections, snapshot.options)
+    return cache.get_or_compute(snapshot.path, snapshot.version, key,
+                                lambda: summarize(snapshot.aggregate(dict(key))))
+
+
+def chart_series(summary, column):
+    """One chart of a :func:`summarize` result as a Series indexed by ``column``."""
+    return pd.Series(summary["charts"][column], name="SalesAmount", dtype="float64").rename_axis(column)
+
+
+def query_summary(selections=None, path=DATA_PATH):
+    """:func:`summarize` of ``selections`` (a canonical key or a ``{column: values}`` dict) on ``path``."""
+    return summarize(open_sales(path).aggregate(dict(selections or {})))
+
+
+def query_options(path=DATA_PATH):
+    """The filter options of the dataset at ``path`` as plain Python values."""
+    options = open_sales(path).options
+    return {column: [value.item() if hasattr(value, "item") else value for value in values]
+            for column, values in options.items()}
@@ -0,0 +1,169 @@
+"""One declarative schema for both sales CSV layouts.
+
+app.py's CSV (``TransactionID, Store, Category, SalesAmount, ...``) and the
+generated package's (``Transaction_ID, City, Product_Category,
+Final_Amount, ...``) describe the same transactions under different names.
+:data:`FIELDS` lists every column once, with its name in each layout
+(``None`` where a layout lacks it) and its kind, which fixes the Arrow type
+it is parsed as:
+
+* ``dimension``: dictionary-encoded strings (pandas categoricals);
+* ``amount``: float32; ``count``: int32; ``id``: strings;
+* ``date``: date32, parsed by the CSV reader itself (no ``to_datetime`` pass);
+* ``flag``: the loyalty flag, "Yes"/"No" strings in app.py's layout and
+  booleans in the package's.
+
+Every CSV read goes through :func:`open_csv` / :func:`read_csv`: pyarrow's
+multithreaded parser with these explicit types and only the requested
+columns converted. With ``layout=...`` the requested columns are named as
+in that layout, and a file in the other layout is read into those names
+(the flag converted), so either dashboard can open either file.
+"""
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+
+LAYOUTS = ('app', 'package')
+
+# (app.py's name, the generated package's name, kind)
+FIELDS = [
+    ('TransactionID', 'Transaction_ID', 'id'),
+    (None, 'Customer_ID', 'dimension'),
+    ('Date', 'Transaction_Date', 'date'),
+    (None, 'Store_Location', 'dimension'),
+    ('Store', 'City', 'dimension'),
+    ('Category', 'Product_Category', 'dimension'),
+    ('AgeGroup', 'Age_Group', 'dimension'),
+    ('Gender', 'Gender', 'dimension'),
+    ('Nationality', 'Nationality', 'dimension'),
+    ('IncomeLevel', 'Income_Bracket', 'dimension'),
+    (None, 'Quantity', 'count'),
+    (None, 'Unit_Price', 'amount'),
+    (None, 'Total_Amount', 'amount'),
+    (None, 'Discount', 'amount'),
+    ('SalesAmount', 'Final_Amount', 'amount'),
+    ('LoyaltyMember', 'Is_Loyalty_Member', 'flag'),
+    (None, 'Loyalty_Tier', 'dimension'),
+    (None, 'Loyalty_Points_Earned', 'count'),
+    (None, 'Loyalty_Points_Redeemed', 'count'),
+    ('AdvertisementSpend', 'Monthly_Ad_Budget', 'amount'),
+]
+
+KIND_TYPES = {
+    'id': pa.string(),
+    'dimension': pa.dictionary(pa.int32(), pa.string()),
+    'amount': pa.float32(),
+    'count': pa.int32(),
+    'date': pa.date32(),
+}
+
+# How each layout writes the loyalty flag: (false, true) labels, or None for booleans
+FLAG_LABELS = {'app': ('No', 'Yes'), 'package': None}
+
+DATE_COLUMNS = tuple(name for *names, kind in FIELDS if kind == 'date' for name in names if name)
+
+CSV_BLOCK_BYTES = 64 << 20
+
+
+def _field_type(layout, kind):
+    if kind == 'flag':
+        return KIND_TYPES['dimension'] if FLAG_LABELS[layout] else pa.bool_()
+    return KIND_TYPES[kind]
+
+
+def _names(layout):
+    position = LAYOUTS.index(layout)
+    return {field[position]: field for field in FIELDS if field[position]}
+
+
+def detect_layout(header):
+    """The layout most of the ``header`` columns belong to, or ``None`` for an unknown file."""
+    scores = {layout: len(set(header) & set(_names(layout))) for layout in LAYOUTS}
+    layout = max(LAYOUTS, key=scores.get)
+    return layout if scores[layout] else None
+
+
+def column_types(header):
+    """Explicit Arrow types for the known columns of a CSV with this ``header``."""
+    layout = detect_layout(header)
+    if layout is None:
+        return {}
+    return {name: _field_type(layout, field[2]) for name, field in _names(layout).items() if name in header}
+
+
+def source_columns(header, columns=None, layout=None):
+    """``(file layout, file column names)`` for ``columns`` named as in ``layout`` (default: the file's)."""
+    source = detect_layout(header)
+    if layout is None or source is None or layout == source:
+        return source, list(header if columns is None else columns)
+
+    target = _names(layout)
+    position = LAYOUTS.index(source)
+    if columns is None:
+        columns = [name for name, field in target.items() if field[position] in header]
+    missing = [name for name in columns if name not in target or target[name][position] not in header]
+    if missing:
+        raise ValueError(f"a {source}-layout file has no column for {', '.join(missing)}")
+    return source, [target[name][position] for name in columns]
+
+
+def to_layout(data, source, layout):
+    """Rename the columns of an Arrow table or record batch from ``source``'s names to ``layout``'s."""
+    if layout is None or source is None or layout == source:
+        return data
+    names = {field[LAYOUTS.index(source)]: field for field in FIELDS}
+    arrays, fields = [], []
+    for name, array in zip(data.schema.names, data.columns):
+        field = names[name]
+        if field[2] == 'flag':
+            array = _convert_flag(array, source, layout)
+        arrays.append(array)
+        fields.append(field[LAYOUTS.index(layout)])
+    return type(data).from_arrays(arrays, names=fields)
+
+
+def _convert_flag(array, source, layout):
+    source_labels, labels = FLAG_LABELS[source], FLAG_LABELS[layout]
+    if source_labels is not None:
+        if pa.types.is_dictionary(array.type):
+            array = array.cast(array.type.value_type)
+        array = pc.equal(array, source_labels[1])
+    if labels is not None:
+        array = pc.dictionary_encode(pc.if_else(array, labels[1], labels[0]))
+    return array
+
+
+def read_header(source):
+    """Column names in the first line of ``source`` (a path or a bytes buffer)."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        line = bytes(source).split(b'\n', 1)[0]
+    else:
+        with open(source, 'rb') as f:
+            line = f.readline()
+    return line.decode('utf-8').strip().split(',')
+
+
+def _csv_options(header, columns):
+    return pv.ConvertOptions(include_columns=columns, column_types=column_types(header))
+
+
+def _input(source):
+    return pa.BufferReader(bytes(source)) if isinstance(source, (bytes, bytearray, memoryview)) else source
+
+
+def open_csv(source, columns=None, layout=None, block_size=CSV_BLOCK_BYTES):
+    """Yield record batches of ``columns`` (named as in ``layout``) from the CSV ``source``."""
+    header = read_header(source)
+    source_layout, names = source_columns(header, columns, layout)
+    reader = pv.open_csv(_input(source), read_options=pv.ReadOptions(block_size=block_size),
+                         convert_options=_csv_options(header, names))
+    for batch in reader:
+        yield to_layout(batch, source_layout, layout)
+
+
+def read_csv(source, columns=None, layout=None):
+    """The CSV ``source`` (a path or bytes) as a DataFrame of ``columns`` named as in ``layout``."""
+    header = read_header(source)
+    source_layout, names = source_columns(header, columns, layout)
+    table = pv.read_csv(_input(source), convert_options=_csv_options(header, names))
+    return to_layout(table, source_layout, layout).to_pandas(date_as_object=False)
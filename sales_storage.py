@@ -0,0 +1,228 @@
+"""Columnar storage for the sales dataset.
+
+The CSV is converted once into a Parquet file next to it, with string
+dimensions dictionary-encoded, amounts stored as float32 and dates as native
+date32 values (the types :mod:`sales_schema` declares for either layout).
+Dashboards then load only the columns they need from the Parquet file
+instead of re-parsing the CSV on every start, named as in their own layout.
+
+Rows are written in date order, one calendar month after another, and row
+groups never straddle a month. Every row group's min/max statistics on the
+date column therefore cover a narrow range, and the file records the sort
+in its ``sorting_columns`` metadata. A date-range query reads only the row
+groups :func:`date_row_groups` keeps and binary-searches the sorted dates
+within them (:func:`date_bounds`), so a one-week query costs a week of rows
+however much history the file holds.
+"""
+import itertools
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from sales_schema import DATE_COLUMNS, column_types, open_csv, read_header, source_columns, to_layout
+
+# String columns of unknown layouts with at most this many distinct values in
+# the first block are dictionary-encoded (they load back into pandas as categoricals)
+MAX_CATEGORY_CARDINALITY = 1000
+
+ROW_GROUP_SIZE = 1_000_000
+
+
+def parquet_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + '.parquet'
+
+
+def _storage_schema(batch):
+    declared = column_types(batch.schema.names)
+    fields = []
+    for field, column in zip(batch.schema, batch.columns):
+        if field.name in declared:
+            field = field.with_type(declared[field.name])
+        elif pa.types.is_floating(field.type):
+            field = field.with_type(pa.float32())
+        elif pa.types.is_string(field.type) and len(pc.unique(column)) <= MAX_CATEGORY_CARDINALITY:
+            field = field.with_type(pa.dictionary(pa.int32(), pa.string()))
+        fields.append(field)
+    return pa.schema(fields)
+
+
+def _to_storage(batch, schema):
+    columns = []
+    for field, column in zip(schema, batch.columns):
+        if pa.types.is_dictionary(field.type) and not pa.types.is_dictionary(column.type):
+            column = pc.dictionary_encode(column)
+        columns.append(column.cast(field.type))
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+def _date_column(schema):
+    return next((name for name in schema.names if name in DATE_COLUMNS), None)
+
+
+def _months(dates):
+    # Calendar month of each date as an integer; missing dates go after every month
+    days = dates.to_numpy(zero_copy_only=False)
+    months = days.astype('datetime64[M]').astype('int64')
+    months[np.isnat(days)] = np.iinfo(np.int64).max
+    return months
+
+
+def _by_month(batches, schema, date_column, spool_dir=None):
+    """Yield the rows of ``batches`` as one table per calendar month, in date order.
+
+    Months are spooled to uncompressed Parquet files in a temporary directory
+    first, so only one month is ever held in memory.
+    """
+    with tempfile.TemporaryDirectory(prefix='lulu-months-', dir=spool_dir) as spool:
+        writers = {}
+        try:
+            for batch in batches:
+                months = _months(batch.column(date_column))
+                order = np.argsort(months, kind='stable')
+                batch, months = batch.take(pa.array(order)), months[order]
+                edges = np.flatnonzero(np.diff(months)) + 1
+                for start, stop in zip(np.r_[0, edges], np.r_[edges, len(months)]):
+                    month = int(months[start])
+                    if month not in writers:
+                        writers[month] = pq.ParquetWriter(os.path.join(spool, f'{month}.parquet'), schema,
+                                                          compression='none')
+                    writers[month].write_batch(batch.slice(start, stop - start))
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+        for month in sorted(writers):
+            table = pq.read_table(os.path.join(spool, f'{month}.parquet'), schema=schema)
+            yield table.sort_by(date_column)
+
+
+def _write_batches(batches, sink, row_group_size, spool_dir=None):
+    batches = iter(batches)
+    first = next(batches, None)
+    if first is None:
+        return
+    schema = _storage_schema(first)
+    batches = (_to_storage(batch, schema) for batch in itertools.chain([first], batches))
+    date_column = _date_column(schema)
+    if date_column is None:
+        with pq.ParquetWriter(sink, schema, compression='zstd') as writer:
+            for batch in batches:
+                writer.write_batch(batch, row_group_size=row_group_size)
+        return
+
+    sorting = [pq.SortingColumn(schema.get_field_index(date_column))]
+    with pq.ParquetWriter(sink, schema, compression='zstd', sorting_columns=sorting) as writer:
+        # A month per write_table call, so no row group spans two months
+        for table in _by_month(batches, schema, date_column, spool_dir):
+            writer.write_table(table, row_group_size=row_group_size)
+
+
+def convert_csv(csv_path, parquet_path=None, row_group_size=ROW_GROUP_SIZE):
+    """Convert ``csv_path`` to Parquet in streaming batches and return the Parquet path."""
+    parquet_path = parquet_path or parquet_path_for(csv_path)
+
+    # Write to a temporary name and swap it in, so readers never see a half-written file;
+    # the name is per process, as the dashboard and API workers may convert at once
+    tmp_path = f'{parquet_path}.{os.getpid()}.tmp'
+    try:
+        _write_batches(open_csv(csv_path), tmp_path, row_group_size, os.path.dirname(os.path.abspath(parquet_path)))
+        os.replace(tmp_path, parquet_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return parquet_path
+
+
+def _from_frame(frame):
+    # Same column types as a batch read from the CSV: plain strings and date32 dates
+    batch = pa.RecordBatch.from_pandas(frame, preserve_index=False)
+    columns = []
+    for field, column in zip(batch.schema, batch.columns):
+        if pa.types.is_dictionary(field.type) or pa.types.is_large_string(field.type):
+            column = column.cast(pa.string())
+        elif field.name in DATE_COLUMNS:
+            column = column.cast(pa.date32())
+        columns.append(column)
+    return pa.RecordBatch.from_arrays(columns, names=batch.schema.names)
+
+
+def write_parquet(frames, sink, row_group_size=ROW_GROUP_SIZE):
+    """Write an iterable of DataFrames to ``sink`` (a path or writable file) in the storage schema
+    and date order :func:`convert_csv` produces."""
+    _write_batches((_from_frame(frame) for frame in frames), sink, row_group_size)
+
+
+def is_stale(csv_path, parquet_path):
+    return (not os.path.exists(parquet_path)
+            or os.path.getmtime(parquet_path) < os.path.getmtime(csv_path))
+
+
+def load_sales_data(csv_path, columns=None, layout=None):
+    """Load the dataset from its Parquet copy, converting the CSV first if needed.
+
+    Only ``columns`` are read when given. With ``layout`` (see
+    :data:`sales_schema.LAYOUTS`) they are named as in that layout whichever
+    layout the file has. Dictionary-encoded columns come back as pandas
+    categoricals and date columns as ``datetime64``.
+    """
+    parquet_path = parquet_path_for(csv_path)
+    if os.path.exists(csv_path) and is_stale(csv_path, parquet_path):
+        convert_csv(csv_path, parquet_path)
+
+    header = read_header(csv_path) if os.path.exists(csv_path) else pq.read_schema(parquet_path).names
+    source, names = source_columns(header, columns, layout)
+    table = pq.read_table(parquet_path, columns=names)
+    return to_layout(table, source, layout).to_pandas(date_as_object=False)
+
+
+def date_row_groups(parquet_path, date_range=None, date_column=None):
+    """Row groups of ``parquet_path`` that may hold dates in the inclusive ``date_range``.
+
+    Groups whose min/max statistics on ``date_column`` (default: the file's
+    date column) fall outside the range are left out; every group is kept
+    without a range, a date column or statistics.
+    """
+    metadata = pq.ParquetFile(parquet_path).metadata
+    schema = metadata.schema.to_arrow_schema()
+    date_column = date_column or _date_column(schema)
+    groups = list(range(metadata.num_row_groups))
+    if date_range is None or date_column not in schema.names:
+        return groups
+
+    position = schema.get_field_index(date_column)
+    start, end = (pd.Timestamp(d).date() for d in date_range)
+    kept = []
+    for group in groups:
+        statistics = metadata.row_group(group).column(position).statistics
+        if statistics is None or not statistics.has_min_max or (statistics.min <= end and statistics.max >= start):
+            kept.append(group)
+    return kept
+
+
+def date_bounds(dates, date_range):
+    """``(start, stop)`` positions of the inclusive ``date_range`` in ascending ``dates``, by binary search."""
+    dates = np.asarray(dates)
+    start, end = (pd.Timestamp(d).to_datetime64().astype(dates.dtype) for d in date_range)
+    return int(np.searchsorted(dates, start, 'left')), int(np.searchsorted(dates, end, 'right'))
+
+
+def concat_frames(frames):
+    """Concatenate frames with the same columns, keeping categoricals categorical.
+
+    ``pd.concat`` falls back to object columns when the categories differ;
+    here the categories are unioned instead. The result has a fresh RangeIndex.
+    """
+    columns = {}
+    for column in frames[0].columns:
+        parts = [frame[column] for frame in frames]
+        if isinstance(parts[0].dtype, pd.CategoricalDtype):
+            columns[column] = union_categoricals([part.astype('category') for part in parts])
+        else:
+            columns[column] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns)
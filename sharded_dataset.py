@@ -0,0 +1,358 @@
+"""The dataset as one shard per store, queried by fanning out to the selected shards.
+
+Each store's (or city's) sales live in their own file in a shard directory,
+named after the store: ``Dubai.parquet``, ``Abu Dhabi.parquet``, ... (a
+store's own CSV feed, in app.py's layout, works too). A query runs only on
+the shards picked in the Store filter. Each shard is filtered and reduced to
+an :class:`aggregation.PartialAggregate` in its own worker process, and the
+partials are merged, so the cost of a refresh grows with the stores selected
+rather than with the whole chain.
+
+Shards can also live on other hosts. ``python sharded_dataset.py serve``
+answers for the shards in its directory over a
+:mod:`multiprocessing.connection` socket, and a dashboard started with
+``LULU_SHARD_HOSTS=host:port,...`` routes each selected shard to whichever
+host has it. Shards in ``LULU_SHARD_DIR`` are always queried locally. What
+each host has (and its version) is asked at most once per
+``LULU_SHARD_TTL`` seconds, of all hosts at once. A host that cannot be
+reached, or that takes longer than ``LULU_SHARD_TIMEOUT`` seconds to connect
+or to answer, is logged and its shards are left out until the next check.
+Messages are pickled, so a server only accepts clients that share its
+``LULU_SHARD_AUTHKEY``; keep it on a private network.
+
+    python sharded_dataset.py split --data lulu_sales_data.csv --dir lulu_sales_shards
+    python sharded_dataset.py serve --dir /data/lulu_sales_shards --port 8503
+"""
+import argparse
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Connection, Listener, answer_challenge, deliver_challenge
+from urllib.parse import quote, unquote
+
+import pandas as pd
+
+from aggregation import PartialAggregate, distinct_values, filter_frame, head_rows, iter_chunks, stream_aggregate
+from parallel_agg import WORKERS, get_pool
+from sales_storage import load_sales_data, write_parquet
+
+logger = logging.getLogger(__name__)
+
+SHARD_DIR = os.environ.get('LULU_SHARD_DIR')
+SHARD_HOSTS = [host for host in os.environ.get('LULU_SHARD_HOSTS', '').split(',') if host]
+SHARD_COLUMN = 'Store'
+SHARD_SUFFIXES = ('.parquet', '.csv')
+DEFAULT_PORT = int(os.environ.get('LULU_SHARD_PORT', 8503))
+HOST_TTL = float(os.environ.get('LULU_SHARD_TTL', 5))
+HOST_TIMEOUT = float(os.environ.get('LULU_SHARD_TIMEOUT', 10))
+
+
+def _matching_rows(path, selections=None, columns=None):
+    chunks = [filter_frame(chunk, selections) for chunk in iter_chunks(path, columns)]
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
+
+
+# What a shard can be asked for, by name, locally or over the wire; each
+# takes the shard's path first
+TASKS = {
+    'aggregate': stream_aggregate,
+    'distinct_values': distinct_values,
+    'head_rows': head_rows,
+    'matching_rows': _matching_rows,
+}
+
+
+def shard_dir_for(csv_path):
+    return os.path.splitext(csv_path)[0] + '_shards'
+
+
+def shard_path(directory, name):
+    return os.path.join(directory, quote(str(name), safe=' ') + '.parquet')
+
+
+def list_shards(directory):
+    """``{shard name: path}`` of the shard files in ``directory``.
+
+    A CSV feed wins over a Parquet file of the same name, which is its copy.
+    """
+    shards = {}
+    if not directory or not os.path.isdir(directory):
+        return shards
+    for suffix in SHARD_SUFFIXES:
+        for file_name in sorted(os.listdir(directory)):
+            if file_name.endswith(suffix):
+                shards[unquote(file_name[:-len(suffix)])] = os.path.join(directory, file_name)
+    return shards
+
+
+def split_dataset(csv_path, directory, column=SHARD_COLUMN):
+    """Write ``csv_path`` (either layout) as one Parquet shard per ``column`` value, in app.py's layout."""
+    os.makedirs(directory, exist_ok=True)
+    df = load_sales_data(csv_path, layout='app')
+    paths = []
+    for name, frame in df.groupby(column, observed=True, sort=True):
+        path = shard_path(directory, name)
+        # Swapped in whole, so a dashboard never reads a half-written shard
+        write_parquet([frame], path + '.tmp')
+        os.replace(path + '.tmp', path)
+        paths.append(path)
+    logger.info("wrote %d rows as %d shards in %s", len(df), len(paths), directory)
+    return paths
+
+
+def _authkey():
+    authkey = os.environ.get('LULU_SHARD_AUTHKEY')
+    if not authkey:
+        raise ValueError("set LULU_SHARD_AUTHKEY to the same secret on the dashboard and every shard host")
+    return authkey.encode()
+
+
+def _address(host):
+    name, _, port = host.rpartition(':')
+    return name, int(port)
+
+
+def _socket_timeout(seconds):
+    if os.name == 'nt':
+        return struct.pack('L', int(seconds * 1000))
+    return struct.pack('ll', int(seconds), int(seconds % 1 * 1_000_000))
+
+
+def connect(host, timeout=HOST_TIMEOUT):
+    """An authenticated connection to the shard server at ``host`` (``"name:port"``).
+
+    Connecting, and every later read or write, fails with an ``OSError``
+    after ``timeout`` seconds, so a hung host cannot block the caller.
+    """
+    authkey = _authkey()
+    sock = socket.create_connection(_address(host), timeout=timeout)
+    # Connection reads the file descriptor directly: back to blocking mode,
+    # with the timeout enforced by the kernel instead
+    sock.setblocking(True)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, _socket_timeout(timeout))
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, _socket_timeout(timeout))
+    conn = Connection(sock.detach())
+    try:
+        # The handshake multiprocessing.connection.Client does
+        answer_challenge(conn, authkey)
+        deliver_challenge(conn, authkey)
+    except BaseException:
+        conn.close()
+        raise
+    return conn
+
+
+def call(host, method, *args, timeout=HOST_TIMEOUT):
+    """Call ``method`` of the shard server at ``host`` (``"name:port"``)."""
+    with connect(host, timeout) as conn:
+        conn.send((method, args))
+        status, value = conn.recv()
+    if status == 'error':
+        raise RuntimeError(f"shard host {host}: {value}")
+    return value
+
+
+class ShardedDataset:
+    """The shards in ``directory`` plus those served by ``hosts``, split on ``column``."""
+
+    def __init__(self, directory=None, column=SHARD_COLUMN, hosts=(), workers=WORKERS, ttl=HOST_TTL,
+                 timeout=HOST_TIMEOUT):
+        self.directory = directory
+        self.column = column
+        self.hosts = list(hosts)
+        self.workers = workers
+        self.ttl = ttl
+        self.timeout = timeout
+        self._described = None
+        self._described_at = 0.0
+        self._lock = threading.Lock()
+
+    def local_shards(self):
+        return list_shards(self.directory)
+
+    def _describe(self, host):
+        try:
+            return call(host, 'describe', timeout=self.timeout)
+        except Exception:
+            logger.warning("shard host %s is unavailable; leaving its shards out", host, exc_info=True)
+            # No shards, and a version that changes when the host is back
+            return [], None
+
+    def describe_hosts(self):
+        """``{host: (shard names, version)}``, asked of every host at once and kept for ``ttl`` seconds.
+
+        A host that fails to answer within ``timeout`` seconds has no shards until the next check.
+        """
+        if not self.hosts:
+            return {}
+        with self._lock:
+            # Callers arriving during a refresh wait for it rather than asking again
+            if self._described is None or time.monotonic() - self._described_at >= self.ttl:
+                with ThreadPoolExecutor(max_workers=max(1, len(self.hosts))) as threads:
+                    described = list(threads.map(self._describe, self.hosts))
+                self._described = dict(zip(self.hosts, described))
+                self._described_at = time.monotonic()
+            return self._described
+
+    def shards(self):
+        """``{shard name: path or host}``; local shards take precedence over remote ones."""
+        shards = dict(self.local_shards())
+        for host, (names, _) in self.describe_hosts().items():
+            for name in names:
+                shards.setdefault(name, host)
+        return shards
+
+    def version(self):
+        """Changes whenever a shard is added, removed or rewritten, here or on a host."""
+        version = []
+        for name, path in self.local_shards().items():
+            stat = os.stat(path)
+            version.append((name, stat.st_size, stat.st_mtime_ns))
+        for host, (_, host_version) in self.describe_hosts().items():
+            version.append((host, host_version))
+        return tuple(version)
+
+    def run_local(self, task, paths, *args):
+        """``TASKS[task]`` on each of ``paths``, one shard per worker process; results in order."""
+        fn = TASKS[task]
+        if self.workers <= 1 or len(paths) <= 1:
+            return [fn(path, *args) for path in paths]
+        futures = [get_pool(self.workers).submit(fn, path, *args) for path in paths]
+        return [future.result() for future in futures]
+
+    def run(self, task, names, *args):
+        """``TASKS[task]`` on each of the shards ``names``, wherever they are; results in order."""
+        shards = self.shards()
+        results = {}
+        by_host = {}
+        for name in names:
+            if shards[name] in self.hosts:
+                by_host.setdefault(shards[name], []).append(name)
+        local = [name for name in names if shards[name] not in self.hosts]
+
+        with ThreadPoolExecutor(max_workers=max(1, len(by_host))) as threads:
+            # Remote hosts work on their shards while the local pool works on ours
+            remote = {host: threads.submit(call, host, 'run', task, host_names, *args, timeout=self.timeout)
+                      for host, host_names in by_host.items()}
+            results.update(zip(local, self.run_local(task, [shards[name] for name in local], *args)))
+            for host, future in remote.items():
+                results.update(zip(by_host[host], future.result()))
+        return [results[name] for name in names]
+
+    def route(self, selections=None):
+        """``(shard names, remaining selections)`` of a ``{column: values}`` filter.
+
+        Every row of a selected shard matches the shard column, so only the
+        other columns are left to filter on.
+        """
+        selections = dict(selections or {})
+        shards = sorted(self.shards())
+        if self.column not in selections:
+            return shards, selections
+        wanted = {str(value) for value in selections.pop(self.column)}
+        return [name for name in shards if name in wanted], selections
+
+    def aggregate(self, measures, group_by=(), selections=None, date_column=None, date_range=None):
+        """:class:`PartialAggregate` of the rows matching ``selections``, from the selected shards only."""
+        names, selections = self.route(selections)
+        result = PartialAggregate(measures, group_by)
+        for partial in self.run('aggregate', names, measures, group_by, selections, date_column, date_range):
+            result = result.merge(partial)
+        return result
+
+    def distinct_values(self, columns):
+        """Distinct values of each of ``columns`` across the shards; the shard column's are the shard names."""
+        names = sorted(self.shards())
+        others = [column for column in columns if column != self.column]
+        seen = {column: {} for column in others}
+        for values in self.run('distinct_values', names, others):
+            for column in others:
+                seen[column].update(dict.fromkeys(values[column]))
+        return {column: names if column == self.column else list(seen[column]) for column in columns}
+
+    def head_rows(self, selections=None, limit=1000, columns=None):
+        """The first ``limit`` rows matching ``selections``, taken shard by shard in name order."""
+        names, selections = self.route(selections)
+        parts = self.run('head_rows', names, selections, limit, columns)
+        return pd.concat(parts, ignore_index=True).head(limit) if parts else pd.DataFrame(columns=columns)
+
+    def iter_matching(self, selections=None, columns=None):
+        """Every row matching ``selections`` as one DataFrame per selected shard."""
+        names, selections = self.route(selections)
+        for name in names:
+            yield self.run('matching_rows', [name], selections, columns)[0]
+
+
+def _handle(shards, conn):
+    with conn:
+        while True:
+            try:
+                method, args = conn.recv()
+            except EOFError:
+                return
+            try:
+                if method == 'describe':
+                    value = (list(shards.local_shards()), shards.version())
+                elif method == 'run':
+                    task, names, *task_args = args
+                    local = shards.local_shards()
+                    value = shards.run_local(task, [local[name] for name in names], *task_args)
+                else:
+                    raise ValueError(f"unknown method {method!r}")
+                conn.send(('ok', value))
+            except Exception as exc:
+                logger.exception("shard request %s failed", method)
+                conn.send(('error', repr(exc)))
+
+
+def serve(directory, host='127.0.0.1', port=DEFAULT_PORT, workers=WORKERS):
+    """Answer shard requests for the shards in ``directory`` until interrupted, one thread per client."""
+    shards = ShardedDataset(directory, workers=workers)
+    with Listener((host, port), authkey=_authkey()) as listener:
+        logger.info("serving %d shards from %s on %s:%d", len(shards.local_shards()), directory, host, port)
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, OSError):
+                # A client with another key, or one that hung up during the handshake
+                logger.warning("rejected a shard client", exc_info=True)
+                continue
+            threading.Thread(target=_handle, args=(shards, conn), daemon=True).start()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Split the sales dataset into per-store shards, or serve shards.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    split = commands.add_parser('split', help="write one Parquet shard per store")
+    split.add_argument('--data', default='lulu_sales_data.csv', help="sales CSV to split (default: %(default)s)")
+    split.add_argument('--dir', help="shard directory (default: next to the CSV, <name>_shards)")
+    split.add_argument('--column', default=SHARD_COLUMN,
+                       help="column to shard on, in app.py's layout; City in the package layout is Store (default: %(default)s)")
+    serve_ = commands.add_parser('serve', help="answer queries for the shards in a directory")
+    serve_.add_argument('--dir', default=SHARD_DIR or 'lulu_sales_shards', help="shard directory (default: %(default)s)")
+    serve_.add_argument('--host', default='127.0.0.1', help="address to listen on (default: %(default)s)")
+    serve_.add_argument('--port', type=int, default=DEFAULT_PORT, help="port to listen on (default: %(default)s)")
+    serve_.add_argument('--workers', type=int, default=WORKERS,
+                        help="processes working on shards in parallel (default: %(default)s)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    if args.command == 'split':
+        split_dataset(args.data, args.dir or shard_dir_for(args.data), args.column)
+        return
+    try:
+        serve(args.dir, args.host, args.port, args.workers)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
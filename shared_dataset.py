@@ -0,0 +1,173 @@
+"""One copy of the dataset shared by every dashboard server process on a host.
+
+Behind a load balancer each Streamlit process would otherwise parse and hold
+its own copy of the rows. Instead, one publisher process loads the dataset
+and writes it as an uncompressed Arrow IPC file (a "generation") into a
+directory, ideally on a RAM-backed filesystem such as ``/dev/shm``. Dashboard
+processes started with ``LULU_SHARED_DIR`` memory-map the current generation
+read-only and wrap its buffers in zero-copy NumPy arrays, so the page cache
+holds the rows once however many workers there are.
+
+New data is published as a new generation file, and then the ``CURRENT``
+pointer file is replaced atomically. Workers watch the pointer through
+:class:`dataset_cache.DatasetCache` (its size/mtime signature changes on every
+swap) and map the new generation on their next rerun, while sessions still
+reading the old one keep their mapping. The publisher keeps the last
+``KEEP_GENERATIONS`` files; on POSIX an unlinked file stays readable for as
+long as a worker has it mapped.
+
+Dictionary-encoded columns are stored as plain integer codes (the categories
+in the field metadata) so that they map straight onto pandas categoricals;
+each worker still builds its own (much smaller) filter index and cube.
+
+    python shared_dataset.py --data lulu_sales_data.csv --dir /dev/shm/lulu_sales --layout app
+"""
+import argparse
+import json
+import logging
+import os
+import time
+
+import pandas as pd
+import pyarrow as pa
+
+from sales_schema import LAYOUTS
+from sales_storage import load_sales_data
+
+logger = logging.getLogger(__name__)
+
+SHARED_DIR = os.environ.get('LULU_SHARED_DIR')
+POINTER = 'CURRENT'
+KEEP_GENERATIONS = 2
+DEFAULT_POLL_INTERVAL = float(os.environ.get('LULU_PUBLISH_INTERVAL', 5))
+
+_CATEGORIES = b'lulu.categories'
+
+
+def current_path(directory=SHARED_DIR):
+    """The pointer file naming the current generation in ``directory``."""
+    return os.path.join(directory, POINTER)
+
+
+def _generation(directory):
+    try:
+        with open(current_path(directory)) as f:
+            return int(f.read().strip().split('-')[1].split('.')[0])
+    except FileNotFoundError:
+        return 0
+
+
+def _to_arrow(df):
+    arrays, fields = [], []
+    for column in df.columns:
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # The codes pandas uses itself (int8 for small categories, -1 for missing)
+            array = pa.array(values.cat.codes.to_numpy())
+            metadata = {_CATEGORIES: json.dumps(values.cat.categories.tolist())}
+        else:
+            array = pa.Array.from_pandas(values)
+            metadata = None
+        if pa.types.is_large_string(array.type):
+            array = array.cast(pa.string())
+        arrays.append(array)
+        fields.append(pa.field(column, array.type, metadata=metadata))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+def publish(df, directory):
+    """Write ``df`` as the next generation in ``directory`` and make it current; returns its path."""
+    os.makedirs(directory, exist_ok=True)
+    generation = _generation(directory) + 1
+    name = f'gen-{generation:06d}.arrow'
+    path = os.path.join(directory, name)
+
+    table = _to_arrow(df)
+    tmp_path = path + '.tmp'
+    # One record batch, so every column is a single contiguous buffer in the file
+    with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table, max_chunksize=max(len(table), 1))
+    os.replace(tmp_path, path)
+
+    pointer = current_path(directory)
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(name)
+    os.replace(pointer + '.tmp', pointer)
+
+    generations = sorted(n for n in os.listdir(directory) if n.startswith('gen-') and n.endswith('.arrow'))
+    for old in generations[:-KEEP_GENERATIONS]:
+        os.remove(os.path.join(directory, old))
+    logger.info("published %d rows as %s", len(df), path)
+    return path
+
+
+def _column(field, array):
+    chunk = array.chunk(0) if array.num_chunks == 1 else array.combine_chunks()
+    if field.metadata and _CATEGORIES in field.metadata:
+        categories = json.loads(field.metadata[_CATEGORIES])
+        return pd.Categorical.from_codes(chunk.to_numpy(), categories=categories, validate=False)
+    if pa.types.is_string(field.type):
+        # Arrow-backed strings (pandas' default string dtype) wrap the mapped buffers too
+        return chunk.to_pandas().array
+    if chunk.null_count == 0:
+        return chunk.to_numpy(zero_copy_only=not pa.types.is_boolean(field.type))
+    return chunk.to_pandas()
+
+
+def attach(pointer, columns=None):
+    """The current generation named by ``pointer`` as a read-only DataFrame over the mapped file.
+
+    Only ``columns`` are wrapped when given.
+    """
+    with open(pointer) as f:
+        path = os.path.join(os.path.dirname(pointer), f.read().strip())
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    if columns is not None:
+        missing = sorted(set(columns) - set(table.column_names))
+        if missing:
+            raise ValueError(f"{path} has no column {', '.join(missing)}")
+        table = table.select(columns)
+    return pd.DataFrame({field.name: _column(field, table.column(field.name)) for field in table.schema}, copy=False)
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def serve(csv_path, directory, columns=None, layout=None, interval=DEFAULT_POLL_INTERVAL):
+    """Publish ``csv_path`` now and again whenever it changes, polling every ``interval`` seconds."""
+    signature = None
+    while True:
+        if _signature(csv_path) != signature:
+            signature = _signature(csv_path)
+            publish(load_sales_data(csv_path, columns=columns, layout=layout), directory)
+        if interval <= 0:
+            return
+        time.sleep(interval)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Publish the sales dataset for the dashboard workers to share.")
+    parser.add_argument('--data', default='lulu_sales_data.csv', help="sales CSV to publish (default: %(default)s)")
+    parser.add_argument('--dir', default=SHARED_DIR or '/dev/shm/lulu_sales',
+                        help="directory the workers' LULU_SHARED_DIR points at (default: %(default)s)")
+    parser.add_argument('--layout', choices=LAYOUTS,
+                        help="publish the columns named as in this layout (default: the file's own)")
+    parser.add_argument('--columns', nargs='+', help="only publish these columns")
+    parser.add_argument('--interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help="seconds between checks for a changed CSV; 0 publishes once (default: %(default)s)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    try:
+        serve(args.data, args.dir, args.columns, args.layout, args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
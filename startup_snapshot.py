@@ -0,0 +1,96 @@
+"""First-paint snapshot of a dashboard, kept next to its dataset.
+
+A freshly started dashboard process (say, one scaled out under load) would
+otherwise load the dataset and compute every KPI and figure before it shows
+anything. Instead, the filter options, KPI values and figures (as Plotly
+JSON) of the default filter state are saved in ``<dataset>.snapshot.json``
+by the first process that computes them. The file is stamped with the
+dataset file's size and mtime. Later processes paint the default view
+straight from it and load the dataset only once a filter changes; a snapshot
+of an older version of the file is ignored.
+
+A snapshot made to travel (complete_zip_creator.py writes one into the
+package) also carries a digest of the file's contents. Unpacking gives the
+file a new mtime, so when only the mtime differs, the digest is checked
+instead and the snapshot is stamped with the new size and mtime.
+
+Set ``LULU_FAST_STARTUP=0`` to always compute from the dataset.
+"""
+import hashlib
+import json
+import os
+
+FAST_STARTUP = os.environ.get('LULU_FAST_STARTUP', '1').lower() not in ('', '0', 'false', 'no')
+
+SNAPSHOT_SUFFIX = '.snapshot.json'
+DIGEST_BLOCK_BYTES = 1 << 20
+
+
+def snapshot_path_for(path):
+    return os.path.splitext(path)[0] + SNAPSHOT_SUFFIX
+
+
+def file_signature(path):
+    """What a snapshot of ``path`` is stamped with; take it before loading the file."""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def file_digest(path):
+    """BLAKE2b digest of the contents of ``path``, as hex."""
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        while block := f.read(DIGEST_BLOCK_BYTES):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load(path):
+    try:
+        with open(snapshot_path_for(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(path, snapshot):
+    target = snapshot_path_for(path)
+    tmp_path = f'{target}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, target)
+    except OSError:
+        # A read-only data directory only costs the next process its fast start
+        pass
+
+
+def read_snapshot(path, signature):
+    """The snapshot of ``path`` if it was taken of the file with ``signature``, else ``None``."""
+    snapshot = _load(path)
+    if snapshot is None:
+        return None
+    if snapshot.get('signature') == signature:
+        return snapshot
+    # Same size, another mtime: the same contents if the digest says so
+    stamped = snapshot.get('signature') or [None]
+    if snapshot.get('digest') and stamped[0] == signature[0] and snapshot['digest'] == file_digest(path):
+        snapshot['signature'] = signature
+        _write(path, snapshot)
+        return snapshot
+    return None
+
+
+def update_snapshot(path, signature, **parts):
+    """Add ``parts`` to the snapshot of ``path`` (dict parts are merged) and write it atomically.
+
+    A snapshot of another ``signature`` is replaced rather than merged into.
+    """
+    snapshot = read_snapshot(path, signature) or {'signature': signature}
+    for name, value in parts.items():
+        if isinstance(value, dict) and isinstance(snapshot.get(name), dict):
+            value = {**snapshot[name], **value}
+        snapshot[name] = value
+
+    _write(path, snapshot)
+    return snapshot
@@ -0,0 +1,106 @@
+"""Server-side paging, sorting and export for the "Filtered Sales Data" table.
+
+The filtered rows are only ever handled as an array of row positions (from
+:class:`filter_index.FilterIndex`). Sorting ranks just those positions and
+partially sorts up to the requested page, and only the rows of that page
+are turned into a frame for the browser. Exports write the selected rows to
+a file chunk by chunk, so no full copy of the selection is held in memory.
+The table may be a DataFrame or a :class:`compact_table.CompactTable`.
+"""
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+PAGE_SIZES = (25, 50, 100, 500)
+EXPORT_CHUNK_ROWS = 250_000
+
+
+def sort_key(series, positions):
+    """Numeric keys ordering ``series`` at ``positions`` (NaN/missing sort last)."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Rank the (few) categories once instead of comparing labels per row
+        ranks = np.argsort(np.argsort(np.asarray(series.cat.categories, dtype=object))).astype('float64')
+        codes = series.cat.codes.to_numpy()[positions]
+        return np.where(codes >= 0, ranks[codes], np.nan)
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        values = series.to_numpy()[positions]
+        return np.where(np.isnat(values), np.nan, values.astype('int64').astype('float64'))
+    if pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+        return series.to_numpy(dtype='float64', na_value=np.nan)[positions]
+    codes, _ = pd.factorize(series.iloc[positions], sort=True)
+    return np.where(codes >= 0, codes, np.nan).astype('float64')
+
+
+def page_positions(df, positions, page, page_size, sort_by=None, ascending=True):
+    """Row positions shown on ``page`` (0-based) when ``positions`` are sorted by ``sort_by``.
+
+    Only the rows up to the end of the page are fully sorted; ties are broken
+    by row position so pages never overlap.
+    """
+    start, stop = page * page_size, min((page + 1) * page_size, len(positions))
+    if start >= stop:
+        return positions[:0]
+    if sort_by is None:
+        return positions[start:stop]
+
+    if isinstance(df, pd.DataFrame):
+        keys = sort_key(df[sort_by], positions)
+    else:
+        keys = df.sort_key(sort_by, positions)
+    if not ascending:
+        keys = -keys
+    candidates = np.arange(len(keys))
+    if stop < len(keys):
+        kth = np.partition(keys, stop - 1)[stop - 1]
+        if not np.isnan(kth):
+            candidates = np.flatnonzero(keys <= kth)
+    order = candidates[np.lexsort((positions[candidates], keys[candidates]))]
+    return positions[order[start:stop]]
+
+
+def take_rows(df, positions, columns=None):
+    """The rows at ``positions`` (only ``columns``, when given) as a DataFrame."""
+    if not isinstance(df, pd.DataFrame):
+        return df.take(positions, columns)
+    if columns is None:
+        return df.iloc[positions]
+    column_positions = df.columns.get_indexer(columns)
+    if (column_positions < 0).any():
+        raise KeyError(f"columns not in the table: {[c for c, i in zip(columns, column_positions) if i < 0]}")
+    # Rows and columns in one take, so only the selected cells are copied
+    return df.iloc[positions, column_positions]
+
+
+def iter_rows(df, positions, columns=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield the rows at ``positions`` as frames of at most ``chunk_rows`` rows."""
+    for start in range(0, len(positions), chunk_rows):
+        yield take_rows(df, positions[start:start + chunk_rows], columns)
+
+
+def write_export(chunks, fmt='csv', directory=None):
+    """Write an iterable of frames to a temporary CSV or Parquet file and return its path."""
+    fd, path = tempfile.mkstemp(suffix=f'.{fmt}', prefix='lulu_export_', dir=directory)
+    os.close(fd)
+
+    if fmt == 'csv':
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            for i, chunk in enumerate(chunks):
+                chunk.to_csv(f, header=(i == 0), index=False)
+    elif fmt == 'parquet':
+        writer = None
+        try:
+            for chunk in chunks:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema, compression='zstd')
+                writer.write_table(table.cast(writer.schema))
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        raise ValueError(f"unknown export format {fmt!r}")
+    return path
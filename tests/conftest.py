@@ -0,0 +1,29 @@
+import datetime
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from complete_zip_creator import generate_sales_chunks
+
+
+def sales_frame(rows, seed=7):
+    """``rows`` generated sales in the package layout, read back the way the template reads them."""
+    chunks = generate_sales_chunks(rows, 1000, seed, datetime.date(2025, 6, 30))
+    return pd.concat(chunks, ignore_index=True)
+
+
+@pytest.fixture(scope='session')
+def sales():
+    return sales_frame(6000)
+
+
+@pytest.fixture
+def sales_csv(sales, tmp_path):
+    """The ``sales`` rows as a package-layout CSV, written the way the builder writes it."""
+    path = tmp_path / 'lulu_sales_data.csv'
+    sales.to_csv(path, index=False, date_format='%Y-%m-%d')
+    return str(path)
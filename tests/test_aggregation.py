@@ -0,0 +1,95 @@
+import pandas as pd
+import pytest
+
+import sales_query
+from aggregation import distinct_values, head_rows, iter_chunks, stream_aggregate
+from parallel_agg import parallel_aggregate
+from sales_storage import convert_csv
+
+# app.py's names for the package layout's columns
+APP_NAMES = {'Transaction_ID': 'TransactionID', 'Transaction_Date': 'Date', 'City': 'Store',
+             'Product_Category': 'Category', 'Age_Group': 'AgeGroup', 'Final_Amount': 'SalesAmount',
+             'Is_Loyalty_Member': 'LoyaltyMember', 'Monthly_Ad_Budget': 'AdvertisementSpend'}
+SELECTIONS = {'Store': ['Dubai', 'Sharjah'], 'LoyaltyMember': ['Yes']}
+DATES = ('2025-02-01', '2025-04-30')
+
+
+@pytest.fixture
+def app_rows(sales):
+    """The package-layout rows as app.py names them."""
+    rows = sales.rename(columns=APP_NAMES)
+    return rows.assign(LoyaltyMember=rows['LoyaltyMember'].map({True: 'Yes', False: 'No'}))
+
+
+@pytest.fixture(params=['csv', 'parquet'])
+def source(request, sales_csv, app_rows):
+    """The CSV read in blocks, or its up-to-date Parquet copy read by row group, and its rows in file order."""
+    if request.param == 'parquet':
+        convert_csv(sales_csv, row_group_size=500)
+        # The copy is stored in date order
+        return sales_csv, app_rows.sort_values('Date', kind='stable')
+    return sales_csv, app_rows
+
+
+def matching(rows, selections=SELECTIONS, date_range=DATES):
+    mask = pd.Series(True, index=rows.index)
+    for column, values in selections.items():
+        mask &= rows[column].isin(values)
+    if date_range is not None:
+        mask &= rows['Date'].between(*(pd.Timestamp(d) for d in date_range))
+    return rows[mask]
+
+
+def test_chunks_in_app_layout(source):
+    source, app_rows = source
+    chunks = list(iter_chunks(source, ['TransactionID', 'Store', 'LoyaltyMember'], chunk_rows=1000, layout='app'))
+    # Parquet batches stop at row group (month) boundaries
+    assert all(len(chunk) <= 1000 for chunk in chunks)
+    frame = pd.concat(chunks, ignore_index=True)
+    assert sorted(frame['TransactionID']) == sorted(app_rows['TransactionID'])
+    assert set(frame['LoyaltyMember']) == {'Yes', 'No'}
+
+
+def test_stream_aggregate_in_app_layout(source):
+    source, app_rows = source
+    partial = stream_aggregate(source, ['SalesAmount'], ['Category'], SELECTIONS, 'Date', DATES,
+                               chunk_rows=1000, layout='app')
+    rows = matching(app_rows)
+    assert partial.count() == len(rows)
+    assert partial.sum('SalesAmount') == pytest.approx(rows['SalesAmount'].sum(), rel=1e-5)
+    expected = rows.groupby('Category', observed=True)['SalesAmount'].sum()
+    rollup = partial.rollup('Category', 'SalesAmount')
+    assert set(rollup.index) == set(expected.index)
+    for category, total in expected.items():
+        assert rollup[category] == pytest.approx(total, rel=1e-5)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_parallel_aggregate_in_app_layout(sales_csv, app_rows, workers):
+    convert_csv(sales_csv, row_group_size=500)
+    partial = parallel_aggregate(sales_csv, ['SalesAmount'], ['Store'], SELECTIONS, 'Date', DATES,
+                                 workers=workers, layout='app')
+    rows = matching(app_rows)
+    assert partial.count() == len(rows)
+    assert partial.sum('SalesAmount') == pytest.approx(rows['SalesAmount'].sum(), rel=1e-5)
+    assert dict(partial.rollup('Store', stat='count')) == dict(rows['Store'].value_counts()[['Dubai', 'Sharjah']])
+
+
+def test_distinct_values_and_head_rows_in_app_layout(source):
+    source, app_rows = source
+    values = distinct_values(source, ['Store', 'LoyaltyMember'], chunk_rows=1000, layout='app')
+    assert set(values['Store']) == set(app_rows['Store']) and set(values['LoyaltyMember']) == {'Yes', 'No'}
+    head = head_rows(source, SELECTIONS, limit=25, columns=['TransactionID', 'Store', 'LoyaltyMember'],
+                     chunk_rows=1000, layout='app')
+    expected = matching(app_rows, date_range=None).head(25)
+    assert list(head['TransactionID']) == list(expected['TransactionID'])
+
+
+def test_streamed_package_file_in_the_app(sales_csv, app_rows, monkeypatch):
+    monkeypatch.setattr(sales_query, 'should_stream', lambda path: True)
+    summary = sales_query.query_summary({'Store': ['Dubai']}, path=sales_csv)
+    rows = matching(app_rows, {'Store': ['Dubai']}, None)
+    assert summary['transactions'] == len(rows)
+    assert summary['total_sales'] == pytest.approx(rows['SalesAmount'].sum(), rel=1e-5)
+    snapshot = sales_query.open_sales(sales_csv)
+    assert snapshot.streaming and set(snapshot.options['Store']) == set(app_rows['Store'])
@@ -0,0 +1,143 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from approximate import HyperLogLog, SalesSketch, TDigest, refine_in_background
+from result_cache import ResultCache
+
+STRATA = ['City', 'Product_Category']
+PARTIAL = {'City': ['Dubai', 'Sharjah', 'Ajman'], 'Gender': ['Female']}
+DATES = (pd.Timestamp('2025-02-01'), pd.Timestamp('2025-04-30'))
+
+
+def sketch(df, seed, sample_size=40):
+    return SalesSketch(df, STRATA, 'Final_Amount', 'Customer_ID', columns=['Gender'],
+                       date_column='Transaction_Date', sample_size=sample_size, seed=seed)
+
+
+def matching(df, selections, date_range=None):
+    mask = pd.Series(True, index=df.index)
+    for column, values in selections.items():
+        mask &= df[column].isin(values)
+    if date_range is not None:
+        mask &= df['Transaction_Date'].between(*date_range)
+    return df[mask]
+
+
+def rank(values, estimate):
+    return np.mean(np.asarray(values) <= estimate)
+
+
+def test_hyperloglog_within_its_error():
+    ids = pd.Series([f'C{i:06d}' for i in range(60000)])
+    first, second = HyperLogLog(), HyperLogLog()
+    first.add(ids[:40000])
+    second.add(ids[25000:])
+    assert abs(first.estimate() - 40000) <= 3 * first.relative_error * 40000
+    union = first.merge(second)
+    assert abs(union.estimate() - 60000) <= 3 * union.relative_error * 60000
+
+
+def test_hyperloglog_small_counts():
+    hll = HyperLogLog()
+    hll.add(pd.Series(np.arange(100)).repeat(5))
+    assert abs(hll.estimate() - 100) <= 2
+
+
+@pytest.mark.parametrize('q', [0.01, 0.25, 0.5, 0.9, 0.99])
+def test_tdigest_quantiles_close_to_numpy(q):
+    values = np.random.default_rng(5).lognormal(4, 1, 50000)
+    digest = TDigest()
+    for chunk in np.array_split(values, 7):
+        part = TDigest()
+        part.update(chunk)
+        digest = digest.merge(part)
+    assert digest.count == len(values)
+    assert digest.sum() == pytest.approx(values.sum())
+    assert abs(rank(values, digest.quantile(q)) - q) <= 0.005
+    assert digest.quantile(0) == values.min() and digest.quantile(1) == values.max()
+
+
+def test_partial_selection_within_stated_error(sales):
+    rows = matching(sales, PARTIAL, DATES)
+    truth = {'transactions': len(rows), 'total': rows['Final_Amount'].sum(), 'average': rows['Final_Amount'].mean()}
+    covered = {name: 0 for name in truth}
+    seeds = range(40)
+    for seed in seeds:
+        summary = sketch(sales, seed).summary(PARTIAL, DATES)
+        assert summary['customers'] is None
+        for name, value in truth.items():
+            estimate = summary[name]
+            assert estimate.error > 0
+            # A 95% interval: never far outside, and holding the truth most of the time
+            assert abs(estimate.value - value) <= 2 * estimate.error
+            covered[name] += abs(estimate.value - value) <= estimate.error
+    for name in truth:
+        assert covered[name] >= 0.8 * len(seeds), name
+
+
+def test_rollup_within_stated_error(sales):
+    rows = matching(sales, {'Gender': ['Male']})
+    truth = rows.groupby('Product_Category', observed=True)['Final_Amount'].sum()
+    rollup = sketch(sales, 11).rollup('Product_Category', {'Gender': ['Male']})
+    assert set(rollup.index) == set(truth.index)
+    errors = (rollup['value'] - truth.loc[rollup.index]).abs()
+    assert (errors <= 2 * rollup['error']).all()
+
+
+def test_whole_strata_are_exact(sales):
+    selections = {'City': ['Dubai', 'Abu Dhabi'], 'Product_Category': ['Electronics']}
+    rows = matching(sales, selections)
+    summary = sketch(sales, 3).summary(selections)
+    assert summary['transactions'] == (len(rows), 0.0)
+    assert summary['total'].value == pytest.approx(rows['Final_Amount'].sum())
+    assert summary['average'].value == pytest.approx(rows['Final_Amount'].mean())
+    customers = summary['customers']
+    assert abs(customers.value - rows['Customer_ID'].nunique()) <= max(customers.error, 1)
+    assert abs(rank(rows['Final_Amount'], summary['median'].value) - 0.5) <= 0.01
+
+
+def test_merged_sketches_match_one_sketch(sales):
+    half = len(sales) // 2
+    merged = sketch(sales.iloc[:half], 1, sample_size=10 ** 6).add(sales.iloc[half:])
+    selections = {'City': ['Ajman']}
+    summary = merged.summary(selections)
+    rows = matching(sales, selections)
+    assert summary['transactions'].value == len(rows)
+    assert summary['total'].value == pytest.approx(rows['Final_Amount'].sum())
+    # Sampled whole, so even a partial selection is exact
+    partial = merged.summary(PARTIAL, DATES)
+    assert partial['total'] == (pytest.approx(matching(sales, PARTIAL, DATES)['Final_Amount'].sum()), 0.0)
+
+
+def test_exact_matches_pandas(sales):
+    exact = sketch(sales, 0).exact(sales, PARTIAL, DATES)
+    rows = matching(sales, PARTIAL, DATES)
+    assert exact['transactions'].value == len(rows)
+    assert exact['total'].value == pytest.approx(rows['Final_Amount'].sum())
+    assert exact['customers'].value == rows['Customer_ID'].nunique()
+    assert exact['median'].value == pytest.approx(rows['Final_Amount'].median())
+
+
+def test_failed_refinement_is_retried():
+    cache, calls, release = ResultCache(), [], threading.Event()
+
+    def compute():
+        calls.append(None)
+        if len(calls) == 1:
+            release.wait(10)
+            raise RuntimeError("exact query failed")
+        return 42
+
+    failed = refine_in_background(cache, 'sales:exact', 1, 'key', compute)
+    assert refine_in_background(cache, 'sales:exact', 1, 'key', compute) is failed
+    release.set()
+    with pytest.raises(RuntimeError):
+        failed.result(timeout=10)
+    retried = refine_in_background(cache, 'sales:exact', 1, 'key', compute)
+    assert retried is not failed and retried.result(timeout=10) == 42
+    # A finished refinement is shared
+    assert refine_in_background(cache, 'sales:exact', 1, 'key', compute) is retried
+    assert len(calls) == 2
@@ -0,0 +1,76 @@
+import io
+import os
+import tarfile
+import zipfile
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from archive_writer import BLOCK_BYTES, open_archive
+
+
+@pytest.fixture
+def members(sales, tmp_path):
+    """``{arcname: bytes}`` of a package-like set of members, one spanning several compression blocks."""
+    csv = sales.to_csv(index=False).encode()
+    parquet = tmp_path / 'source.parquet'
+    sales.to_parquet(parquet)
+    return {
+        'app.py': b'import streamlit as st\n',
+        'data/lulu_sales_data.csv': csv * (2 * BLOCK_BYTES // len(csv) + 1),
+        'data/sales.parquet': parquet.read_bytes(),
+        'empty.txt': b'',
+        'café/notes.md': 'naïve'.encode(),
+    }
+
+
+def write_archive(path, fmt, members, tmp_path):
+    with open_archive(str(path), fmt, threads=4) as archive:
+        for name, data in members.items():
+            if name.endswith('.parquet'):
+                source = tmp_path / os.path.basename(name)
+                source.write_bytes(data)
+                archive.add_file(str(source), name)
+            else:
+                with archive.open(name) as member:
+                    member.write(data)
+    return archive
+
+
+def test_zip_round_trip(members, tmp_path):
+    path = tmp_path / 'package.zip'
+    archive = write_archive(path, 'zip', members, tmp_path)
+    with zipfile.ZipFile(path) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == list(members)
+        for name, data in members.items():
+            assert zf.read(name) == data
+        infos = {info.filename: info for info in zf.infolist()}
+        assert infos['data/sales.parquet'].compress_type == zipfile.ZIP_STORED
+        assert infos['app.py'].compress_type == zipfile.ZIP_DEFLATED
+        csv = infos['data/lulu_sales_data.csv']
+        assert csv.compress_size < csv.file_size
+        pd.testing.assert_frame_equal(pd.read_parquet(io.BytesIO(zf.read('data/sales.parquet'))),
+                                      pd.read_parquet(tmp_path / 'source.parquet'))
+    assert [(m['name'], m['bytes']) for m in archive.members] == [(n, len(d)) for n, d in members.items()]
+
+
+def test_tar_zst_round_trip(members, tmp_path):
+    path = tmp_path / 'package.tar.zst'
+    archive = write_archive(path, 'tar.zst', members, tmp_path)
+    with pa.input_stream(str(path), compression='zstd') as stream:
+        tar_bytes = stream.read()
+    assert len(tar_bytes) % tarfile.RECORDSIZE == 0
+    with tarfile.open(fileobj=io.BytesIO(tar_bytes)) as tf:
+        assert tf.getnames() == list(members)
+        for name, data in members.items():
+            assert tf.extractfile(name).read() == data
+        frame = pd.read_parquet(io.BytesIO(tf.extractfile('data/sales.parquet').read()))
+    pd.testing.assert_frame_equal(frame, pd.read_parquet(tmp_path / 'source.parquet'))
+    assert sum(m['compressed_bytes'] for m in archive.members) < os.path.getsize(path)
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        open_archive(str(tmp_path / 'package.rar'), 'rar')
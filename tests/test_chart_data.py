@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from chart_data import lttb, time_series
+
+
+@pytest.fixture
+def daily(sales):
+    return sales.groupby(sales['Transaction_Date'].dt.floor('D'))['Final_Amount'].sum().asfreq('D', fill_value=0)
+
+
+@pytest.mark.parametrize('threshold', [3, 4, 50, 499])
+def test_lttb_keeps_ends_and_point_count(threshold):
+    rng = np.random.default_rng(3)
+    y = rng.normal(size=1000).cumsum()
+    keep = lttb(np.arange(1000), y, threshold)
+    assert len(keep) == threshold
+    assert keep[0] == 0 and keep[-1] == 999
+    assert (np.diff(keep) > 0).all()
+
+
+def test_lttb_keeps_the_peak():
+    y = np.zeros(1000)
+    y[437] = 100.0
+    assert 437 in lttb(np.arange(1000), y, 20)
+
+
+@pytest.mark.parametrize('threshold', [10, 11])
+def test_lttb_short_series_unchanged(threshold):
+    assert np.array_equal(lttb(np.arange(10), np.arange(10.0), threshold), np.arange(10))
+
+
+@pytest.mark.parametrize('threshold', [-1, 0, 1, 2])
+def test_lttb_tiny_threshold_keeps_only_the_ends(threshold):
+    assert np.array_equal(lttb(np.arange(1000), np.arange(1000.0), threshold), [0, 999])
+    assert np.array_equal(lttb(np.arange(1), np.arange(1.0), threshold), [0])
+
+
+def test_time_series_respects_tiny_budget(daily):
+    reduced, _ = time_series(daily, 'Day', max_points=2)
+    assert list(reduced.index) == [daily.index[0], daily.index[-1]]
+
+
+def test_time_series_resamples_like_pandas(daily):
+    reduced, granularity = time_series(daily, 'Auto', max_points=20)
+    assert granularity == 'Week'
+    weekly = daily.resample('W').sum()
+    assert len(reduced) == 20
+    assert reduced.index[0] == weekly.index[0] and reduced.index[-1] == weekly.index[-1]
+    pd.testing.assert_series_equal(reduced, weekly.loc[reduced.index])
+
+
+def test_time_series_under_budget_keeps_every_day(daily):
+    reduced, granularity = time_series(daily, 'Day', max_points=len(daily))
+    assert granularity == 'Day'
+    pd.testing.assert_series_equal(reduced, daily)
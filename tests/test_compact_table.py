@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import parallel_agg
+from compact_table import CompactTable
+from data_cube import SalesCube
+
+DIMENSIONS = ['City', 'Gender', 'Is_Loyalty_Member', 'Transaction_Date']
+MEASURES = ['Final_Amount', 'Discount']
+
+
+@pytest.fixture(scope='module')
+def table(sales):
+    return CompactTable.from_frame(sales)
+
+
+def sorted_cells(cube):
+    cells = cube.cells.astype({d: str for d in DIMENSIONS if d != 'Transaction_Date'})
+    return cells.sort_values(DIMENSIONS, ignore_index=True)
+
+
+def test_take_matches_pandas(sales, table):
+    assert table.encoding('Gender') == 'bits' and table.encoding('Transaction_ID') != 'arrow strings'
+    pd.testing.assert_frame_equal(table.to_frame(), sales, check_dtype=False, check_categorical=False)
+
+
+@pytest.mark.parametrize('start, stop', [(0, 6000), (3, 4001), (8, 16), (5995, 6100), (100, 100)])
+def test_row_range_matches_take(sales, table, start, stop):
+    rows = table[['Transaction_ID', 'City', 'Gender', 'Transaction_Date', 'Final_Amount', 'Quantity']]
+    part = rows.row_range(start, stop)
+    assert len(part) == len(sales.iloc[start:stop]) and part.columns == rows.columns
+    pd.testing.assert_frame_equal(part.to_frame(), rows.take(np.arange(start, min(stop, len(sales)))))
+
+
+def test_single_valued_flag_sorts(sales):
+    table = CompactTable.from_frame(sales.assign(Gender='Female').astype({'Gender': 'category'}))
+    assert table.encoding('Gender') == 'bits'
+    assert (table.sort_key('Gender', np.arange(10)) == 0).all()
+
+
+def test_parallel_cube_of_compact_table(sales, table, monkeypatch):
+    monkeypatch.setattr(parallel_agg, 'PARALLEL_MIN_ROWS', 0)
+    cube = parallel_agg.parallel_cube(table, DIMENSIONS, MEASURES, 'Transaction_Date', workers=3)
+    expected = SalesCube(sales, DIMENSIONS, MEASURES, 'Transaction_Date')
+    pd.testing.assert_frame_equal(sorted_cells(cube), sorted_cells(expected), check_dtype=False,
+                                  check_categorical=False, rtol=1e-9)
+    dubai = sales[sales['City'] == 'Dubai']
+    view = cube.filter({'City': ['Dubai']})
+    assert view.count() == len(dubai)
+    assert view.sum('Final_Amount') == pytest.approx(dubai['Final_Amount'].sum())
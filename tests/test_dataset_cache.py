@@ -0,0 +1,47 @@
+import numpy as np
+
+from approximate import SalesSketch
+from data_cube import SalesCube
+from dataset_cache import DatasetCache, estimate_nbytes
+from derived_metrics import Metric, MetricSet, rows, total
+from filter_index import FilterIndex
+
+FILTERS = ['City', 'Gender']
+
+
+def dashboard_data(df):
+    cube = SalesCube(df, ['City', 'Gender', 'Transaction_Date'], ['Final_Amount'], 'Transaction_Date')
+    derived = MetricSet(df, {'revenue': Metric(total('Final_Amount')), 'average': Metric(total('Final_Amount'), rows())},
+                        FILTERS, 'Transaction_Date')
+    sketch = SalesSketch(df, ['City'], 'Final_Amount', 'Customer_ID', sample_size=100, seed=0)
+    return df, cube, derived, sketch
+
+
+def test_estimate_counts_what_the_entry_holds(sales):
+    df, cube, derived, sketch = data = dashboard_data(sales)
+    frame_bytes = int(df.memory_usage(index=True, deep=True).sum())
+    parts = [cube.nbytes, derived.nbytes, sketch.nbytes]
+    assert all(part > 0 for part in parts)
+    assert estimate_nbytes(data) == frame_bytes + sum(parts)
+
+    index = FilterIndex(sales, FILTERS)
+    assert index.nbytes >= len(FILTERS) * len(sales) // 8
+    # A metric set holds its float32 sum (a plain count needs none), int32 days and filter bitmaps
+    assert derived.nbytes >= len(sales) * (4 + 4) + index.nbytes
+    assert estimate_nbytes({'index': index, 'codes': np.zeros(10, dtype=np.int32), 'name': 'sales'}) == index.nbytes + 40
+
+
+def test_budget_evicts_by_everything_held(sales, sales_csv, tmp_path):
+    other_csv = tmp_path / 'other.csv'
+    other_csv.write_bytes(open(sales_csv, 'rb').read())
+    frame_bytes = int(sales.memory_usage(index=True, deep=True).sum())
+    # Room for both frames, but not for both frames with their cubes, metric sets and sketches
+    cache = DatasetCache(max_bytes=2 * frame_bytes + estimate_nbytes(dashboard_data(sales)[1:]))
+    cache.register('sales', sales_csv, lambda path: dashboard_data(sales))
+    cache.register('other', str(other_csv), lambda path: dashboard_data(sales))
+    cache.get('sales')
+    cache.get('other')
+    assert cache.nbytes() <= cache.max_bytes
+    assert cache.misses == 2
+    cache.get('sales')
+    assert cache.misses == 3
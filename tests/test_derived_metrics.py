@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from derived_metrics import Metric, MetricSet, distinct, per_group, rows, total
+
+METRICS = {
+    'revenue': Metric(total('Final_Amount')),
+    'transactions': Metric(rows()),
+    'average': Metric(total('Final_Amount'), rows()),
+    'loyalty_pct': Metric(rows(where='Is_Loyalty_Member'), rows(), scale=100),
+    'discount_rate': Metric(total('Discount'), total('Final_Amount', 'Discount'), scale=100),
+    'points_redeemed_pct': Metric(total('Loyalty_Points_Redeemed'), total('Loyalty_Points_Earned'), scale=100),
+    'revenue_per_customer': Metric(total('Final_Amount'), distinct('Customer_ID')),
+    'ad_budget': Metric(per_group('Monthly_Ad_Budget', 'Product_Category')),
+    'roi': Metric(total('Final_Amount'), per_group('Monthly_Ad_Budget', 'Product_Category')),
+}
+FILTERS = ['City', 'Gender', 'Loyalty_Tier']
+BY = ['Product_Category', 'Nationality']
+
+CASES = [
+    ({}, None),
+    ({'City': ['Dubai', 'Sharjah']}, None),
+    ({'Gender': ['Female'], 'Loyalty_Tier': ['Gold', 'Silver']}, ('2025-03-01', '2025-05-15')),
+    ({}, ('2025-06-30', '2025-06-30')),
+    ({'City': ['Nowhere']}, None),
+]
+
+
+def reference(rows_):
+    """The metrics computed with plain pandas over ``rows_``."""
+    amounts = rows_['Final_Amount'].sum()
+    budget = rows_.groupby('Product_Category', observed=True)['Monthly_Ad_Budget'].first().sum()
+
+    def ratio(numerator, denominator):
+        return numerator / denominator if denominator else 0.0
+
+    return {
+        'revenue': amounts,
+        'transactions': len(rows_),
+        'average': ratio(amounts, len(rows_)),
+        'loyalty_pct': 100 * ratio(rows_['Is_Loyalty_Member'].sum(), len(rows_)),
+        'discount_rate': 100 * ratio(rows_['Discount'].sum(), amounts + rows_['Discount'].sum()),
+        'points_redeemed_pct': 100 * ratio(rows_['Loyalty_Points_Redeemed'].sum(), rows_['Loyalty_Points_Earned'].sum()),
+        'revenue_per_customer': ratio(amounts, rows_['Customer_ID'].nunique()),
+        'ad_budget': budget,
+        'roi': ratio(amounts, budget),
+    }
+
+
+def matching(df, selections, date_range):
+    mask = pd.Series(True, index=df.index)
+    for column, values in selections.items():
+        mask &= df[column].isin(values)
+    if date_range is not None:
+        mask &= df['Transaction_Date'].between(*(pd.Timestamp(d) for d in date_range))
+    return df[mask]
+
+
+def assert_matches(result, expected):
+    # The summed columns are held in float32
+    for name, value in expected.items():
+        assert result[name] == pytest.approx(value, rel=1e-5, abs=1e-6), name
+
+
+def metric_set(df):
+    return MetricSet(df, METRICS, FILTERS, 'Transaction_Date', BY)
+
+
+@pytest.fixture(params=['unordered', 'date_ordered'])
+def frame(request, sales):
+    if request.param == 'date_ordered':
+        return sales.sort_values('Transaction_Date', kind='stable', ignore_index=True)
+    return sales
+
+
+@pytest.mark.parametrize('selections, date_range', CASES)
+def test_overall_matches_pandas(frame, selections, date_range):
+    result = metric_set(frame).evaluate(selections, date_range)
+    assert_matches(result, reference(matching(frame, selections, date_range)))
+
+
+@pytest.mark.parametrize('by', BY)
+@pytest.mark.parametrize('selections, date_range', CASES)
+def test_by_matches_pandas_groupby(frame, by, selections, date_range):
+    result = metric_set(frame).evaluate(selections, date_range, by=by)
+    groups = matching(frame, selections, date_range).groupby(by, observed=True)
+    expected = pd.DataFrame({label: reference(group) for label, group in groups}).T
+    assert sorted(result.index) == sorted(expected.index)
+    for label, values in expected.iterrows():
+        assert_matches(result.loc[label], values)
+
+
+def test_positions_match_pandas(frame):
+    selections, date_range = CASES[2]
+    positions = metric_set(frame).positions(selections, date_range)
+    expected = np.flatnonzero(frame.index.isin(matching(frame, selections, date_range).index))
+    assert np.array_equal(positions, expected)
+
+
+@pytest.mark.parametrize('cuts', [[3000], [7, 500, 501, 4000]])
+def test_add_matches_a_rebuild(frame, cuts):
+    bounds = [0, *cuts, len(frame)]
+    metrics = metric_set(frame.iloc[:bounds[1]])
+    for start, stop in zip(bounds[1:], bounds[2:]):
+        metrics = metrics.add(frame.iloc[start:stop])
+    rebuilt = metric_set(frame)
+    assert metrics.size == len(frame)
+    for selections, date_range in CASES:
+        assert_matches(metrics.evaluate(selections, date_range), rebuilt.evaluate(selections, date_range))
+        by_category = metrics.evaluate(selections, date_range, by='Product_Category')
+        expected = rebuilt.evaluate(selections, date_range, by='Product_Category')
+        pd.testing.assert_frame_equal(by_category.sort_index(), expected.sort_index(), rtol=1e-5)
+
+
+def test_add_with_new_groups(sales):
+    df = sales.astype({'Product_Category': object, 'Customer_ID': object})
+    df.loc[df.index[4000:], 'Product_Category'] = 'Garden'
+    df.loc[df.index[4000:], 'Monthly_Ad_Budget'] = 1234
+    df.loc[df.index[4500:], 'Customer_ID'] = 'NEW-CUSTOMER'
+    older = metric_set(df.iloc[:4000])
+    newer = older.add(df.iloc[4000:])
+    assert_matches(newer.evaluate(), reference(df))
+    assert_matches(newer.evaluate({'City': ['Dubai']}), reference(matching(df, {'City': ['Dubai']}, None)))
+    # The older set still answers for its own rows only
+    assert_matches(older.evaluate(), reference(df.iloc[:4000]))
+    assert 'Garden' not in older.evaluate(by='Product_Category').index
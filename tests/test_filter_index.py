@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from filter_index import FilterIndex
+
+COLUMNS = ['City', 'Product_Category', 'Gender']
+
+SELECTIONS = [
+    {},
+    {'City': ['Dubai']},
+    {'City': ['Dubai', 'Sharjah'], 'Gender': ['Female']},
+    {'Product_Category': ['Electronics', 'Groceries'], 'City': ['Abu Dhabi', 'Ajman', 'Nowhere']},
+    {'City': []},
+]
+
+
+def expected_positions(df, selections, columns=COLUMNS):
+    mask = pd.Series(True, index=df.index)
+    for column, selected in selections.items():
+        # A selection covering every value does not restrict
+        if not set(selected).issuperset(df[column].unique()):
+            mask &= df[column].isin(selected)
+    return np.flatnonzero(mask.to_numpy())
+
+
+@pytest.mark.parametrize('selections', SELECTIONS)
+def test_positions_match_isin(sales, selections):
+    index = FilterIndex(sales, COLUMNS)
+    assert np.array_equal(index.positions(selections), expected_positions(sales, selections))
+    assert index.count(selections) == len(expected_positions(sales, selections))
+
+
+@pytest.mark.parametrize('cuts', [[3000], [1, 2, 9, 17, 2500], [999, 1000, 1001, 4096]])
+def test_append_matches_a_rebuild(sales, cuts):
+    bounds = [0, *cuts, len(sales)]
+    index = FilterIndex(sales.iloc[:bounds[1]], COLUMNS)
+    for start, stop in zip(bounds[1:], bounds[2:]):
+        index = index.append(sales.iloc[start:stop])
+    assert index.size == len(sales)
+    for selections in SELECTIONS:
+        assert np.array_equal(index.positions(selections), expected_positions(sales, selections))
+
+
+def test_append_adds_new_values(sales):
+    df = sales.astype({'City': object})
+    df.loc[:499, 'City'] = 'Dubai'
+    df.loc[df.index[500::7], 'City'] = 'Al Ain'
+
+    index = FilterIndex(df.iloc[:500], ['City']).append(df.iloc[500:])
+    assert index.values('City') == list(pd.unique(df['City']))
+    for city in ['Dubai', 'Al Ain', 'Sharjah']:
+        assert np.array_equal(index.positions({'City': [city]}), np.flatnonzero(df['City'] == city))
+
+
+def test_older_index_still_answers_for_its_rows(sales):
+    older = FilterIndex(sales.iloc[:2001], COLUMNS)
+    older.append(sales.iloc[2001:])
+    selections = {'City': ['Dubai']}
+    assert np.array_equal(older.positions(selections), expected_positions(sales.iloc[:2001], selections))
@@ -0,0 +1,102 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from filter_index import FilterIndex
+from incremental import IncrementalDataset, RowBuffer
+
+COLUMNS = ['Transaction_ID', 'Transaction_Date', 'City', 'Final_Amount']
+
+
+def write_csv(frame, path, mode='w'):
+    frame.to_csv(path, mode=mode, header=(mode == 'w'), index=False, date_format='%Y-%m-%d')
+
+
+class Extend:
+    """``extend`` callback that fails while ``failing`` is set."""
+
+    def __init__(self):
+        self.failing = False
+
+    def __call__(self, data, delta, df):
+        if self.failing:
+            raise RuntimeError("extend failed")
+        _, index = data
+        return df, index.append(delta)
+
+
+def build(df):
+    return df, FilterIndex(df, ['City'])
+
+
+@pytest.fixture
+def dataset(sales, tmp_path):
+    csv_path = str(tmp_path / 'lulu_sales_data.csv')
+    write_csv(sales.iloc[:3000], csv_path)
+    os.makedirs(tmp_path / 'lulu_sales_data_partitions')
+    return IncrementalDataset(csv_path, COLUMNS, build, Extend(), layout='package')
+
+
+def ingested(dataset):
+    df, index = dataset.snapshot()
+    assert len(df) == dataset.rows and index.size == dataset.rows
+    return df
+
+
+def assert_rows(dataset, expected):
+    df = ingested(dataset)
+    assert sorted(df['Transaction_ID']) == sorted(expected['Transaction_ID'])
+    assert df['Final_Amount'].sum() == pytest.approx(expected['Final_Amount'].sum(), rel=1e-6)
+    dubai = np.flatnonzero(df['City'] == 'Dubai')
+    assert np.array_equal(dataset.snapshot()[1].positions({'City': ['Dubai']}), dubai)
+
+
+def test_row_buffer_matches_concat(sales):
+    frame = sales[COLUMNS]
+    buffer = RowBuffer(frame.iloc[:10])
+    first = buffer.frame()
+    for start, stop in [(10, 11), (11, 500), (500, 6000)]:
+        buffer.append(frame.iloc[start:stop])
+    pd.testing.assert_frame_equal(buffer.frame(), frame, check_dtype=False, check_categorical=False)
+    pd.testing.assert_frame_equal(first, frame.iloc[:10], check_dtype=False, check_categorical=False)
+
+
+def test_appends_and_partitions(dataset, sales):
+    write_csv(sales.iloc[3000:3500], dataset.csv_path, mode='a')
+    write_csv(sales.iloc[3500:4000], os.path.join(dataset.partition_dir, '2025-07-01.csv'))
+    sales.iloc[4000:4200].to_parquet(os.path.join(dataset.partition_dir, '2025-07-02.parquet'))
+    assert dataset.refresh() == 1200
+    assert dataset.refresh() == 0
+    assert_rows(dataset, sales.iloc[:4200])
+
+
+def test_unreadable_partition_is_retried(dataset, sales):
+    write_csv(sales.iloc[3000:3040], dataset.csv_path, mode='a')
+    write_csv(sales.iloc[3040:3060], os.path.join(dataset.partition_dir, '2025-07-01.csv'))
+    # A Parquet partition still being copied in
+    bad = os.path.join(dataset.partition_dir, '2025-07-02.parquet')
+    with open(bad, 'wb') as f:
+        f.write(b'PAR1 half')
+    assert dataset.refresh() == 60
+    assert_rows(dataset, sales.iloc[:3060])
+
+    sales.iloc[3060:3080].to_parquet(bad)
+    assert dataset.refresh() == 20
+    assert_rows(dataset, sales.iloc[:3080])
+
+
+def test_failed_extend_loses_nothing(dataset, sales):
+    write_csv(sales.iloc[3000:3040], dataset.csv_path, mode='a')
+    write_csv(sales.iloc[3040:3080], os.path.join(dataset.partition_dir, '2025-07-01.csv'))
+    dataset.extend.failing = True
+    with pytest.raises(RuntimeError):
+        dataset.refresh()
+    assert_rows(dataset, sales.iloc[:3000])
+
+    dataset.extend.failing = False
+    write_csv(sales.iloc[3080:3100], dataset.csv_path, mode='a')
+    assert dataset.refresh() == 100
+    assert_rows(dataset, pd.concat([sales.iloc[:3000], sales.iloc[3000:3040], sales.iloc[3080:3100],
+                                    sales.iloc[3040:3080]]))
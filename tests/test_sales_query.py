@@ -0,0 +1,25 @@
+import pytest
+
+from sales_query import selection_key
+
+OPTIONS = {'Store': ['Dubai', 'Sharjah', 'Ajman'], 'Category': ['Electronics', 'Groceries'],
+           'AgeGroup': ['18-25'], 'Gender': ['Male', 'Female'], 'LoyaltyMember': ['Yes', 'No']}
+
+
+def test_equivalent_selections_share_a_key():
+    key = selection_key({'Store': ['Sharjah', 'Dubai', 'Dubai']}, OPTIONS)
+    assert key == (('Store', ('Dubai', 'Sharjah')),)
+    assert selection_key({'Store': ('Dubai', 'Sharjah'), 'Category': ['Groceries', 'Electronics']}, OPTIONS) == key
+    assert selection_key({'Store': []}, OPTIONS) == (('Store', ()),)
+    assert selection_key(None, OPTIONS) == ()
+
+
+@pytest.mark.parametrize('value', ['Dubai', 7, None, {'Dubai': True}])
+def test_scalar_selection_is_rejected(value):
+    with pytest.raises(ValueError, match='Store'):
+        selection_key({'Store': value}, OPTIONS)
+
+
+def test_unknown_column_is_rejected():
+    with pytest.raises(ValueError, match='Region'):
+        selection_key({'Region': ['Gulf']}, OPTIONS)
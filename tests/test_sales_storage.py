@@ -0,0 +1,38 @@
+import os
+
+import pandas as pd
+import pytest
+
+from sales_storage import convert_csv, load_sales_data, parquet_path_for
+
+
+def test_convert_csv_round_trips(sales, sales_csv):
+    parquet_path = convert_csv(sales_csv)
+    assert parquet_path == parquet_path_for(sales_csv)
+    df = load_sales_data(sales_csv)
+    assert len(df) == len(sales)
+    # Amounts are stored as float32
+    daily = sales.groupby('Transaction_Date')['Final_Amount'].sum()
+    pd.testing.assert_series_equal(df.groupby('Transaction_Date')['Final_Amount'].sum(), daily,
+                                   check_dtype=False, check_index_type=False, rtol=1e-5)
+
+
+def test_convert_csv_leaves_other_conversions_alone(sales_csv):
+    parquet_path = parquet_path_for(sales_csv)
+    # A conversion of the same file running in another process
+    other = parquet_path + '.0.tmp'
+    with open(other, 'wb') as f:
+        f.write(b'half written')
+    convert_csv(sales_csv)
+    with open(other, 'rb') as f:
+        assert f.read() == b'half written'
+    leftovers = [name for name in os.listdir(os.path.dirname(sales_csv)) if name.endswith('.tmp')]
+    assert leftovers == [os.path.basename(other)]
+
+
+def test_failed_conversion_removes_its_temporary_file(tmp_path):
+    csv_path = tmp_path / 'broken.csv'
+    csv_path.write_text('Transaction_ID,Final_Amount\nT1,12.5\nT2,not a number,3\n')
+    with pytest.raises(Exception):
+        convert_csv(str(csv_path))
+    assert os.listdir(tmp_path) == ['broken.csv']
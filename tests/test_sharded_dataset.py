@@ -0,0 +1,59 @@
+import socket
+import time
+
+import pytest
+
+from sales_storage import load_sales_data
+from sharded_dataset import ShardedDataset, call, split_dataset
+
+
+@pytest.fixture
+def shard_dir(sales_csv, tmp_path):
+    directory = tmp_path / 'shards'
+    split_dataset(sales_csv, str(directory))
+    return str(directory)
+
+
+@pytest.fixture
+def closed_host():
+    """A host with nothing listening: connections are refused."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f'127.0.0.1:{port}'
+
+
+@pytest.fixture
+def silent_host():
+    """A host that accepts connections and never answers."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        sock.listen()
+        yield f'127.0.0.1:{sock.getsockname()[1]}'
+
+
+@pytest.fixture(autouse=True)
+def authkey(monkeypatch):
+    monkeypatch.setenv('LULU_SHARD_AUTHKEY', 'secret')
+
+
+def test_call_times_out_on_a_silent_host(silent_host):
+    started = time.monotonic()
+    with pytest.raises(OSError):
+        call(silent_host, 'describe', timeout=0.3)
+    assert time.monotonic() - started < 5
+
+
+def test_unavailable_hosts_leave_out_only_their_shards(sales_csv, shard_dir, closed_host, silent_host):
+    local = ShardedDataset(shard_dir, workers=1)
+    shards = ShardedDataset(shard_dir, hosts=[closed_host, silent_host], workers=1, timeout=0.3)
+    started = time.monotonic()
+    assert shards.shards() == local.shards()
+    assert time.monotonic() - started < 5
+    assert shards.version() == local.version() + ((closed_host, None), (silent_host, None))
+
+    df = load_sales_data(sales_csv, layout='app')
+    result = shards.aggregate(['SalesAmount'], selections={'Store': ['Dubai', 'Ajman']})
+    expected = df[df['Store'].isin(['Dubai', 'Ajman'])]
+    assert result.count() == len(expected)
+    assert result.sum('SalesAmount') == pytest.approx(expected['SalesAmount'].sum())